@@ -0,0 +1,39 @@
+# Gunicorn configuration: `gunicorn -c gunicorn.conf.py`
+import gc
+import multiprocessing
+import os
+
+# Load Django (and the face models, see users.apps.UsersConfig.ready) once in
+# the master so forked workers share the model pages copy-on-write instead of
+# each loading and warming them on their first face request.
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "password_manager.settings")
+os.environ.setdefault("FACE_MODELS_WARMUP", "1")
+
+wsgi_app = "password_manager.wsgi:application"
+preload_app = True
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+timeout = 60
+
+
+def pre_fork(server, worker):
+    # Move everything loaded so far into the permanent generation so the
+    # garbage collector does not touch (and thereby copy) the shared pages.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from users import face_models
+
+    server.log.info(
+        "Worker %s forked with face models %s",
+        worker.pid,
+        "ready" if face_models.is_ready() else "not loaded",
+    )
+
+
+def worker_exit(server, worker):
+    # Write buffered audit events before the worker goes away.
+    from users import audit
+
+    audit.flush()
@@ -38,6 +38,8 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "users.middleware.MemoryBudgetMiddleware",
+    "users.middleware.ProfilingMiddleware",  # Keep last: it calls profiled views itself
 ]
 
 # ✅ Root URL Configuration
@@ -95,6 +97,12 @@ STATIC_URL = "/assets/"
 # IMAGE UPLOAD DIR
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
+# Protected media transfer: None streams from Python (mmap), "x-sendfile" or
+# "x-accel-redirect" hands the file to Apache/lighttpd or nginx
+MEDIA_SENDFILE = {
+    "BACKEND": os.getenv("MEDIA_SENDFILE_BACKEND") or None,
+    "ACCEL_PREFIX": "/protected-media/",  # nginx `internal` location for MEDIA_ROOT
+}
 
 
 # ✅ Default Primary Key Type
@@ -103,7 +111,7 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # ✅ Django REST Framework & JWT Authentication
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.revocation.RevocableJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly"
@@ -111,6 +119,136 @@ REST_FRAMEWORK = {
 }
 
 
+# ✅ Cache (token buckets for admission control live here; point this at a
+# shared backend such as Redis so every worker sees the same budgets)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# ✅ Admission Control for CPU-heavy endpoints
+ADMISSION_CONTROL = {
+    "CACHE": "default",  # Cache alias holding the token buckets
+    "FACE_CONCURRENCY": 2,  # Max face pipeline runs in flight per process
+    "FACE_QUEUE_TIMEOUT": 2.0,  # Seconds to wait for a slot before shedding
+    "FACE_RETRY_AFTER": 5,  # Retry-After (seconds) sent when shedding
+    "SCOPES": {  # Token bucket rates per endpoint ("<burst>/<period>")
+        "login": {"user": "5/min", "ip": "20/min"},
+        "image_upload": {"user": "5/min", "ip": "10/min"},
+        "verify_face_id": {"user": "10/min", "ip": "30/min"},
+    },
+}
+
+
+# ✅ Vault Encryption (32 url-safe base64 bytes; falls back to a key derived
+# from SECRET_KEY, which is only acceptable for local development)
+VAULT_MASTER_KEY = os.getenv("VAULT_MASTER_KEY", "")
+VAULT_KEY_CACHE = {
+    "MAX_SIZE": 1024,  # Unwrapped per-user data keys kept in memory
+    "TTL": 300,  # Seconds before a cached data key must be unwrapped again
+}
+
+
+# ✅ Offline Breach Index (built with `manage.py build_breach_index`; leave
+# empty to disable breach checks)
+BREACH_INDEX_PATH = os.getenv("BREACH_INDEX_PATH", "")
+
+
+# ✅ Vault Health Report
+VAULT_HEALTH = {
+    "WEAK_BITS": 50,  # Entries with less estimated entropy are reported as weak
+    "STALE_DAYS": 180,  # Entries not updated for this long are reported as stale
+}
+
+
+# ✅ Batch Password API
+PASSWORD_BATCH_MAX_SIZE = 500  # Max operations accepted in one batch request
+
+
+# ✅ Step-Up Tokens (issued after OTP / Face ID verification for vault reads)
+STEP_UP_TOKEN_LIFETIME = 300  # Seconds
+
+
+# ✅ Bulk User Provisioning (admin upload endpoint)
+PROVISIONING_HASH_WORKERS = 4  # Threads hashing passwords per upload
+
+
+# ✅ Audit Log (events are buffered in-process and written in batches)
+AUDIT_LOG = {
+    "BUFFER_SIZE": 200,  # Flush once this many events are buffered
+    "FLUSH_INTERVAL": 5.0,  # Seconds; 0 disables the background writer
+    "MAX_PENDING": 10000,  # Drop events beyond this while the DB is unreachable
+    "PAGE_SIZE": 500,  # Max events returned by /api/users/audit-log/
+}
+
+
+# ✅ Face Matching (max distance accepted as the same person; the face_recognition
+# default is 0.6). Run `manage.py calibrate_face_tolerance <labelled dir>` to
+# measure false accept/reject rates on your own population and pick a value.
+FACE_MATCH_TOLERANCE = float(os.getenv("FACE_MATCH_TOLERANCE", "0.4"))
+
+
+# ✅ Burst Face Verification (several frames per verify-face-id request)
+FACE_BURST = {
+    "MAX_FRAMES": 5,  # Frames accepted in one request
+    "MAX_CANDIDATES": 3,  # Best-ranked frames that may be encoded
+    "WORKERS": 2,  # Frames encoded concurrently
+}
+
+
+# ✅ Face Probe Cache (decisions for resent frames, replay flags; see users/probes.py)
+FACE_PROBE_CACHE = {
+    "CACHE": "default",  # Use a shared cache (Redis/Memcached) with several workers
+    "TTL": 30,  # Seconds an identical probe gets the cached decision
+    "REPLAY_WINDOW": 600,  # Seconds accepted frames are remembered
+    "REPLAY_DISTANCE": 4,  # Max differing bits of 64 for a near-duplicate frame
+    "REPLAY_HISTORY": 20,  # Accepted frames remembered per user
+    "REJECT_REPLAYS": False,  # Only flag (audit + metric) by default
+}
+
+
+# ✅ Memory Profiling (per-endpoint RSS / tracemalloc stats, see users/middleware.py)
+MEMORY_PROFILING = {
+    "ENABLED": True,  # Record RSS deltas per endpoint (cheap: one /proc read)
+    "TRACE": os.getenv("MEMORY_TRACE", "") == "1",  # tracemalloc peaks; slows allocation-heavy code
+    "SNAPSHOT_RATE": float(os.getenv("MEMORY_SNAPSHOT_RATE", "0")),  # Share of traced requests with top allocation sites
+    "SNAPSHOT_TOP": 10,
+    "RSS_LIMIT_MB": int(os.getenv("MEMORY_RSS_LIMIT_MB", "0")) or None,  # Worker RSS ceiling for "reject" budgets
+    "RETRY_AFTER": 5,
+    "BUDGETS": {
+        "image_upload": {"peak_mb": 150, "action": "reject"},
+        "verify_face_id": {"peak_mb": 200, "action": "reject"},
+        "verify_otp": {"peak_mb": 50, "action": "log"},
+        "list_passwords": {"peak_mb": 50, "action": "log"},
+    },
+}
+
+# ✅ Request Profiling (on-demand sampling profiles via X-Profile, see users/profiling.py)
+PROFILING = {
+    "ENABLED": os.getenv("PROFILING_ENABLED", "") == "1",  # Off: middleware removed, zero overhead
+    "TOKENS": [t for t in os.getenv("PROFILING_TOKENS", "").split(",") if t],  # X-Profile values allowed without a staff token
+    "INTERVAL": 0.001,  # Seconds between stack samples
+    "MAX_PROFILES": 50,  # Newest profiles kept on disk
+    "MODULES": ("users.views",),  # Only views from these modules are profiled
+    "DIRECTORY": os.getenv("PROFILING_DIR"),  # Shared by the host's workers; default: <tmp>/password_manager_profiles
+}
+
+
+# ✅ Async Face Enrollment (POST /api/users/image-upload/?async=1)
+ENROLLMENT = {
+    "WORKERS": 1,  # Background threads per process; 0 leaves jobs to `process_enrollment_jobs`
+    "MAX_WAIT": 20,  # Longest long-poll on the job status endpoint, in seconds
+    "POLL_INTERVAL": 1.0,  # How often a long-poll re-reads jobs run by other processes
+    "STALE_AFTER": 300,  # Seconds before a job stuck in processing is requeued
+}
+
+
+# ✅ Face Model Warmup (load dlib models and run a dummy inference at startup;
+# enabled by gunicorn.conf.py so only server processes pay for it)
+FACE_MODELS_WARMUP = os.getenv("FACE_MODELS_WARMUP", "") == "1"
+
+
 # ✅ Add this in settings.py
 CORS_ALLOW_CREDENTIALS = True  # Allow cookies & auth headers
 CORS_ALLOW_ALL_ORIGINS = False  # Disable unrestricted access
@@ -135,6 +273,14 @@ CORS_ALLOW_HEADERS = [  # Allow these headers
     "Accept",
     "Origin",
     "X-Requested-With",
+    "X-Step-Up-Token",
+    "X-Profile",
+]
+
+CORS_EXPOSE_HEADERS = [  # Let the frontend read these response headers
+    "X-Step-Up-Token",
+    "X-Step-Up-Expires-In",
+    "X-Profile-Id",
 ]
 
 from datetime import timedelta
@@ -146,8 +292,37 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(
         days=7
     ),  # Optional: Set refresh token expiration time (default is 7 days)
-    "ROTATE_REFRESH_TOKENS": False,  # Optional: Configure whether to rotate refresh tokens
-    "BLACKLIST_AFTER_ROTATION": True,  # Optional: Configure whether to blacklist the refresh token after rotation
+    "ROTATE_REFRESH_TOKENS": True,  # Every refresh returns a new refresh token
+    "BLACKLIST_AFTER_ROTATION": True,  # ...and revokes the one that was presented
+    "TOKEN_REFRESH_SERIALIZER": "users.revocation.RevocableTokenRefreshSerializer",
+}
+
+# ✅ Dashboard Bootstrap (cached vault / face ID summary, see users/bootstrap.py)
+BOOTSTRAP = {
+    "CACHE": "default",
+    "TTL": 300,  # Seconds; vault and face ID changes invalidate sooner
+}
+
+# ✅ Idempotency Keys (replay stored responses to retried requests, see users/idempotency.py)
+IDEMPOTENCY = {
+    "TTL": 24 * 3600,  # Seconds a response is kept for replays
+    "MAX_WAIT": 10,  # Seconds a duplicate waits for the in-flight original
+    "POLL_INTERVAL": 0.5,  # Seconds between checks for originals in other workers
+    "LOCK_TIMEOUT": 120,  # Seconds before an unfinished original is taken over
+}
+
+# ✅ Token Revocation (logout; revoked ids are cached in each worker, see users/revocation.py)
+TOKEN_REVOCATION = {
+    "SYNC_INTERVAL": 5,  # Seconds before a worker sees revocations made by another
+    "FULL_SYNC_INTERVAL": 3600,  # Seconds between rebuilds that drop expired ids
+    "SYNC_OVERLAP": 60,  # Seconds re-read by incremental syncs
+}
+
+# ✅ Password History (earlier versions of vault entries, see users/history.py)
+PASSWORD_HISTORY = {
+    "MAX_VERSIONS": 20,  # Versions kept per entry; 0 keeps all
+    "MAX_AGE_DAYS": 365,  # Versions archived longer ago are pruned; 0 keeps all
+    "PRUNE_BATCH_SIZE": 1000,  # Rows deleted per statement by prune_password_history
 }
 
 
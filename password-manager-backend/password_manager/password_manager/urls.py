@@ -15,8 +15,6 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
-from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 from users.views import api_root  # Import the api_root view
@@ -31,8 +29,10 @@ urlpatterns = [
     path("api/users/", include("users.urls")),
     # Home route (for your non-API view)
     path("", views.home, name="home"),
+    # Readiness probe for load balancers / orchestrators
+    path("readyz/", views.readyz, name="readyz"),
     path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
 ]
 
-
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Media files (face images) are not served publicly; owners download them
+# through the authenticated /api/users/media/ view.
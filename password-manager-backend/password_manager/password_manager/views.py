@@ -1,6 +1,20 @@
 # password_manager/views.py
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
+
+from users import face_models
 
 
 def home(request):
     return HttpResponse("Welcome to the Password Manager!")
+
+
+def readyz(request):
+    """Readiness probe: ready once the face models have run a dummy inference."""
+    if not face_models.is_ready():
+        # Without a preloading server, warm up here instead of on a user request;
+        # this also retries a warm-up that failed
+        face_models.warm_up_in_background()
+        error = face_models.stats().get("error")
+        body = {"ready": False} if error is None else {"ready": False, "error": error}
+        return JsonResponse(body, status=503)
+    return JsonResponse({"ready": True, "face_models": face_models.stats()})
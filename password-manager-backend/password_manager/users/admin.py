@@ -1,3 +1,256 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import BooleanField, ExpressionWrapper, Max, Q
+from django.utils.functional import cached_property
 
-# Register your models here.
+from . import bootstrap
+from .models import CustomUser, Image, Password
+
+# Admin for tables with millions of rows:
+# - counts are estimated (planner statistics or MAX(pk)) instead of COUNT(*),
+#   and filtered counts stop at FILTERED_COUNT_LIMIT;
+# - search only does exact matches on indexed columns;
+# - lists are ordered by primary key and only sortable by it, and deep pages
+#   can be reached with a keyset filter such as `?id__lt=123456`;
+# - foreign keys use raw id widgets and list_select_related;
+# - bulk actions run in primary-key batches of ACTION_BATCH_SIZE.
+
+FILTERED_COUNT_LIMIT = 10000
+ACTION_BATCH_SIZE = 1000
+
+
+def estimated_table_rows(model):
+    """Approximate row count of a model's table without scanning it."""
+    connection = connections[model.objects.db]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table]
+            )
+            row = cursor.fetchone()
+            if row and row[0] >= 0:  # -1 until the table is first analyzed
+                return row[0]
+        elif connection.vendor == "mysql":
+            cursor.execute(
+                "SELECT table_rows FROM information_schema.tables "
+                "WHERE table_schema = DATABASE() AND table_name = %s",
+                [table],
+            )
+            row = cursor.fetchone()
+            if row and row[0] is not None:
+                return row[0]
+    # Integer keys only grow, so the largest one bounds the row count
+    return model.objects.aggregate(largest=Max("pk"))["largest"] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            return estimated_table_rows(queryset.model)
+        return queryset.order_by()[:FILTERED_COUNT_LIMIT].count()
+
+
+def primary_key_batches(queryset, size=ACTION_BATCH_SIZE):
+    """Yield lists of primary keys of `queryset` using keyset pagination."""
+    queryset = queryset.order_by("pk").values_list("pk", flat=True)
+    last = None
+    while True:
+        page = queryset if last is None else queryset.filter(pk__gt=last)
+        batch = list(page[:size])
+        if batch:
+            yield batch
+        if len(batch) < size:
+            return
+        last = batch[-1]
+
+
+def purge_images(image_ids):
+    """Delete Image rows and their files; returns the number of images removed."""
+    images = list(
+        Image.objects.filter(pk__in=image_ids).values_list(
+            "image", "thumbnail", "user_id"
+        )
+    )
+    # Only the keys are needed to cascade; skip loading the encodings
+    Image.objects.filter(pk__in=image_ids).only("pk").delete()
+    storage = Image._meta.get_field("image").storage
+    for *names, user_id in images:
+        for name in names:
+            if name:
+                storage.delete(name)
+    for user_id in {user_id for *_, user_id in images}:
+        bootstrap.invalidate(user_id)
+    return len(images)
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ("-pk",)
+    sortable_by = ("id",)
+    list_per_page = 50
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # The stock action loads every selected object to build its
+        # confirmation page and bypasses model delete() hooks
+        actions.pop("delete_selected", None)
+        return actions
+
+    def exact_search_filters(self, term):
+        """Return the exact, index-backed lookups to search for `term`."""
+        raise NotImplementedError
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        return queryset.filter(**self.exact_search_filters(term)), False
+
+
+@admin.register(CustomUser)
+class CustomUserAdmin(ScalableAdmin, UserAdmin):
+    list_display = (
+        "id",
+        "username",
+        "email",
+        "phone",
+        "is_active",
+        "is_staff",
+        "date_joined",
+    )
+    list_filter = ("is_staff", "is_active")
+    search_fields = ("username",)
+    search_help_text = "Exact id, username, email or phone number."
+    raw_id_fields = ("face_image",)
+    readonly_fields = (
+        "otp_secret",
+        "otp_generated",
+        "vault_key",
+        "last_login",
+        "date_joined",
+    )
+    fieldsets = UserAdmin.fieldsets + (
+        (
+            "Security",
+            {
+                "fields": (
+                    "phone",
+                    "face_image",
+                    "otp_secret",
+                    "otp_generated",
+                    "vault_key",
+                )
+            },
+        ),
+    )
+    add_fieldsets = UserAdmin.add_fieldsets + ((None, {"fields": ("email", "phone")}),)
+    actions = ("reset_otp_state", "purge_face_enrollments")
+
+    def exact_search_filters(self, term):
+        if "@" in term:
+            return {"email": term.lower()}  # Stored lowercase at signup
+        if term.isdigit():
+            return {"phone": term} if len(term) >= 10 else {"pk": int(term)}
+        return {"username": term}
+
+    @admin.action(description="Reset OTP state of selected users")
+    def reset_otp_state(self, request, queryset):
+        updated = 0
+        for batch in primary_key_batches(queryset):
+            updated += CustomUser.objects.filter(pk__in=batch).update(
+                otp_secret=None, otp_generated=None
+            )
+        self.message_user(
+            request, f"Reset OTP state of {updated} users.", messages.SUCCESS
+        )
+
+    @admin.action(description="Purge face enrollments of selected users")
+    def purge_face_enrollments(self, request, queryset):
+        purged = 0
+        for batch in primary_key_batches(queryset):
+            image_ids = list(
+                Image.objects.filter(user_id__in=batch).values_list("pk", flat=True)
+            )
+            purged += purge_images(image_ids)
+        self.message_user(request, f"Purged {purged} face images.", messages.SUCCESS)
+
+
+@admin.register(Image)
+class ImageAdmin(ScalableAdmin):
+    list_display = ("id", "user", "uploaded_at", "has_encoding")
+    list_select_related = ("user",)
+    search_fields = ("user__username",)
+    search_help_text = "Exact image id, user id (user:<id>) or username."
+    raw_id_fields = ("user",)
+    exclude = ("encoding",)
+    readonly_fields = ("image_url", "uploaded_at")
+    actions = ("purge_selected",)
+
+    def get_queryset(self, request):
+        # The encoding is a binary blob; the list only needs to know it exists
+        return (
+            super()
+            .get_queryset(request)
+            .defer("encoding")
+            .annotate(
+                encoded=ExpressionWrapper(
+                    Q(encoding__isnull=False), output_field=BooleanField()
+                )
+            )
+        )
+
+    def exact_search_filters(self, term):
+        if term.startswith("user:") and term[5:].isdigit():
+            return {"user_id": int(term[5:])}
+        if term.isdigit():
+            return {"pk": int(term)}
+        return {"user__username": term}
+
+    @admin.display(boolean=True, description="Encoding")
+    def has_encoding(self, obj):
+        return obj.encoded
+
+    @admin.action(description="Purge selected face images (rows and files)")
+    def purge_selected(self, request, queryset):
+        purged = sum(purge_images(batch) for batch in primary_key_batches(queryset))
+        self.message_user(request, f"Purged {purged} face images.", messages.SUCCESS)
+
+
+@admin.register(Password)
+class PasswordAdmin(ScalableAdmin):
+    list_display = ("id", "user", "domain_name", "strength", "version", "updated_at")
+    list_select_related = ("user",)
+    search_fields = ("user__username",)
+    search_help_text = "Exact entry id, user id (user:<id>) or username."
+    raw_id_fields = ("user",)
+    # Entries are encrypted with per-user keys; plaintext only goes through the API
+    fields = (
+        "user",
+        "domain_name",
+        "link",
+        "fingerprint",
+        "strength",
+        "version",
+        "created_at",
+        "updated_at",
+    )
+    readonly_fields = fields
+
+    def exact_search_filters(self, term):
+        if term.startswith("user:") and term[5:].isdigit():
+            return {"user_id": int(term[5:])}
+        if term.isdigit():
+            return {"pk": int(term)}
+        return {"user__username": term}
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        # Opt-in for server processes (see gunicorn.conf.py) so management
+        # commands and the test runner don't pay for loading the models.
+        if getattr(settings, "FACE_MODELS_WARMUP", False):
+            from . import face_models
+
+            face_models.warm_up()
@@ -0,0 +1,184 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import AuditEvent
+
+# Audit log of security relevant events. Views call `emit`, which only appends
+# to an in-process buffer; a background thread writes the buffer with one
+# bulk_create when it reaches BUFFER_SIZE events or is FLUSH_INTERVAL seconds
+# old, and an atexit hook (plus gunicorn's worker_exit) flushes what is left
+# on shutdown. Events are lost only if the process is killed outright.
+
+logger = logging.getLogger(__name__)
+
+LOGIN = "auth.login"
+LOGIN_FAILED = "auth.login_failed"
+LOGOUT = "auth.logout"
+LOGOUT_ALL = "auth.logout_all"
+SIGNUP = "auth.signup"
+OTP_SENT = "otp.sent"
+OTP_FAILED = "otp.failed"
+VAULT_READ = "vault.read"
+FACE_VERIFIED = "face.verified"
+FACE_FAILED = "face.failed"
+FACE_REPLAY_SUSPECTED = "face.replay_suspected"
+CREDENTIAL_CREATED = "credential.created"
+CREDENTIALS_CHANGED = "credential.batch"
+CREDENTIAL_RESTORED = "credential.restored"
+
+
+def audit_settings():
+    config = getattr(settings, "AUDIT_LOG", {})
+    return {
+        "BUFFER_SIZE": config.get("BUFFER_SIZE", 200),
+        "FLUSH_INTERVAL": config.get("FLUSH_INTERVAL", 5.0),
+        "MAX_PENDING": config.get("MAX_PENDING", 10000),
+    }
+
+
+def period_of(moment):
+    """Partition key of a moment: its UTC month."""
+    return moment.astimezone(dt_timezone.utc).strftime("%Y-%m")
+
+
+def periods_between(start, end):
+    """Every "YYYY-MM" period touched by [start, end]."""
+    start, end = start.astimezone(dt_timezone.utc), end.astimezone(dt_timezone.utc)
+    periods = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        periods.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return periods
+
+
+class AuditBuffer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+        self.oldest = None  # monotonic time of the oldest buffered event
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.pid = None
+
+    def add(self, event):
+        config = audit_settings()
+        with self.lock:
+            if len(self.events) >= config["MAX_PENDING"]:
+                # The database has been unreachable for a while; keep the
+                # process healthy rather than growing without bound.
+                logger.error("Audit buffer full, dropping %s event", event.action)
+                return
+            self.events.append(event)
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+            full = len(self.events) >= config["BUFFER_SIZE"]
+
+        if not config["FLUSH_INTERVAL"]:
+            # No background writer (tests, management commands)
+            if full:
+                self.flush()
+            return
+        self.ensure_writer()
+        if full:
+            self.wakeup.set()
+
+    def ensure_writer(self):
+        # Threads do not survive fork, so each worker process starts its own.
+        if self.pid == os.getpid() and self.thread and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.pid != os.getpid() or not (self.thread and self.thread.is_alive()):
+                self.pid = os.getpid()
+                self.thread = threading.Thread(
+                    target=self.run, name="audit-writer", daemon=True
+                )
+                self.thread.start()
+
+    def run(self):
+        try:
+            while True:
+                interval = audit_settings()["FLUSH_INTERVAL"] or 5.0
+                self.wakeup.wait(interval)
+                self.wakeup.clear()
+                with self.lock:
+                    due = self.oldest is not None and (
+                        len(self.events) >= audit_settings()["BUFFER_SIZE"]
+                        or time.monotonic() - self.oldest >= interval
+                    )
+                if due:
+                    self.flush()
+                    connection.close()
+        except Exception:  # pragma: no cover - keep request threads unaffected
+            logger.exception("Audit writer stopped")
+
+    def flush(self):
+        """Write every buffered event; returns the number written."""
+        with self.lock:
+            events, self.events, self.oldest = self.events, [], None
+        if not events:
+            return 0
+        try:
+            AuditEvent.objects.bulk_create(events, batch_size=500)
+        except Exception:
+            logger.exception("Could not write %d audit events", len(events))
+            with self.lock:
+                self.events[:0] = events
+                self.oldest = self.oldest or time.monotonic()
+            return 0
+        return len(events)
+
+    def clear(self):
+        with self.lock:
+            self.events, self.oldest = [], None
+
+    def __len__(self):
+        return len(self.events)
+
+
+buffer = AuditBuffer()
+atexit.register(buffer.flush)
+
+
+def client_ip(request):
+    return request.META.get("REMOTE_ADDR") or None
+
+
+def emit(action, request=None, user=None, **metadata):
+    """Record an audit event; the write happens later in a batch."""
+    if user is None and request is not None and request.user.is_authenticated:
+        user = request.user
+    now = timezone.now()
+    buffer.add(
+        AuditEvent(
+            user_id=getattr(user, "pk", user),
+            action=action,
+            created_at=now,
+            period=period_of(now),
+            ip_address=client_ip(request) if request is not None else None,
+            metadata=metadata,
+        )
+    )
+
+
+def flush():
+    return buffer.flush()
+
+
+def events_for(user_id, start=None, end=None):
+    """Events of one user in [start, end], newest first (default: last 30 days)."""
+    end = end or timezone.now()
+    start = start or end - timedelta(days=30)
+    return AuditEvent.objects.filter(
+        user_id=user_id,
+        period__in=periods_between(start, end),
+        created_at__range=(start, end),
+    ).order_by("-created_at", "-pk")
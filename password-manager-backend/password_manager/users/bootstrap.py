@@ -0,0 +1,102 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Subquery
+
+from .models import CustomUser, Image, Password
+
+# Everything the dashboard needs on load, in one response. The expensive part
+# (vault and face ID summaries) is cached per user under a version number that
+# vault writes (health.apply) and face enrollments bump, so a cached summary is
+# never served after a change; BOOTSTRAP["TTL"] bounds staleness of the rest
+# (profile edits made in the admin).
+
+
+def bootstrap_settings():
+    config = getattr(settings, "BOOTSTRAP", {})
+    return {
+        "CACHE": config.get("CACHE", "default"),
+        "TTL": config.get("TTL", 300),
+    }
+
+
+def _cache():
+    return caches[bootstrap_settings()["CACHE"]]
+
+
+def _version_key(user_id):
+    return f"bootstrap:{user_id}:version"
+
+
+def _fresh_version():
+    # Time based, so a version lost to eviction never repeats an old one
+    return time.time_ns() // 1000
+
+
+def version(user_id):
+    cache = _cache()
+    current = cache.get(_version_key(user_id))
+    if current is None:
+        cache.add(_version_key(user_id), _fresh_version(), None)
+        current = cache.get(_version_key(user_id))
+    return current
+
+
+def _bump(user_id):
+    cache = _cache()
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:  # Not cached (yet, or evicted)
+        cache.set(_version_key(user_id), _fresh_version(), None)
+
+
+def invalidate(user_id):
+    """Drop the cached summary of a user once the current transaction commits."""
+    transaction.on_commit(lambda: _bump(user_id))
+
+
+def summary(user):
+    """Vault and face ID summary of `user` in one query."""
+    # Counted from the entries themselves rather than VaultHealth, which can
+    # be missing or out of date for rows written with bulk_create().
+    vault = Password.objects.filter(user=OuterRef("pk")).order_by().values("user")
+    row = (
+        CustomUser.objects.filter(pk=user.pk)
+        .annotate(
+            vault_count=Subquery(vault.annotate(count=Count("pk")).values("count")),
+            vault_updated_at=Subquery(
+                vault.annotate(latest=Max("updated_at")).values("latest")
+            ),
+            face_uploaded_at=Subquery(
+                Image.objects.filter(user=OuterRef("pk"))
+                .order_by("-uploaded_at")
+                .values("uploaded_at")[:1]
+            ),
+        )
+        .values("vault_count", "vault_updated_at", "face_uploaded_at")
+        .get()
+    )
+    return {
+        "face_id": {
+            "enrolled": row["face_uploaded_at"] is not None,
+            "uploaded_at": row["face_uploaded_at"],
+        },
+        "vault": {
+            "count": row["vault_count"] or 0,
+            "updated_at": row["vault_updated_at"],
+        },
+    }
+
+
+def cached_summary(user, current_version=None):
+    """`summary` from the cache when the user's version is unchanged."""
+    current_version = current_version or version(user.pk)
+    key = f"bootstrap:{user.pk}:{current_version}"
+    cache = _cache()
+    data = cache.get(key)
+    if data is None:
+        data = summary(user)
+        cache.set(key, data, bootstrap_settings()["TTL"])
+    return data
@@ -0,0 +1,195 @@
+import hashlib
+import mmap
+import os
+import struct
+import threading
+
+from django.conf import settings
+
+# Offline breached-password index built from a HIBP-style "SHA1:COUNT" dump.
+#
+# Layout (little-endian):
+#   header   MAGIC (8 bytes) | record count (uint64)
+#   buckets  BUCKET_COUNT + 1 uint32 record offsets, one bucket per 16-bit hash prefix
+#   records  sorted 18-byte SHA-1 suffix | uint32 breach count
+#
+# Only the suffix is stored per record because the prefix is implied by the
+# bucket, so the index is 22 bytes per hash instead of 40+ in the text dump.
+
+MAGIC = b"HIBPIDX1"
+HEADER = struct.Struct("<8sQ")
+PREFIX_SIZE = 2
+SUFFIX_SIZE = 20 - PREFIX_SIZE
+RECORD = struct.Struct(f"<{SUFFIX_SIZE}sI")
+BUCKET_COUNT = 1 << (8 * PREFIX_SIZE)
+BUCKETS = struct.Struct(f"<{BUCKET_COUNT + 1}I")
+RECORDS_OFFSET = HEADER.size + BUCKETS.size
+
+
+class BreachIndexError(Exception):
+    """Raised when an index file is missing or malformed."""
+
+
+class BreachIndex:
+    """Memory-mapped, read-only view of a breach index file."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path, "rb") as f:
+            try:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:
+                raise BreachIndexError(f"Breach index {self.path} is empty.") from e
+
+        if len(self._mm) < RECORDS_OFFSET:
+            raise BreachIndexError(f"Breach index {self.path} is truncated.")
+        magic, self.count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise BreachIndexError(f"{self.path} is not a breach index.")
+        if len(self._mm) != RECORDS_OFFSET + self.count * RECORD.size:
+            raise BreachIndexError(f"Breach index {self.path} has the wrong size.")
+        self._buckets = BUCKETS.unpack_from(self._mm, HEADER.size)
+
+    def __len__(self):
+        return self.count
+
+    def lookup_sha1(self, digest):
+        """Return how often a raw SHA-1 digest was seen in breaches (0 if never)."""
+        bucket = int.from_bytes(digest[:PREFIX_SIZE], "big")
+        suffix = digest[PREFIX_SIZE:]
+        lo, hi = self._buckets[bucket], self._buckets[bucket + 1]
+
+        mm = self._mm
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = RECORDS_OFFSET + mid * RECORD.size
+            candidate = mm[start:start + SUFFIX_SIZE]
+            if candidate < suffix:
+                lo = mid + 1
+            elif candidate > suffix:
+                hi = mid
+            else:
+                return RECORD.unpack_from(mm, start)[1]
+        return 0
+
+    def lookup(self, password):
+        """Return the breach count of a plaintext password."""
+        return self.lookup_sha1(hashlib.sha1(password.encode()).digest())
+
+    def close(self):
+        self._mm.close()
+
+
+_index = None
+_index_loaded = False
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """
+    Return the process-wide index, or None when BREACH_INDEX_PATH is unset.
+
+    The file is mapped once per process; the pages live in the OS page cache
+    and are therefore shared by every worker that maps the same file.
+    """
+    global _index, _index_loaded
+    if not _index_loaded:
+        with _index_lock:
+            if not _index_loaded:
+                path = getattr(settings, "BREACH_INDEX_PATH", "")
+                _index = BreachIndex(path) if path and os.path.exists(path) else None
+                _index_loaded = True
+    return _index
+
+
+def reset_index():
+    """Forget the loaded index so the next lookup maps the file again."""
+    global _index, _index_loaded
+    with _index_lock:
+        if _index is not None:
+            _index.close()
+        _index, _index_loaded = None, False
+
+
+def breach_count(password):
+    """Return the breach count of a password, or None when no index is configured."""
+    index = get_index()
+    if index is None:
+        return None
+    return index.lookup(password)
+
+
+def parse_dump_line(line):
+    """Parse "SHA1HEX[:COUNT]" into (digest, count); returns None for blank lines."""
+    line = line.strip()
+    if not line:
+        return None
+    hex_digest, _, count = line.partition(":")
+    digest = bytes.fromhex(hex_digest)
+    if len(digest) != 20:
+        raise ValueError(f"Not a SHA-1 hash: {hex_digest!r}")
+    return digest, int(count) if count else 1
+
+
+def build_index(source_path, output_path):
+    """
+    Build an index file from a dump without loading the dump into memory.
+
+    Pass 1 counts hashes per bucket, pass 2 scatters records into their bucket
+    slots of the pre-sized output, and pass 3 sorts each bucket in place, so
+    memory use is bounded by the largest bucket and unsorted dumps work too.
+    Returns the number of records written.
+    """
+    counts = [0] * BUCKET_COUNT
+    with open(source_path, "r", encoding="ascii") as src:
+        for line in src:
+            parsed = parse_dump_line(line)
+            if parsed:
+                counts[int.from_bytes(parsed[0][:PREFIX_SIZE], "big")] += 1
+
+    offsets = [0] * (BUCKET_COUNT + 1)
+    for bucket, count in enumerate(counts):
+        offsets[bucket + 1] = offsets[bucket] + count
+    total = offsets[-1]
+
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "wb") as out:
+        out.write(HEADER.pack(MAGIC, total))
+        out.write(BUCKETS.pack(*offsets))
+        out.truncate(RECORDS_OFFSET + total * RECORD.size)
+
+    with open(tmp_path, "r+b") as out:
+        if total:
+            mm = mmap.mmap(out.fileno(), 0)
+            cursors = offsets[:-1]
+            with open(source_path, "r", encoding="ascii") as src:
+                for line in src:
+                    parsed = parse_dump_line(line)
+                    if not parsed:
+                        continue
+                    digest, count = parsed
+                    bucket = int.from_bytes(digest[:PREFIX_SIZE], "big")
+                    RECORD.pack_into(
+                        mm,
+                        RECORDS_OFFSET + cursors[bucket] * RECORD.size,
+                        digest[PREFIX_SIZE:],
+                        min(count, 0xFFFFFFFF),
+                    )
+                    cursors[bucket] += 1
+
+            for bucket in range(BUCKET_COUNT):
+                lo, hi = offsets[bucket], offsets[bucket + 1]
+                if hi - lo < 2:
+                    continue
+                start, end = RECORDS_OFFSET + lo * RECORD.size, RECORDS_OFFSET + hi * RECORD.size
+                chunk = mm[start:end]
+                records = sorted(
+                    chunk[i:i + RECORD.size] for i in range(0, len(chunk), RECORD.size)
+                )
+                mm[start:end] = b"".join(records)
+
+            mm.flush()
+            mm.close()
+
+    os.replace(tmp_path, output_path)
+    return total
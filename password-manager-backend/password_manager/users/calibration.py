@@ -0,0 +1,113 @@
+from statistics import NormalDist
+
+import numpy as np
+
+# Face match threshold calibration (used by `manage.py calibrate_face_tolerance`).
+#
+# All pairwise distances of a labelled set of encodings are computed with one
+# matrix product per block of rows and binned straight into histograms of
+# genuine (same identity) and impostor distances, so memory stays bounded by
+# BLOCK_SIZE x n no matter how many images are evaluated. Error rates at any
+# threshold then come from cumulative sums of the histograms:
+#   FAR(t) - share of impostor pairs with distance <= t (wrongly accepted)
+#   FRR(t) - share of genuine pairs with distance > t (wrongly rejected)
+
+BLOCK_SIZE = 2048
+BIN_WIDTH = 0.001
+MAX_DISTANCE = 1.5  # face_recognition distances stay well below this
+
+
+def bin_edges():
+    return np.arange(0.0, MAX_DISTANCE + BIN_WIDTH, BIN_WIDTH)
+
+
+def distance_histograms(encodings, labels, block_size=BLOCK_SIZE):
+    """
+    Histograms (genuine, impostor) over `bin_edges()` of the Euclidean
+    distances of every unordered pair of `encodings`.
+    """
+    encodings = np.asarray(encodings, dtype=np.float64)
+    labels = np.asarray(labels)
+    edges = bin_edges()
+    genuine = np.zeros(len(edges) - 1, dtype=np.int64)
+    impostor = np.zeros(len(edges) - 1, dtype=np.int64)
+    squared = np.einsum("ij,ij->i", encodings, encodings)
+
+    for start in range(0, len(encodings), block_size):
+        block = slice(start, start + block_size)
+        # |a - b|^2 = |a|^2 + |b|^2 - 2ab, for the block against all rows
+        distances = squared[block, None] + squared[None, :] - 2.0 * (
+            encodings[block] @ encodings.T
+        )
+        distances = np.sqrt(np.clip(distances, 0.0, None))
+        # Each unordered pair once: only columns right of the diagonal
+        rows = np.arange(start, min(start + block_size, len(encodings)))
+        upper = np.arange(len(encodings))[None, :] > rows[:, None]
+        same = labels[block, None] == labels[None, :]
+        genuine += np.histogram(distances[upper & same], edges)[0]
+        impostor += np.histogram(distances[upper & ~same], edges)[0]
+    return genuine, impostor
+
+
+def error_rates(genuine, impostor):
+    """(thresholds, FAR, FRR) at the upper edge of every histogram bin."""
+    thresholds = bin_edges()[1:]
+    far = np.cumsum(impostor) / max(impostor.sum(), 1)
+    frr = 1.0 - np.cumsum(genuine) / max(genuine.sum(), 1)
+    return thresholds, far, frr
+
+
+def equal_error_rate(thresholds, far, frr):
+    """(EER, threshold) where FAR and FRR cross, linearly interpolated."""
+    diff = far - frr  # Rises from -FRR(0) to +1
+    index = int(np.argmax(diff >= 0))
+    if index == 0:
+        return float((far[0] + frr[0]) / 2), float(thresholds[0])
+    d0, d1 = diff[index - 1], diff[index]
+    weight = 0.0 if d1 == d0 else -d0 / (d1 - d0)
+    threshold = thresholds[index - 1] + weight * (thresholds[index] - thresholds[index - 1])
+    eer = far[index - 1] + weight * (far[index] - far[index - 1])
+    return float(eer), float(threshold)
+
+
+def recommend(thresholds, far, frr, target_far):
+    """The largest threshold whose FAR stays within `target_far` (lowest FRR)."""
+    allowed = np.flatnonzero(far <= target_far)
+    if not len(allowed):
+        return None
+    index = allowed[-1]
+    return {
+        "tolerance": round(float(thresholds[index]), 3),
+        "far": float(far[index]),
+        "frr": float(frr[index]),
+    }
+
+
+def rates_at(thresholds, far, frr, tolerance):
+    index = min(int(np.searchsorted(thresholds, tolerance - 1e-9)), len(thresholds) - 1)
+    return {"tolerance": tolerance, "far": float(far[index]), "frr": float(frr[index])}
+
+
+def curve_points(thresholds, far, frr, step=0.01):
+    """ROC/DET points every `step` of threshold; DET axes use normal deviates."""
+    normal = NormalDist()
+
+    def deviate(rate):
+        return round(normal.inv_cdf(min(max(rate, 1e-6), 1 - 1e-6)), 4)
+
+    every = max(1, round(step / BIN_WIDTH))
+    points = []
+    for index in range(every - 1, len(thresholds), every):
+        points.append(
+            {
+                "threshold": round(float(thresholds[index]), 3),
+                "far": float(far[index]),
+                "frr": float(frr[index]),
+                "tar": float(1.0 - frr[index]),
+                "far_deviate": deviate(far[index]),
+                "frr_deviate": deviate(frr[index]),
+            }
+        )
+        if far[index] >= 1.0 and frr[index] <= 0.0:
+            break
+    return points
@@ -0,0 +1,210 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+import face_recognition
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import bootstrap, faces
+from .models import EnrollmentJob, Image
+
+# Face enrollment shared by the synchronous upload view and asynchronous jobs.
+# Async uploads are stored with an EnrollmentJob row and answered with 202;
+# a small per-process thread pool processes them after the request commits.
+# Jobs whose process died before finishing are picked up again by
+# `manage.py process_enrollment_jobs`, which can also run as the only worker
+# (ENROLLMENT["WORKERS"] = 0).
+
+logger = logging.getLogger(__name__)
+
+TERMINAL = (EnrollmentJob.SUCCEEDED, EnrollmentJob.FAILED)
+
+
+def enrollment_settings():
+    config = getattr(settings, "ENROLLMENT", {})
+    return {
+        "WORKERS": config.get("WORKERS", 1),
+        "MAX_WAIT": config.get("MAX_WAIT", 20),
+        "POLL_INTERVAL": config.get("POLL_INTERVAL", 1.0),
+        "STALE_AFTER": config.get("STALE_AFTER", 300),
+    }
+
+
+class EnrollmentError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def enroll(user, file):
+    """
+    Validate that `file` shows exactly one clear face and make it the user's
+    face ID, replacing earlier images. Raises EnrollmentError with the
+    message shown to the client.
+    """
+    try:
+        image = face_recognition.load_image_file(file)
+        face_locations = face_recognition.face_locations(image)
+
+        if not face_locations:
+            raise EnrollmentError(
+                "No face detected in the uploaded image. Please provide a clear image of your face."
+            )
+        if len(face_locations) > 1:
+            raise EnrollmentError(
+                f"Multiple faces ({len(face_locations)}) detected in the image. Please provide an image with only your face."
+            )
+
+        # Try to generate a face encoding to ensure the face is clear enough
+        face_encodings = face_recognition.face_encodings(image, face_locations)
+        if not face_encodings:
+            raise EnrollmentError(
+                "Could not generate face encoding. Please provide a clearer image of your face."
+            )
+    except EnrollmentError:
+        raise
+    except Exception as e:
+        raise EnrollmentError(f"Error processing image: {str(e)}")
+
+    # Reset file pointer for saving
+    file.seek(0)
+    try:
+        # Delete previous face images if they exist
+        Image.objects.filter(user=user).delete()
+
+        # Keep the encoding and a thumbnail so verification doesn't have to
+        # decode and encode the saved image again
+        image_instance = Image(
+            image=file,
+            user=user,
+            encoding=faces.encoding_to_bytes(face_encodings[0]),
+        )
+        image_instance.thumbnail.save(
+            f"{Path(file.name).stem}.jpg",
+            ContentFile(faces.thumbnail_bytes(image)),
+            save=False,
+        )
+        image_instance.save()
+    except Exception as e:
+        raise EnrollmentError(f"Error saving image: {str(e)}", status_code=500)
+    bootstrap.invalidate(user.pk)
+    return image_instance
+
+
+# Background processing
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_finished = threading.Condition()
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    # Thread pools do not survive fork, so each worker process creates its own.
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=enrollment_settings()["WORKERS"],
+                thread_name_prefix="enrollment",
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _run(job_id):
+    try:
+        process_job(job_id)
+    except Exception:
+        logger.exception("Enrollment job %s crashed", job_id)
+    finally:
+        connection.close()
+
+
+def submit(job_id):
+    """Queue a job on this process's workers (no-op when WORKERS is 0)."""
+    if enrollment_settings()["WORKERS"]:
+        _get_executor().submit(_run, job_id)
+
+
+def create_job(user, file):
+    """Persist an upload for asynchronous enrollment; it is queued on commit."""
+    job = EnrollmentJob(user=user, filename=os.path.basename(file.name))
+    job.upload.save(job.filename, file, save=False)
+    job.save()
+    transaction.on_commit(lambda: submit(job.pk))
+    return job
+
+
+def process_job(job_id):
+    """Run one pending job; returns False if another worker claimed it first."""
+    claimed = EnrollmentJob.objects.filter(
+        pk=job_id, status=EnrollmentJob.PENDING
+    ).update(status=EnrollmentJob.PROCESSING, started_at=timezone.now())
+    if not claimed:
+        return False
+
+    job = EnrollmentJob.objects.select_related("user").get(pk=job_id)
+    try:
+        with job.upload.open("rb") as upload:
+            image = enroll(job.user, File(upload, name=job.filename))
+        job.image_name = image.image.name
+        job.status = EnrollmentJob.SUCCEEDED
+    except EnrollmentError as e:
+        job.status, job.error = EnrollmentJob.FAILED, e.message
+    except Exception as e:
+        job.status, job.error = (
+            EnrollmentJob.FAILED,
+            f"Error processing image: {str(e)}",
+        )
+
+    # The enrolled Image keeps its own copy of the file
+    job.upload.delete(save=False)
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "error", "image_name", "upload", "finished_at"])
+
+    with _finished:
+        _finished.notify_all()
+    return True
+
+
+def wait_for(job_id, user_id, timeout):
+    """
+    Return the user's job once it has finished or `timeout` seconds passed.
+    Jobs run in this process wake the waiter immediately; jobs run elsewhere
+    are noticed within POLL_INTERVAL.
+    """
+    config = enrollment_settings()
+    deadline = time.monotonic() + min(timeout, config["MAX_WAIT"])
+    while True:
+        job = EnrollmentJob.objects.filter(pk=job_id, user_id=user_id).first()
+        remaining = deadline - time.monotonic()
+        if job is None or job.status in TERMINAL or remaining <= 0:
+            return job
+        with _finished:
+            _finished.wait(min(remaining, config["POLL_INTERVAL"]))
+
+
+def requeue_stale():
+    """Return jobs stuck in processing (their worker died) to pending."""
+    cutoff = timezone.now() - timedelta(seconds=enrollment_settings()["STALE_AFTER"])
+    return EnrollmentJob.objects.filter(
+        status=EnrollmentJob.PROCESSING, started_at__lt=cutoff
+    ).update(status=EnrollmentJob.PENDING, started_at=None)
+
+
+def pending_job_ids(limit=100):
+    return list(
+        EnrollmentJob.objects.filter(status=EnrollmentJob.PENDING)
+        .order_by("created_at")
+        .values_list("pk", flat=True)[:limit]
+    )
@@ -0,0 +1,79 @@
+import logging
+import threading
+import time
+
+import numpy as np
+
+# face_recognition loads its dlib models at import time, and the first
+# detection/encoding after that pays for lazy initialisation inside dlib.
+# warm_up() does both ahead of traffic; when it runs in the gunicorn master
+# (preload_app) forked workers share the loaded models copy-on-write.
+# A failed warm-up is recorded in stats() and retried on the next attempt.
+
+logger = logging.getLogger(__name__)
+
+WARMUP_SIZE = 150
+
+_ready = threading.Event()
+_lock = threading.Lock()
+_started = False
+_stats = {}
+
+
+def warm_up():
+    """Load the face models and run one dummy detection and encoding."""
+    global _started
+    with _lock:
+        if _ready.is_set():
+            return _stats
+        _started = True
+        try:
+            start = time.perf_counter()
+            import face_recognition  # Loads the dlib models
+
+            loaded = time.perf_counter()
+            image = np.zeros((WARMUP_SIZE, WARMUP_SIZE, 3), dtype=np.uint8)
+            face_recognition.face_locations(image)
+            # Passing a location forces the encoder to run even without a face.
+            face_recognition.face_encodings(image, [(0, WARMUP_SIZE, WARMUP_SIZE, 0)])
+        except Exception as exc:
+            logger.exception("Face model warm-up failed")
+            _stats["error"] = repr(exc)
+            _started = False  # Let the next probe try again
+            raise
+
+        _stats.pop("error", None)
+        _stats.update(
+            load_seconds=round(loaded - start, 3),
+            inference_seconds=round(time.perf_counter() - loaded, 3),
+        )
+        _ready.set()
+        return _stats
+
+
+def _warm_up_quietly():
+    try:
+        warm_up()
+    except Exception:
+        pass  # Logged and recorded by warm_up()
+
+
+def warm_up_in_background():
+    """Start warming up in a daemon thread unless it already ran or is running."""
+    global _started
+    with _lock:
+        if _started or _ready.is_set():
+            return
+        _started = True
+        thread = threading.Thread(
+            target=_warm_up_quietly, name="face-model-warmup", daemon=True
+        )
+        thread.start()
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def stats():
+    return dict(_stats)
@@ -0,0 +1,183 @@
+import io
+import itertools
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+from PIL import Image as PILImage
+
+# Helpers shared by the upload/verify views and the backfill command for
+# storing face encodings and thumbnails alongside Image rows.
+
+ENCODING_DTYPE = np.float64  # What face_recognition returns; kept exact
+THUMBNAIL_SIZE = (128, 128)
+
+
+def encoding_to_bytes(encoding):
+    return np.asarray(encoding, dtype=ENCODING_DTYPE).tobytes()
+
+
+def encoding_from_bytes(raw):
+    return np.frombuffer(bytes(raw), dtype=ENCODING_DTYPE)
+
+
+def thumbnail_bytes(image_array):
+    """JPEG thumbnail of an RGB image array as returned by load_image_file."""
+    thumbnail = PILImage.fromarray(image_array)
+    thumbnail.thumbnail(THUMBNAIL_SIZE)
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def process_image_file(path):
+    """
+    Decode an image, encode its face and render a thumbnail.
+
+    Returns (encoding bytes or None, thumbnail bytes, error message or None).
+    Safe to run in a worker process: it does not touch Django or the database.
+    """
+    import face_recognition
+
+    image = face_recognition.load_image_file(path)
+    locations = face_recognition.face_locations(image)
+    if not locations:
+        return None, thumbnail_bytes(image), "No face detected."
+    if len(locations) > 1:
+        return (
+            None,
+            thumbnail_bytes(image),
+            f"Multiple faces ({len(locations)}) detected.",
+        )
+    encodings = face_recognition.face_encodings(image, locations)
+    if not encodings:
+        return None, thumbnail_bytes(image), "Could not generate face encoding."
+    return encoding_to_bytes(encodings[0]), thumbnail_bytes(image), None
+
+
+# Perceptual hash used to spot resubmitted probe frames (see users/probes.py)
+
+def perceptual_hash(image_array, size=8):
+    """
+    64-bit difference hash of an RGB frame: each bit says whether a pixel of a
+    (size + 1) x size grayscale thumbnail is brighter than its right neighbour.
+    Re-encoded, resized or slightly recompressed copies stay within a few bits.
+    """
+    gray = PILImage.fromarray(image_array).convert("L")
+    pixels = np.asarray(
+        gray.resize((size + 1, size), PILImage.Resampling.LANCZOS), dtype=np.int16
+    )
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def hash_distance(a, b):
+    return (a ^ b).bit_count()
+
+
+# Burst verification: several frames of one capture are ranked by a cheap
+# quality score and only the best candidates go through the expensive
+# detect + encode pipeline, a few at a time, until one matches.
+
+QUALITY_SIZE = 256  # Longest side frames are scaled to before scoring
+
+
+def frame_quality(image_array):
+    """
+    Cheap sharpness/exposure score of an RGB frame: variance of the Laplacian
+    of a downscaled grayscale copy, discounted for under- or overexposure.
+    """
+    import cv2
+
+    gray = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
+    scale = QUALITY_SIZE / max(gray.shape)
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
+    exposure = 1.0 - abs(float(gray.mean()) - 128.0) / 128.0
+    return sharpness * max(exposure, 0.05)
+
+
+def encode_frame(image_array):
+    """Return (encoding, None) for a frame with exactly one face, else (None, error)."""
+    import face_recognition
+
+    locations = face_recognition.face_locations(image_array)
+    if not locations:
+        return None, "No face detected in the uploaded image."
+    if len(locations) > 1:
+        return None, (
+            f"Multiple faces ({len(locations)}) detected in the uploaded image. "
+            "Please ensure only your face is visible."
+        )
+    return face_recognition.face_encodings(image_array, locations)[0], None
+
+
+def encode_file(path):
+    """(encoding, None) for an image file with exactly one face, else (None, error)."""
+    import face_recognition
+
+    return encode_frame(face_recognition.load_image_file(path))
+
+
+def match_burst(frames, known_encoding, tolerance, max_candidates=3, workers=2):
+    """
+    Compare a burst of decoded frames with a known encoding.
+
+    Frames are ranked by `frame_quality`; the best `max_candidates` are
+    encoded on `workers` threads, best first, and the search stops at the
+    first match. Returns a dict with `matched`, `distance` (best seen, or
+    None), `frame` (index in `frames`), `tried` and `error` (the message for
+    the best-ranked frame when no frame could be encoded).
+    """
+    import face_recognition
+
+    ranked = sorted(
+        range(len(frames)), key=lambda i: frame_quality(frames[i]), reverse=True
+    )[:max_candidates]
+    result = {
+        "matched": False,
+        "distance": None,
+        "frame": None,
+        "tried": 0,
+        "error": None,
+    }
+    errors = {}
+
+    def score(index):
+        encoding, error = encode_frame(frames[index])
+        if encoding is None:
+            return index, None, error
+        return (
+            index,
+            face_recognition.face_distance([known_encoding], encoding)[0],
+            None,
+        )
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(workers, len(ranked))))
+    try:
+        queue = iter(ranked)
+        running = {pool.submit(score, i) for i in itertools.islice(queue, workers)}
+        while running:
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, distance, error = future.result()
+                result["tried"] += 1
+                if error:
+                    errors[index] = error
+                elif result["distance"] is None or distance < result["distance"]:
+                    result["distance"], result["frame"] = float(distance), index
+            if result["distance"] is not None and result["distance"] <= tolerance:
+                result["matched"] = True
+                break
+            running |= {
+                pool.submit(score, i) for i in itertools.islice(queue, len(done))
+            }
+    finally:
+        # Stop at the first match: queued frames are cancelled, but frames
+        # already being encoded are waited for so the caller's face slot is
+        # not released while dlib is still busy.
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    if result["distance"] is None:
+        result["error"] = errors[min(errors, key=ranked.index)]
+    return result
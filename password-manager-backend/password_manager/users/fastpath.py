@@ -0,0 +1,76 @@
+import functools
+
+from django.utils import timezone
+
+from . import vault
+
+# Read fast path for vault listings: rows come straight from values_list(),
+# are decrypted in one pass and turned into dicts by a mapper compiled once,
+# skipping the per-row field graph of PasswordSerializer(many=True).
+
+
+def compile_row_mapper(fields, converters=None):
+    """
+    Build a function turning a values_list() tuple into a dict.
+
+    The function is generated as a single dict literal, which is much faster
+    than looping over fields per row. `converters` maps a field name to a
+    callable applied to its value.
+    """
+    converters = converters or {}
+    namespace = {f"convert_{name}": converters[name] for name in converters}
+    items = ", ".join(
+        f"{name!r}: convert_{name}(row[{i}])" if name in converters else f"{name!r}: row[{i}]"
+        for i, name in enumerate(fields)
+    )
+    exec(f"def mapper(row):\n    return {{{items}}}\n", namespace)
+    return namespace["mapper"]
+
+
+def datetime_converter(tz):
+    """
+    Return a converter matching DRF's DateTimeField.to_representation (ISO 8601)
+    for the given timezone. Resolving the timezone once per listing instead of
+    once per row avoids a context-local lookup for every entry.
+    """
+
+    def convert(value):
+        if not value:
+            return None
+        value = value.astimezone(tz).isoformat()
+        if value.endswith("+00:00"):
+            value = value[:-6] + "Z"
+        return value
+
+    return convert
+
+
+# Must stay in the same order as PasswordSerializer.Meta.fields
+PASSWORD_FIELDS = ("id", "domain_name", "password", "link", "version", "updated_at")
+PASSWORD_COLUMN = PASSWORD_FIELDS.index("password")
+ID_COLUMN = PASSWORD_FIELDS.index("id")
+
+
+@functools.lru_cache(maxsize=16)
+def password_mapper(tz):
+    return compile_row_mapper(PASSWORD_FIELDS, {"updated_at": datetime_converter(tz)})
+
+
+def password_rows(queryset):
+    """Fetch the rows of a Password queryset as serializer-compatible tuples."""
+    return list(queryset.values_list(*PASSWORD_FIELDS))
+
+
+def vault_listing(user_id, queryset):
+    """Return the decrypted listing of a user's passwords as a list of dicts."""
+    rows = password_rows(queryset)
+    mapper = password_mapper(timezone.get_current_timezone())
+    plaintexts = vault.decrypt_many(
+        user_id, [row[PASSWORD_COLUMN] for row in rows], [row[ID_COLUMN] for row in rows]
+    )
+    listing = []
+    for row, plaintext in zip(rows, plaintexts):
+        entry = mapper(row)
+        entry["password"] = plaintext
+        listing.append(entry)
+    return listing
@@ -0,0 +1,222 @@
+import math
+import string
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import vault
+
+# Vault health is kept as a per-user set of counters (VaultHealth: entries,
+# reuse groups, reused entries) adjusted whenever entries change. Reuse is
+# derived from the indexed (user, fingerprint) column of Password: a write
+# counts the entries sharing each changed fingerprint with one grouped query,
+# so its cost does not grow with the vault. The report adds the ids of the
+# reused, weak and stale entries with one query over the indexed columns.
+# An entry's "state" is (fingerprint, strength, day):
+#   fingerprint - keyed hash used to group reused passwords
+#   strength    - estimated entropy in bits
+#   day         - ISO date of the last update, used for staleness
+
+
+def health_settings():
+    config = getattr(settings, "VAULT_HEALTH", {})
+    return config.get("WEAK_BITS", 50), config.get("STALE_DAYS", 180)
+
+
+_CHARSETS = (
+    (set(string.ascii_lowercase), 26),
+    (set(string.ascii_uppercase), 26),
+    (set(string.digits), 10),
+    (set(string.punctuation + " "), 33),
+)
+
+
+def password_strength(password):
+    """Estimate entropy in bits from length and the character classes used."""
+    if not password:
+        return 0
+    pool = 0
+    remaining = set(password)
+    for charset, size in _CHARSETS:
+        if remaining & charset:
+            pool += size
+            remaining -= charset
+    if remaining:
+        pool += 100  # Non-ASCII characters
+    # Repeated characters add little, so count distinct characters twice as much.
+    effective_length = (len(password) + len(set(password))) / 2
+    return int(effective_length * math.log2(pool))
+
+
+def entry_state(fingerprint, strength, updated_at):
+    """Return the health state of an entry, or None if it has no fingerprint yet."""
+    if not fingerprint or strength is None or updated_at is None:
+        return None
+    return fingerprint, strength, updated_at.date().isoformat()
+
+
+def _reuse(count):
+    """(reuse groups, reused entries) contributed by a fingerprint held `count` times."""
+    return (1, count) if count >= 2 else (0, 0)
+
+
+def _fingerprint_counts(user_id, fingerprints):
+    from .models import Password
+
+    return dict(
+        Password.objects.filter(user_id=user_id, fingerprint__in=fingerprints)
+        .values("fingerprint")
+        .annotate(n=Count("pk"))
+        .values_list("fingerprint", "n")
+    )
+
+
+def apply(user_id, removed=(), added=()):
+    """
+    Adjust the stored counters of a user by removing and adding entry states.
+    Call it after the entries were written: reuse is counted from the table.
+    """
+    removed = [state[0] for state in removed if state]
+    added = [state[0] for state in added if state]
+    if not removed and not added:
+        return
+
+    from . import bootstrap
+    from .models import VaultHealth
+
+    delta = Counter(added)
+    delta.subtract(removed)
+    delta = {fingerprint: n for fingerprint, n in delta.items() if n}
+    with transaction.atomic():
+        health, _ = VaultHealth.objects.select_for_update().get_or_create(user_id=user_id)
+        health.total += len(added) - len(removed)
+        counts = _fingerprint_counts(user_id, list(delta)) if delta else {}
+        for fingerprint, change in delta.items():
+            after = counts.get(fingerprint, 0)
+            groups_after, entries_after = _reuse(after)
+            groups_before, entries_before = _reuse(after - change)
+            health.reused_groups += groups_after - groups_before
+            health.reused_entries += entries_after - entries_before
+        health.save()
+    bootstrap.invalidate(user_id)
+
+
+def rebuild(user_id, batch_size=2000):
+    """
+    Recompute fingerprints, strengths and the summary of one vault from scratch.
+
+    Entries are decrypted in primary-key batches and only rows whose derived
+    columns changed are written back.
+    """
+    from . import bootstrap
+    from .models import Password, VaultHealth
+
+    last_pk = 0
+    while True:
+        batch = list(
+            Password.objects.filter(user_id=user_id, pk__gt=last_pk)
+            .order_by("pk")
+            .only("pk", "user_id", "password", "fingerprint", "strength", "updated_at")[
+                :batch_size
+            ]
+        )
+        if not batch:
+            break
+
+        plaintexts = vault.decrypt_many(
+            user_id, [entry.password for entry in batch], [entry.pk for entry in batch]
+        )
+        changed = []
+        for entry, plaintext in zip(batch, plaintexts):
+            fingerprint = vault.fingerprint(user_id, plaintext)
+            strength = password_strength(plaintext)
+            if (entry.fingerprint, entry.strength) != (fingerprint, strength):
+                entry.fingerprint, entry.strength = fingerprint, strength
+                changed.append(entry)
+
+        if changed:
+            # bulk_update() leaves updated_at alone, so a rebuild does not make
+            # entries look freshly rotated.
+            Password.objects.bulk_update(changed, ["fingerprint", "strength"])
+        last_pk = batch[-1].pk
+
+    groups = (
+        Password.objects.filter(user_id=user_id, fingerprint__isnull=False)
+        .values("fingerprint")
+        .annotate(n=Count("pk"))
+        .values_list("n", flat=True)
+    )
+    with transaction.atomic():
+        health, _ = VaultHealth.objects.select_for_update().get_or_create(user_id=user_id)
+        health.total = health.reused_groups = health.reused_entries = 0
+        for count in groups:
+            health.total += count
+            reused_groups, reused_entries = _reuse(count)
+            health.reused_groups += reused_groups
+            health.reused_entries += reused_entries
+        health.save()
+    bootstrap.invalidate(user_id)
+    return health
+
+
+def report(user_id):
+    """
+    Build the health report of a user: the stored counters plus the ids of
+    the reused (grouped by shared password), weak and stale entries.
+    """
+    from .models import Password, VaultHealth
+
+    health = (
+        VaultHealth.objects.filter(user_id=user_id)
+        .only("total", "reused_groups", "reused_entries", "updated_at")
+        .first()
+    )
+    if health is None:
+        health = VaultHealth(user_id=user_id)
+
+    weak_bits, stale_days = health_settings()
+    cutoff = timezone.now() - timedelta(days=stale_days)
+    entries = Password.objects.filter(user_id=user_id)
+    shared = (
+        entries.filter(fingerprint__isnull=False)
+        .values("fingerprint")
+        .annotate(n=Count("pk"))
+        .filter(n__gt=1)
+        .values("fingerprint")
+    )
+    rows = (
+        entries.filter(
+            Q(fingerprint__in=shared) | Q(strength__lt=weak_bits) | Q(updated_at__lt=cutoff)
+        )
+        .order_by("pk")
+        .values_list("pk", "fingerprint", "strength", "updated_at")
+    )
+
+    reused, weak, stale = {}, [], []
+    for entry_id, fingerprint, strength, updated_at in rows:
+        if strength is not None and strength < weak_bits:
+            weak.append(entry_id)
+        if updated_at < cutoff:
+            stale.append(entry_id)
+        if fingerprint is not None:
+            reused.setdefault(fingerprint, []).append(entry_id)
+    # Rows matched only as weak or stale are in single-entry groups
+    reused = [ids for ids in reused.values() if len(ids) > 1]
+
+    return {
+        "total": health.total,
+        "reused_groups": health.reused_groups,
+        "reused_entries": health.reused_entries,
+        "weak": len(weak),
+        "stale": len(stale),
+        "reused": reused,
+        "weak_ids": weak,
+        "stale_ids": stale,
+        "weak_threshold_bits": weak_bits,
+        "stale_after_days": stale_days,
+        "updated_at": health.updated_at,
+    }
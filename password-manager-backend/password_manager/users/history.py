@@ -0,0 +1,149 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+# Version history of vault entries. The Password table always holds the
+# latest state, so listing the vault never reads history. When an update
+# changes an entry's password, domain or link, the state it replaces is
+# appended to PasswordVersion with only the changed fields filled in (a
+# renamed entry costs a few bytes, not another ciphertext). Reading a version
+# resolves the missing fields forward from newer versions and the entry.
+# Pruning always removes the oldest versions first, so resolution keeps
+# working; `manage.py prune_password_history` applies PASSWORD_HISTORY retention.
+
+TRACKED_FIELDS = (
+    "password",
+    "fingerprint",
+    "strength",
+    "domain_name",
+    "link",
+    "version",
+    "updated_at",
+)
+SECRET_FIELDS = ("password", "fingerprint", "strength")  # Change together
+PLAIN_FIELDS = ("domain_name", "link")
+
+
+def history_settings():
+    config = getattr(settings, "PASSWORD_HISTORY", {})
+    return {
+        "MAX_VERSIONS": config.get("MAX_VERSIONS", 20),
+        "MAX_AGE_DAYS": config.get("MAX_AGE_DAYS", 365),
+        "PRUNE_BATCH_SIZE": config.get("PRUNE_BATCH_SIZE", 1000),
+    }
+
+
+def stored_state(values):
+    return {field: values.get(field) for field in TRACKED_FIELDS}
+
+
+def _password_changed(old, entry):
+    if old["fingerprint"] and entry.fingerprint:
+        # Ciphertexts differ on every write; fingerprints only when the
+        # plaintext does
+        return old["fingerprint"] != entry.fingerprint
+    return old["password"] != entry.password
+
+
+def superseded(entry, archived_at):
+    """The PasswordVersion replaced by `entry`'s unsaved changes, or None."""
+    from .models import PasswordVersion
+
+    old = getattr(entry, "_stored", None)
+    if not old or old["password"] is None or old["version"] is None:
+        return None  # New entry, or loaded without the tracked fields
+    values = {}
+    if _password_changed(old, entry):
+        values.update({field: old[field] for field in SECRET_FIELDS})
+    for field in PLAIN_FIELDS:
+        if old[field] != getattr(entry, field):
+            values[field] = old[field]
+    if not values:
+        return None
+    return PasswordVersion(
+        entry_id=entry.pk,
+        user_id=entry.user_id,
+        version=old["version"],
+        updated_at=old["updated_at"],
+        archived_at=archived_at,
+        **values,
+    )
+
+
+def record(entries):
+    """Archive the replaced state of saved entries with one INSERT."""
+    from .models import PasswordVersion
+
+    now = timezone.now()
+    versions = [version for entry in entries if (version := superseded(entry, now))]
+    if versions:
+        PasswordVersion.objects.bulk_create(versions)
+    for entry in entries:
+        entry._stored = stored_state(entry.__dict__)
+    return versions
+
+
+def resolve(entry, versions):
+    """
+    Full states of `versions` (newest first, all newer than any omitted
+    version) as dicts, filling unchanged fields from newer states.
+    """
+    state = {field: getattr(entry, field) for field in SECRET_FIELDS + PLAIN_FIELDS}
+    states = []
+    for version in versions:
+        if version.password is not None:
+            state = {**state, **{f: getattr(version, f) for f in SECRET_FIELDS}}
+        for field in PLAIN_FIELDS:
+            if getattr(version, field) is not None:
+                state = {**state, field: getattr(version, field)}
+        states.append(
+            {
+                **state,
+                "version": version.version,
+                "updated_at": version.updated_at,
+                "archived_at": version.archived_at,
+            }
+        )
+    return states
+
+
+def _delete_in_batches(pks, batch_size):
+    from .models import PasswordVersion
+
+    deleted = 0
+    for start in range(0, len(pks), batch_size):
+        batch = pks[start : start + batch_size]
+        deleted += PasswordVersion.objects.filter(pk__in=batch).delete()[0]
+    return deleted
+
+
+def prune(batch_size=None):
+    """Apply PASSWORD_HISTORY retention; returns the number of versions deleted."""
+    from .models import PasswordVersion
+
+    config = history_settings()
+    batch_size = batch_size or config["PRUNE_BATCH_SIZE"]
+    # What to delete is decided once, up front, then deleted batch by batch:
+    # re-running the per-entry window for every batch would rank the whole
+    # table again each time.
+    expired = []
+    if config["MAX_AGE_DAYS"]:
+        cutoff = timezone.now() - timedelta(days=config["MAX_AGE_DAYS"])
+        expired = PasswordVersion.objects.filter(archived_at__lt=cutoff).values_list(
+            "pk", flat=True
+        )
+    excess = []
+    if config["MAX_VERSIONS"]:
+        excess = (
+            PasswordVersion.objects.annotate(
+                newer=Window(
+                    RowNumber(), partition_by=[F("entry")], order_by=F("version").desc()
+                )
+            )
+            .filter(newer__gt=config["MAX_VERSIONS"])
+            .values_list("pk", flat=True)
+        )
+    return _delete_in_batches(sorted({*expired, *excess}), batch_size)
@@ -0,0 +1,255 @@
+import hashlib
+import hmac
+import json
+import threading
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import metrics
+from .models import IdempotencyKey
+
+# Idempotency-Key support for endpoints that are expensive or not safe to
+# repeat (adding entries, face enrollment, OTP mails). The first request with
+# a key claims it by inserting an in-flight row; its response is stored for
+# TTL seconds and replayed to retries with the same key and the same request.
+# Duplicates that arrive while the first is still running wait for it (woken
+# at once when it ran in this process, otherwise polling every
+# POLL_INTERVAL). Server errors and exceptions release the key so the client
+# can retry for real. `manage.py prune_idempotency_keys` deletes expired rows.
+#
+# Stored rows must not hold secrets: the request fingerprint is keyed with
+# SECRET_KEY so a leaked table cannot be used to guess request bodies, and
+# endpoints whose responses contain secrets pass `redact` (applied to a
+# successful body before it is stored) and `restore` (rebuilding the secret
+# parts from the database when it is replayed).
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+STORED_HEADERS = ("Location", "Retry-After")
+
+_finished = threading.Condition()
+
+
+def idempotency_settings():
+    config = getattr(settings, "IDEMPOTENCY", {})
+    return {
+        "TTL": config.get("TTL", 24 * 3600),
+        "MAX_WAIT": config.get("MAX_WAIT", 10),
+        "POLL_INTERVAL": config.get("POLL_INTERVAL", 0.5),
+        # In-flight claims older than this belong to a dead worker
+        "LOCK_TIMEOUT": config.get("LOCK_TIMEOUT", 120),
+    }
+
+
+def _update(sha, value):
+    if isinstance(value, UploadedFile):
+        for chunk in value.chunks():
+            sha.update(chunk)
+        value.seek(0)
+    else:
+        sha.update(json.dumps(value, sort_keys=True, default=str).encode())
+    sha.update(b"\0")
+
+
+def fingerprint(request):
+    """Keyed hash of the method, path and body the key was first used with."""
+    sha = hmac.new(settings.SECRET_KEY.encode(), digestmod=hashlib.sha256)
+    sha.update(f"{request.method} {request.get_full_path()}\0".encode())
+    data = request.data
+    if hasattr(data, "lists"):  # Form and multipart bodies, files included
+        for name, values in sorted(data.lists(), key=lambda item: item[0]):
+            sha.update(name.encode() + b"\0")
+            for value in values:
+                _update(sha, value)
+    else:
+        _update(sha, data)
+    return sha.hexdigest()
+
+
+def _replay(record, restore=None):
+    body = record.response_body
+    if restore is not None and status.is_success(record.status_code):
+        body = restore(record.user_id, body)
+    response = Response(body, status=record.status_code)
+    for name, value in record.response_headers.items():
+        response[name] = value
+    response[REPLAYED_HEADER] = "true"
+    return response
+
+
+def _error(message, code, retry_after=None):
+    response = Response({"error": message}, status=code)
+    if retry_after:
+        response["Retry-After"] = str(retry_after)
+    return response
+
+
+def _claim(user, key, request_fingerprint, config):
+    """
+    Claim `key` for this request. Returns None when claimed, else the
+    existing record (complete, or in flight elsewhere).
+    """
+    while True:
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=config["TTL"])
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(
+                    user=user,
+                    key=key,
+                    fingerprint=request_fingerprint,
+                    locked_at=now,
+                    expires_at=expires_at,
+                )
+            return None
+        except IntegrityError:
+            pass
+
+        record = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if record is None:  # Released in the meantime
+            continue
+        stale = now - timedelta(seconds=config["LOCK_TIMEOUT"])
+        if record.expires_at > now and not (
+            record.status == IdempotencyKey.IN_FLIGHT and record.locked_at < stale
+        ):
+            return record
+
+        # Take over an expired record or a claim abandoned by a dead worker;
+        # matching locked_at lets only one of several contenders win
+        taken = IdempotencyKey.objects.filter(
+            pk=record.pk, locked_at=record.locked_at
+        ).update(
+            fingerprint=request_fingerprint,
+            status=IdempotencyKey.IN_FLIGHT,
+            status_code=None,
+            response_body=None,
+            response_headers={},
+            locked_at=now,
+            expires_at=expires_at,
+        )
+        if taken:
+            return None
+
+
+def _wait(user, key, config):
+    deadline = time.monotonic() + config["MAX_WAIT"]
+    while True:
+        record = IdempotencyKey.objects.filter(user=user, key=key).first()
+        remaining = deadline - time.monotonic()
+        if record is None or record.status == IdempotencyKey.COMPLETE or remaining <= 0:
+            return record
+        with _finished:
+            _finished.wait(min(remaining, config["POLL_INTERVAL"]))
+
+
+def _store(user, key, response, redact=None):
+    if response.status_code >= 500 or response.status_code == 429:
+        # Not a decision the client should be stuck with
+        _release(user, key)
+        return
+    body = json.loads(json.dumps(response.data, cls=JSONEncoder))
+    if redact is not None and status.is_success(response.status_code):
+        body = redact(body)
+    headers = {
+        name: response[name] for name in STORED_HEADERS if response.has_header(name)
+    }
+    IdempotencyKey.objects.filter(user=user, key=key).update(
+        status=IdempotencyKey.COMPLETE,
+        status_code=response.status_code,
+        response_body=body,
+        response_headers=headers,
+    )
+    with _finished:
+        _finished.notify_all()
+
+
+def _release(user, key):
+    IdempotencyKey.objects.filter(
+        user=user, key=key, status=IdempotencyKey.IN_FLIGHT
+    ).delete()
+    with _finished:
+        _finished.notify_all()
+
+
+def idempotent(handler=None, *, redact=None, restore=None):
+    """
+    Honour an Idempotency-Key header on a view function or APIView method.
+    Requests without the header run as before.
+
+    `redact(body)` returns the copy of a successful response body to store;
+    `restore(user_id, body)` turns a stored body back into the response.
+    """
+    if handler is None:
+        return lambda handler: idempotent(handler, redact=redact, restore=restore)
+
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        request = args[0] if isinstance(args[0], Request) else args[1]
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return handler(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return _error(
+                f"{HEADER} must be at most {MAX_KEY_LENGTH} characters.",
+                status.HTTP_400_BAD_REQUEST,
+            )
+
+        config = idempotency_settings()
+        endpoint = request.resolver_match.url_name
+        user = request.user
+        request_fingerprint = fingerprint(request)
+        record = _claim(user, key, request_fingerprint, config)
+        if (
+            record is not None
+            and record.fingerprint == request_fingerprint
+            and record.status == IdempotencyKey.IN_FLIGHT
+        ):
+            metrics.inc("idempotency.waited", endpoint=endpoint)
+            record = _wait(user, key, config)
+            if record is None:  # The first request failed and released the key
+                record = _claim(user, key, request_fingerprint, config)
+
+        if record is not None:
+            if record.fingerprint != request_fingerprint:
+                return _error(
+                    f"{HEADER} was already used for a different request.",
+                    status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            if record.status == IdempotencyKey.IN_FLIGHT:
+                return _error(
+                    "A request with this Idempotency-Key is still being processed.",
+                    status.HTTP_409_CONFLICT,
+                    retry_after=max(1, round(config["POLL_INTERVAL"])),
+                )
+            metrics.inc("idempotency.replayed", endpoint=endpoint)
+            return _replay(record, restore)
+
+        try:
+            response = handler(*args, **kwargs)
+        except BaseException:
+            _release(user, key)
+            raise
+        if isinstance(response, Response):
+            _store(user, key, response, redact)
+        else:
+            _release(user, key)
+        return response
+
+    return wrapper
+
+
+def prune():
+    """Delete stored responses past their TTL."""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
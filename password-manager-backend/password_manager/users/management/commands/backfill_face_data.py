@@ -0,0 +1,178 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Q
+
+from users import faces
+from users.models import Image
+
+
+def _process(job):
+    """Worker process entry point: (pk, path) -> (pk, encoding, thumbnail, error)."""
+    pk, path = job
+    try:
+        return (pk, *faces.process_image_file(path))
+    except Exception as e:  # One bad file must not stop the backfill
+        return pk, None, None, str(e)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute stored face encodings and thumbnails for existing Image rows. "
+        "Rows are streamed in primary-key chunks, processed in a process pool and "
+        "written with bulk_update; progress is checkpointed so the command resumes "
+        "where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=200)
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument(
+            "--checkpoint",
+            default=str(Path(settings.BASE_DIR) / ".backfill_face_data.json"),
+            help="File recording the last processed primary key.",
+        )
+        parser.add_argument(
+            "--restart", action="store_true", help="Ignore an existing checkpoint."
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Reprocess rows that already have an encoding and thumbnail.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Estimate the total cost from a small sample without writing anything.",
+        )
+        parser.add_argument("--sample", type=int, default=5)
+
+    def handle(self, *args, **options):
+        queryset = Image.objects.order_by("pk")
+        if not options["force"]:
+            queryset = queryset.filter(
+                Q(encoding__isnull=True) | Q(thumbnail__isnull=True) | Q(thumbnail="")
+            )
+
+        checkpoint = self.load_checkpoint(options)
+        queryset = queryset.filter(pk__gt=checkpoint["last_pk"])
+        remaining = queryset.count()
+
+        if options["dry_run"]:
+            return self.estimate(queryset, remaining, options)
+
+        if not remaining:
+            self.stdout.write(self.style.SUCCESS("Nothing to backfill."))
+            return
+
+        self.stdout.write(
+            f"Backfilling {remaining} images with {options['workers']} workers "
+            f"(resuming after pk {checkpoint['last_pk']})."
+        )
+
+        # Worker processes must not inherit open database connections.
+        connections.close_all()
+        start = time.perf_counter()
+        done = 0
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            while True:
+                chunk = list(
+                    # bulk_update() reads every listed field, so load them all
+                    queryset.filter(pk__gt=checkpoint["last_pk"]).only(
+                        "pk", "image", "encoding", "thumbnail"
+                    )[: options["chunk_size"]]
+                )
+                if not chunk:
+                    break
+
+                by_pk = {image.pk: image for image in chunk}
+                jobs = [(image.pk, self.path_of(image)) for image in chunk]
+                updated = []
+                for pk, encoding, thumbnail, error in pool.map(_process, jobs):
+                    image = by_pk[pk]
+                    if error:
+                        checkpoint["failed"] += 1
+                        self.stderr.write(f"Image {pk}: {error}")
+                    if encoding is not None:
+                        image.encoding = encoding
+                    if thumbnail is not None:
+                        image.thumbnail.save(
+                            f"{Path(image.image.name).stem}.jpg",
+                            ContentFile(thumbnail),
+                            save=False,
+                        )
+                    if encoding is not None or thumbnail is not None:
+                        updated.append(image)
+
+                Image.objects.bulk_update(updated, ["encoding", "thumbnail"])
+
+                done += len(chunk)
+                checkpoint["last_pk"] = chunk[-1].pk
+                checkpoint["processed"] += len(chunk)
+                self.save_checkpoint(options["checkpoint"], checkpoint)
+
+                elapsed = time.perf_counter() - start
+                rate = done / elapsed
+                self.stdout.write(
+                    f"{done}/{remaining} images, {rate:.1f} img/s, "
+                    f"ETA {self.format_seconds((remaining - done) / rate)}"
+                )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done: {checkpoint['processed']} images processed, "
+                f"{checkpoint['failed']} failed, in {self.format_seconds(time.perf_counter() - start)}."
+            )
+        )
+
+    def estimate(self, queryset, remaining, options):
+        sample = list(queryset.only("pk", "image")[: options["sample"]])
+        total_bytes = 0
+        for name in queryset.values_list("image", flat=True).iterator():
+            try:
+                total_bytes += os.path.getsize(Path(settings.MEDIA_ROOT) / name)
+            except OSError:
+                pass
+
+        start = time.perf_counter()
+        for image in sample:
+            _process((image.pk, self.path_of(image)))
+        per_image = (time.perf_counter() - start) / len(sample) if sample else 0
+
+        workers = options["workers"]
+        self.stdout.write(f"Images to process:   {remaining}")
+        self.stdout.write(f"Total image size:    {total_bytes / 1e6:.1f} MB")
+        self.stdout.write(f"Sampled cost:        {per_image * 1000:.0f} ms/image ({len(sample)} images)")
+        self.stdout.write(
+            f"Estimated duration:  {self.format_seconds(remaining * per_image / workers)} "
+            f"with {workers} workers"
+        )
+
+    def path_of(self, image):
+        return str(Path(settings.MEDIA_ROOT) / image.image.name)
+
+    def load_checkpoint(self, options):
+        state = {"last_pk": 0, "processed": 0, "failed": 0}
+        path = options["checkpoint"]
+        if not options["restart"] and os.path.exists(path):
+            with open(path) as f:
+                state.update(json.load(f))
+        return state
+
+    def save_checkpoint(self, path, state):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    def format_seconds(self, seconds):
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
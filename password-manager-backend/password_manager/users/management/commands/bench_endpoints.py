@@ -0,0 +1,263 @@
+import json
+import platform
+import random
+import statistics
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users import audit, synthetic, vault
+from users.models import CustomUser
+
+OTP = "123456"
+
+
+def _login(client, user):
+    client.credentials()
+    return client.post(
+        "/api/users/login/",
+        {"email": user.email, "password": synthetic.DEFAULT_PASSWORD},
+        format="json",
+    )
+
+
+def _me(client, user):
+    return client.get("/api/users/me/")
+
+
+def _add_password(client, user):
+    return client.post(
+        "/api/users/add_password/",
+        {
+            "domain_name": "bench.example.com",
+            "password": "bench-password",
+            "link": "https://bench.example.com/",
+        },
+        format="json",
+    )
+
+
+def _prepare_otp(user):
+    CustomUser.objects.filter(pk=user.pk).update(otp_generated=OTP)
+
+
+def _verify_otp(client, user):
+    return client.get("/api/users/verify-otp/", {"otp": OTP})
+
+
+def _send_otp_email(client, user):
+    return client.get("/api/users/send-otp-email/")
+
+
+# name -> (request, expected status, setup run before each request untimed)
+ENDPOINTS = {
+    "login": (_login, 200, None),
+    "me": (_me, 200, None),
+    "add_password": (_add_password, 201, None),
+    "verify_otp": (_verify_otp, 200, _prepare_otp),
+    "send_otp_email": (_send_otp_email, 200, None),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the DB-bound auth and vault endpoints at several data scales. "
+        "Synthetic data is generated inside a rolled back transaction; latency "
+        "and queries per request are emitted as JSON, optionally compared with "
+        "a previous run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scales",
+            type=int,
+            nargs="+",
+            default=[10, 100, 1000],
+            help="Numbers of users to generate.",
+        )
+        parser.add_argument(
+            "--distribution", choices=synthetic.DISTRIBUTIONS, default="lognormal"
+        )
+        parser.add_argument("--vault-mean", type=int, default=50)
+        parser.add_argument("--vault-max", type=int, default=1000)
+        parser.add_argument(
+            "--requests", type=int, default=30, help="Timed requests per endpoint."
+        )
+        parser.add_argument("--warmup", type=int, default=3)
+        parser.add_argument(
+            "--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS)
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--output", help="Write the JSON report here (default: stdout)."
+        )
+        parser.add_argument(
+            "--compare", help="Previous JSON report to compare against."
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.25,
+            help="Relative p50 slowdown reported as a regression.",
+        )
+        parser.add_argument(
+            "--min-delta-ms",
+            type=float,
+            default=1.0,
+            help="Ignore p50 changes smaller than this, whatever the ratio.",
+        )
+        parser.add_argument(
+            "--fail-on-regression",
+            action="store_true",
+            help="Exit with an error when a regression is found.",
+        )
+
+    def handle(self, *args, **options):
+        report = {
+            "meta": {
+                "created": timezone.now().isoformat(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "distribution": options["distribution"],
+                "vault_mean": options["vault_mean"],
+                "vault_max": options["vault_max"],
+                "requests": options["requests"],
+                "seed": options["seed"],
+            },
+            "results": [],
+        }
+
+        with override_settings(
+            ALLOWED_HOSTS=["testserver"],
+            EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+            ADMISSION_CONTROL={},
+            # Audit events are written in the benchmark transaction, never by
+            # the background writer: they refer to users that are rolled back
+            AUDIT_LOG={**getattr(settings, "AUDIT_LOG", {}), "FLUSH_INTERVAL": 0},
+        ):
+            for scale in options["scales"]:
+                with transaction.atomic():
+                    report["results"].extend(self.run_scale(scale, options))
+                    transaction.set_rollback(True)
+                audit.buffer.clear()
+
+        payload = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(payload + "\n")
+        else:
+            self.stdout.write(payload)
+
+        if options["compare"]:
+            regressions = self.compare(
+                options["compare"],
+                report,
+                options["threshold"],
+                options["min_delta_ms"],
+            )
+            if regressions and options["fail_on_regression"]:
+                raise CommandError(f"{regressions} regression(s) found.")
+
+    def run_scale(self, scale, options):
+        start = time.perf_counter()
+        users = synthetic.generate(
+            scale,
+            distribution=options["distribution"],
+            mean=options["vault_mean"],
+            maximum=options["vault_max"],
+            seed=options["seed"],
+            prefix=f"bench-{scale}",
+        )
+        self.stderr.write(
+            f"{scale} users generated in {time.perf_counter() - start:.1f}s"
+        )
+
+        rng = random.Random(options["seed"])
+        samples = [
+            rng.choice(users) for _ in range(options["warmup"] + options["requests"])
+        ]
+        tokens = {
+            user.pk: str(RefreshToken.for_user(user).access_token) for user in samples
+        }
+
+        results = []
+        for name in options["endpoints"]:
+            request, expected, setup = ENDPOINTS[name]
+            client = APIClient()
+            latencies, queries = [], []
+            for n, user in enumerate(samples):
+                if setup:
+                    setup(user)
+                vault._data_keys.clear()  # Measure the cold path for each user
+                client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens[user.pk]}")
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = request(client, user)
+                    elapsed = time.perf_counter() - started
+                if response.status_code != expected:
+                    raise CommandError(
+                        f"{name} returned {response.status_code} (expected {expected}): "
+                        f"{getattr(response, 'data', response.content)}"
+                    )
+                if n >= options["warmup"]:
+                    latencies.append(elapsed * 1000)
+                    queries.append(len(captured))
+
+            latencies.sort()
+            result = {
+                "scale": scale,
+                "endpoint": name,
+                "latency_ms": {
+                    "mean": round(statistics.fmean(latencies), 3),
+                    "p50": round(statistics.median(latencies), 3),
+                    "p95": round(latencies[int(0.95 * (len(latencies) - 1))], 3),
+                    "max": round(latencies[-1], 3),
+                },
+                "queries": {"mean": statistics.fmean(queries), "max": max(queries)},
+            }
+            results.append(result)
+            self.stderr.write(
+                f"  {name:<16} p50 {result['latency_ms']['p50']:>9.2f} ms  "
+                f"p95 {result['latency_ms']['p95']:>9.2f} ms  "
+                f"queries {result['queries']['max']}"
+            )
+        return results
+
+    def compare(self, path, report, threshold, min_delta_ms):
+        with open(path) as f:
+            baseline = {(r["scale"], r["endpoint"]): r for r in json.load(f)["results"]}
+
+        regressions = 0
+        self.stderr.write(
+            f"\n{'scale':>6} {'endpoint':<16} {'p50 before':>11} {'p50 now':>9} "
+            f"{'change':>8} {'queries':>9}"
+        )
+        for result in report["results"]:
+            before = baseline.get((result["scale"], result["endpoint"]))
+            if not before:
+                continue
+            old, new = before["latency_ms"]["p50"], result["latency_ms"]["p50"]
+            change = (new - old) / old if old else 0.0
+            old_queries, new_queries = (
+                before["queries"]["max"],
+                result["queries"]["max"],
+            )
+            regressed = (
+                change > threshold and new - old >= min_delta_ms
+            ) or new_queries > old_queries
+            regressions += regressed
+            self.stderr.write(
+                f"{result['scale']:>6} {result['endpoint']:<16} {old:>11.2f} {new:>9.2f} "
+                f"{change:>+8.0%} {old_queries:>4}->{new_queries:<4}"
+                + ("  REGRESSION" if regressed else "")
+            )
+        return regressions
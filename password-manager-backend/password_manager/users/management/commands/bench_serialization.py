@@ -0,0 +1,75 @@
+import secrets
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from users import fastpath
+from users.models import CustomUser, Password
+from users.renderers import FastJSONRenderer
+from users.serializers import PasswordSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare PasswordSerializer + JSONRenderer with the values_list fast path "
+        "for vault listings. Data is created inside a rolled back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, nargs="+", default=[100, 10000, 100000])
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'rows':>8} {'serializer ms':>14} {'fast path ms':>13} {'speedup':>8}"
+        )
+        for rows in options["rows"]:
+            with transaction.atomic():
+                slow, fast = self.run(rows, options["repeat"])
+                transaction.set_rollback(True)
+            self.stdout.write(
+                f"{rows:>8} {slow * 1000:>14.1f} {fast * 1000:>13.1f} {slow / fast:>7.1f}x"
+            )
+
+    def run(self, rows, repeat):
+        user = CustomUser.objects.create(
+            username=f"bench-{secrets.token_hex(4)}",
+            email=f"bench-{secrets.token_hex(4)}@example.com",
+            phone=secrets.token_hex(7),
+        )
+        Password.objects.bulk_create_encrypted(
+            [
+                Password(
+                    user=user,
+                    domain_name=f"site-{i}.example.com",
+                    password=secrets.token_urlsafe(16),
+                    link=f"https://site-{i}.example.com/login",
+                )
+                for i in range(rows)
+            ],
+            batch_size=2000,
+        )
+        queryset = Password.objects.filter(user=user)
+
+        def serializer_path():
+            data = PasswordSerializer(queryset.all(), many=True).data
+            return JSONRenderer().render(data)
+
+        def fast_path():
+            return FastJSONRenderer().render(fastpath.vault_listing(user.id, queryset.all()))
+
+        if serializer_path() != fast_path():
+            raise CommandError(f"Fast path output differs from the serializer at {rows} rows.")
+
+        return self.measure(serializer_path, repeat), self.measure(fast_path, repeat)
+
+    def measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings)
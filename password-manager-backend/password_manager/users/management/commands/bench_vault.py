@@ -0,0 +1,83 @@
+import secrets
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from users import vault
+from users.models import CustomUser, Password
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the cost of decrypting a vault listing. Creates a throwaway user "
+        "with N entries inside a transaction that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--entries", type=int, default=10000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        entries, repeat = options["entries"], options["repeat"]
+
+        with transaction.atomic():
+            user = CustomUser.objects.create(
+                username=f"bench-{secrets.token_hex(4)}",
+                email=f"bench-{secrets.token_hex(4)}@example.com",
+                phone=secrets.token_hex(7),
+            )
+            Password.objects.bulk_create_encrypted(
+                [
+                    Password(
+                        user=user,
+                        domain_name=f"site-{i}.example.com",
+                        password=secrets.token_urlsafe(16),
+                        link=f"https://site-{i}.example.com/login",
+                    )
+                    for i in range(entries)
+                ],
+                batch_size=1000,
+            )
+
+            def fetch():
+                return list(
+                    Password.objects.filter(user=user).values_list(
+                        "id", "domain_name", "password", "link"
+                    )
+                )
+
+            def fetch_and_decrypt():
+                rows = fetch()
+                return vault.decrypt_many(
+                    user.id, [row[2] for row in rows], [row[0] for row in rows]
+                )
+
+            fetch_and_decrypt()  # Warm the data key cache and the DB pages
+            baseline = self.measure(fetch, repeat)
+            decrypted = self.measure(fetch_and_decrypt, repeat)
+
+            vault._data_keys.pop(user.id)
+            cold = self.measure(fetch_and_decrypt, 1)
+
+            transaction.set_rollback(True)
+
+        overhead = decrypted - baseline
+        self.stdout.write(f"Entries:                  {entries}")
+        self.stdout.write(f"Fetch only (median):      {baseline * 1000:.1f} ms")
+        self.stdout.write(f"Fetch + decrypt (median): {decrypted * 1000:.1f} ms")
+        self.stdout.write(f"Cold data key (1 run):    {cold * 1000:.1f} ms")
+        self.stdout.write(
+            f"Decrypt overhead:         {overhead * 1000:.1f} ms "
+            f"({overhead / entries * 1e6:.2f} us/entry, "
+            f"{overhead / baseline * 100:.0f}% of fetch)"
+        )
+
+    def measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings)
@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from users import breach
+
+
+class Command(BaseCommand):
+    help = "Build the offline breached-password index from a HIBP-style SHA1:COUNT dump."
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="Path to the SHA-1 dump (one HASH[:COUNT] per line).")
+        parser.add_argument(
+            "--output",
+            default=None,
+            help="Where to write the index (defaults to BREACH_INDEX_PATH).",
+        )
+
+    def handle(self, *args, **options):
+        output = options["output"] or getattr(settings, "BREACH_INDEX_PATH", "")
+        if not output:
+            raise CommandError("Pass --output or set BREACH_INDEX_PATH.")
+
+        start = time.perf_counter()
+        try:
+            total = breach.build_index(options["source"], output)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not build breach index: {e}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Indexed {total} hashes into {output} in {time.perf_counter() - start:.1f}s."
+            )
+        )
@@ -0,0 +1,195 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from users import calibration, faces
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+
+def _encode(path):
+    """Worker process entry point: path -> (path, encoding or None, error)."""
+    try:
+        encoding, error = faces.encode_file(path)
+    except Exception as e:  # One unreadable file must not stop the run
+        return path, None, str(e)
+    return path, encoding, error
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure false accept / false reject rates of face matching on a labelled "
+        "image set (one sub-directory per person) and recommend a "
+        "FACE_MATCH_TOLERANCE. Encodings are computed in a process pool and "
+        "cached next to the images, so reruns only encode new or changed files."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", help="Directory with one sub-directory per identity.")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument(
+            "--cache",
+            help="Encoding cache file (default: <directory>/.face_encodings.npz).",
+        )
+        parser.add_argument(
+            "--target-far",
+            type=float,
+            default=0.001,
+            help="Highest acceptable false accept rate for the recommendation.",
+        )
+        parser.add_argument(
+            "--step",
+            type=float,
+            default=0.01,
+            help="Threshold spacing of the reported ROC/DET points.",
+        )
+        parser.add_argument("--output", help="Write the full report as JSON to this file.")
+
+    def handle(self, *args, **options):
+        root = Path(options["directory"])
+        if not root.is_dir():
+            raise CommandError(f"{root} is not a directory.")
+        files = self.labelled_files(root)
+        if len({label for _, label in files}) < 2:
+            raise CommandError("At least two identities (sub-directories) are needed.")
+
+        cache_path = Path(options["cache"] or root / ".face_encodings.npz")
+        start = time.perf_counter()
+        encodings, labels, failed = self.encodings_for(files, cache_path, options["workers"])
+        encode_seconds = time.perf_counter() - start
+        if len(set(labels)) < 2:
+            raise CommandError(
+                f"At least two identities with a usable face are needed "
+                f"({len(failed)} of {len(files)} images could not be encoded)."
+            )
+
+        start = time.perf_counter()
+        genuine, impostor = calibration.distance_histograms(encodings, labels)
+        thresholds, far, frr = calibration.error_rates(genuine, impostor)
+        compare_seconds = time.perf_counter() - start
+        if not genuine.sum() or not impostor.sum():
+            raise CommandError("Need at least one genuine and one impostor pair.")
+
+        eer, eer_threshold = calibration.equal_error_rate(thresholds, far, frr)
+        current = getattr(settings, "FACE_MATCH_TOLERANCE", 0.4)
+        report = {
+            "identities": len(set(labels)),
+            "images": len(labels),
+            "failed": failed,
+            "genuine_pairs": int(genuine.sum()),
+            "impostor_pairs": int(impostor.sum()),
+            "eer": eer,
+            "eer_threshold": round(eer_threshold, 3),
+            "target_far": options["target_far"],
+            "recommended": calibration.recommend(
+                thresholds, far, frr, options["target_far"]
+            ),
+            "current": calibration.rates_at(thresholds, far, frr, current),
+            "points": calibration.curve_points(thresholds, far, frr, options["step"]),
+        }
+
+        self.stdout.write(
+            f"{report['images']} images of {report['identities']} identities "
+            f"({len(failed)} without a usable face), encoded in {encode_seconds:.1f}s; "
+            f"{report['genuine_pairs']} genuine and {report['impostor_pairs']} impostor "
+            f"pairs compared in {compare_seconds:.2f}s."
+        )
+        self.stdout.write(f"EER {eer:.4%} at tolerance {eer_threshold:.3f}")
+        self.stdout.write(
+            f"Current tolerance {current}: FAR {report['current']['far']:.4%}, "
+            f"FRR {report['current']['frr']:.4%}"
+        )
+        recommended = report["recommended"]
+        if recommended is None:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"No tolerance keeps FAR within {options['target_far']:.4%}."
+                )
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Recommended FACE_MATCH_TOLERANCE = {recommended['tolerance']} "
+                    f"(FAR {recommended['far']:.4%}, FRR {recommended['frr']:.4%})"
+                )
+            )
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}.")
+
+    def labelled_files(self, root):
+        return [
+            (str(path), identity.name)
+            for identity in sorted(root.iterdir())
+            if identity.is_dir() and not identity.name.startswith(".")
+            for path in sorted(identity.iterdir())
+            if path.suffix.lower() in IMAGE_SUFFIXES
+        ]
+
+    def encodings_for(self, files, cache_path, workers):
+        """Encodings and labels of the usable files, reusing cached encodings."""
+        cached = self.load_cache(cache_path)
+        results = {}
+        todo = []
+        for path, _ in files:
+            stat = os.stat(path)
+            entry = cached.get(path)
+            if entry and entry[0] == (stat.st_mtime_ns, stat.st_size):
+                results[path] = entry[1]
+            else:
+                todo.append(path)
+
+        if todo:
+            self.stdout.write(f"Encoding {len(todo)} images with {workers} workers...")
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for path, encoding, error in pool.map(_encode, todo, chunksize=8):
+                    if error:
+                        self.stderr.write(f"{path}: {error}")
+                    results[path] = encoding
+            self.save_cache(cache_path, files, results)
+
+        encodings, labels, failed = [], [], []
+        for path, label in files:
+            if results[path] is None:
+                failed.append(path)
+            else:
+                encodings.append(results[path])
+                labels.append(label)
+        return np.array(encodings), labels, failed
+
+    def load_cache(self, cache_path):
+        if not cache_path.exists():
+            return {}
+        with np.load(cache_path) as data:
+            return {
+                str(path): ((int(mtime), int(size)), encoding if ok else None)
+                for path, mtime, size, ok, encoding in zip(
+                    data["paths"], data["mtimes"], data["sizes"], data["ok"], data["encodings"]
+                )
+            }
+
+    def save_cache(self, cache_path, files, results):
+        paths = [path for path, _ in files]
+        stats = [os.stat(path) for path in paths]
+        np.savez(
+            cache_path,
+            paths=np.array(paths),
+            mtimes=np.array([stat.st_mtime_ns for stat in stats], dtype=np.int64),
+            sizes=np.array([stat.st_size for stat in stats], dtype=np.int64),
+            ok=np.array([results[path] is not None for path in paths]),
+            encodings=np.array(
+                [
+                    results[path] if results[path] is not None else np.zeros(128)
+                    for path in paths
+                ],
+                dtype=faces.ENCODING_DTYPE,
+            ),
+        )
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from users import health, vault
+from users.models import Password
+
+
+class Command(BaseCommand):
+    help = (
+        "Encrypt vault entries that were stored in plaintext before encryption "
+        "was enabled, and rewrite v1 ciphertexts in the current entry-bound format."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        last_pk = 0
+        total = 0
+
+        while True:
+            batch = list(
+                Password.objects.filter(pk__gt=last_pk)
+                .exclude(password__startswith=vault.TOKEN_PREFIX)
+                .order_by("pk")
+                .only("pk", "user_id", "password", "fingerprint", "strength")[:batch_size]
+            )
+            if not batch:
+                break
+
+            for entry in batch:
+                plaintext = vault.decrypt(entry.user_id, entry.password, entry.pk)
+                entry.fingerprint = vault.fingerprint(entry.user_id, plaintext)
+                entry.strength = health.password_strength(plaintext)
+                entry.password = vault.encrypt(entry.user_id, plaintext, entry.pk)
+            Password.objects.bulk_update(batch, ["password", "fingerprint", "strength"])
+
+            last_pk = batch[-1].pk
+            total += len(batch)
+            self.stdout.write(f"Encrypted {total} entries...")
+
+        self.stdout.write(self.style.SUCCESS(f"Done. {total} entries encrypted."))
+        if total:
+            self.stdout.write("Run `rebuild_vault_health` to refresh the health reports.")
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from users import synthetic
+from users.models import CustomUser, Password
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with synthetic users and encrypted vaults. All "
+        f"accounts use the password {synthetic.DEFAULT_PASSWORD!r}."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument(
+            "--distribution", choices=synthetic.DISTRIBUTIONS, default="lognormal"
+        )
+        parser.add_argument("--vault-mean", type=int, default=50)
+        parser.add_argument("--vault-max", type=int, default=1000)
+        parser.add_argument(
+            "--reuse", type=float, default=0.1, help="Share of reused passwords."
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--prefix", default="synthetic", help="Username prefix; must be unused."
+        )
+
+    def handle(self, *args, **options):
+        prefix = options["prefix"]
+        if CustomUser.objects.filter(username__startswith=f"{prefix}-").exists():
+            raise CommandError(
+                f"Users with prefix {prefix!r} already exist; pick another --prefix."
+            )
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            users = synthetic.generate(
+                options["users"],
+                distribution=options["distribution"],
+                mean=options["vault_mean"],
+                maximum=options["vault_max"],
+                reuse=options["reuse"],
+                seed=options["seed"],
+                prefix=prefix,
+            )
+        entries = Password.objects.filter(
+            user__username__startswith=f"{prefix}-"
+        ).count()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {len(users)} users with {entries} vault entries "
+                f"in {time.perf_counter() - start:.1f}s."
+            )
+        )
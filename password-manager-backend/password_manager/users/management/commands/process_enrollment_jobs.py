@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users import enrollment
+
+
+class Command(BaseCommand):
+    help = (
+        "Process pending asynchronous face enrollment jobs, including jobs whose "
+        "web worker died before finishing them. With --loop it keeps polling "
+        "and can serve as the only enrollment worker (ENROLLMENT['WORKERS'] = 0)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true")
+        parser.add_argument(
+            "--interval", type=float, default=2.0, help="Seconds between polls."
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            requeued = enrollment.requeue_stale()
+            if requeued:
+                self.stdout.write(f"Requeued {requeued} stale jobs.")
+
+            processed = 0
+            for job_id in enrollment.pending_job_ids():
+                if enrollment.process_job(job_id):
+                    processed += 1
+            if processed:
+                self.stdout.write(f"Processed {processed} jobs.")
+
+            if not options["loop"]:
+                break
+            if not processed:
+                time.sleep(options["interval"])
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from users import idempotency
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete stored Idempotency-Key responses past IDEMPOTENCY['TTL']. Run "
+        "it periodically (e.g. daily from cron) to keep the table small."
+    )
+
+    def handle(self, *args, **options):
+        deleted = idempotency.prune()
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} idempotency keys."))
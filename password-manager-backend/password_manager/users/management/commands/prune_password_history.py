@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from users import history
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete password versions beyond PASSWORD_HISTORY['MAX_VERSIONS'] per "
+        "entry or older than PASSWORD_HISTORY['MAX_AGE_DAYS'], oldest first and "
+        "in batches. Run it periodically (e.g. daily from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Rows deleted per statement (default: PASSWORD_HISTORY['PRUNE_BATCH_SIZE']).",
+        )
+
+    def handle(self, *args, **options):
+        deleted = history.prune(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} password versions."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from users import revocation
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete token revocations whose tokens have all expired. Run it "
+        "periodically (e.g. daily from cron) to keep the table small."
+    )
+
+    def handle(self, *args, **options):
+        deleted = revocation.prune()
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} revocations."))
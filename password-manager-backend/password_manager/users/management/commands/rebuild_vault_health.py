@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users import health
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Recompute password fingerprints, strengths and vault health reports in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", type=int, action="append", help="Only rebuild these user ids."
+        )
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        users = CustomUser.objects.filter(passwords__isnull=False).distinct()
+        if options["user"]:
+            users = CustomUser.objects.filter(pk__in=options["user"])
+
+        start = time.perf_counter()
+        count = entries = 0
+        for user_id in users.order_by("pk").values_list("pk", flat=True).iterator():
+            report = health.rebuild(user_id, batch_size=options["batch_size"])
+            count += 1
+            entries += report.total
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {count} vault health reports ({entries} entries) "
+                f"in {time.perf_counter() - start:.1f}s."
+            )
+        )
@@ -0,0 +1,136 @@
+import mmap
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+# Serving of protected media files (face images). Callers check ownership;
+# this module handles validators, conditional requests, byte ranges and the
+# hand-off to the front server:
+#   MEDIA_SENDFILE["BACKEND"] = "x-sendfile"        Apache mod_xsendfile, lighttpd
+#   MEDIA_SENDFILE["BACKEND"] = "x-accel-redirect"  nginx internal location
+#   MEDIA_SENDFILE["BACKEND"] = None                stream from an mmap in Python
+
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def sendfile_settings():
+    config = getattr(settings, "MEDIA_SENDFILE", {})
+    return config.get("BACKEND"), config.get("ACCEL_PREFIX", "/protected-media/")
+
+
+def resolve(relative_path):
+    """Return the absolute path of a media file, refusing paths outside MEDIA_ROOT."""
+    root = os.path.realpath(settings.MEDIA_ROOT)
+    full_path = os.path.realpath(os.path.join(root, relative_path))
+    if os.path.commonpath([root, full_path]) != root or not os.path.isfile(full_path):
+        raise Http404("Media file not found.")
+    return full_path
+
+
+def file_etag(stat):
+    """Strong validator built from inode, size and nanosecond mtime."""
+    return f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range Range header into an inclusive (start, end).
+
+    Returns None when the header should be ignored (absent, malformed or a
+    multi-range request, which we answer with the full body) and raises
+    ValueError when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def _mmap_chunks(path, start, end):
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for offset in range(start, end + 1, CHUNK_SIZE):
+                yield mm[offset:min(offset + CHUNK_SIZE, end + 1)]
+
+
+def serve(request, relative_path):
+    """Build the response for a protected media file."""
+    path = resolve(relative_path)
+    stat = os.stat(path)
+    etag = file_etag(stat)
+    last_modified = http_date(stat.st_mtime)
+
+    conditional = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime)
+    )
+    if conditional is not None:
+        conditional["ETag"] = etag
+        conditional["Last-Modified"] = last_modified
+        return conditional
+
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    backend, accel_prefix = sendfile_settings()
+
+    if backend:
+        # The front server reads the file and handles ranges itself.
+        response = HttpResponse(content_type=content_type)
+        if backend == "x-accel-redirect":
+            response["X-Accel-Redirect"] = accel_prefix + relative_path.lstrip("/")
+        else:
+            response["X-Sendfile"] = path
+    else:
+        size = stat.st_size
+        byte_range = None
+        if_range = request.headers.get("If-Range")
+        if not if_range or _if_range_matches(if_range, etag, stat):
+            try:
+                byte_range = parse_range(request.headers.get("Range"), size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{size}"
+                return response
+
+        start, end = byte_range or (0, size - 1)
+        if size == 0:
+            response = HttpResponse(b"", content_type=content_type)
+        else:
+            response = StreamingHttpResponse(
+                _mmap_chunks(path, start, end), content_type=content_type
+            )
+            if byte_range:
+                response.status_code = 206
+                response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(end - start + 1) if size else "0"
+        response["Accept-Ranges"] = "bytes"
+
+    response["ETag"] = etag
+    response["Last-Modified"] = last_modified
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def _if_range_matches(if_range, etag, stat):
+    if if_range.startswith(('"', "W/")):
+        # Only strong validators may be used with If-Range.
+        return etag in parse_etags(if_range) and not if_range.startswith("W/")
+    modified = parse_http_date_safe(if_range)
+    return modified is not None and int(stat.st_mtime) <= modified
@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import defaultdict, deque
+
+# In-process metrics registry behind GET /api/users/admin/metrics/. Values are
+# per worker process (each gunicorn worker reports its own); the response
+# includes the pid so scrapes of different workers can be told apart.
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_gauges = {}
+_summaries = {}
+_samples = defaultdict(lambda: deque(maxlen=20))
+_started = time.time()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, value, **labels):
+    """Record a value into a count/sum/max summary."""
+    key = _key(name, labels)
+    with _lock:
+        summary = _summaries.get(key)
+        if summary is None:
+            _summaries[key] = [1, value, value]
+        else:
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = max(summary[2], value)
+
+
+def add_sample(name, sample, **labels):
+    """Keep one of the most recent detailed samples (e.g. allocation snapshots)."""
+    with _lock:
+        _samples[_key(name, labels)].append(sample)
+
+
+def _rows(store, render):
+    return [
+        {"name": name, "labels": dict(labels), **render(value)}
+        for (name, labels), value in sorted(store.items())
+    ]
+
+
+def snapshot():
+    with _lock:
+        return {
+            "uptime": round(time.time() - _started, 1),
+            "counters": _rows(_counters, lambda v: {"value": v}),
+            "gauges": _rows(_gauges, lambda v: {"value": v}),
+            "summaries": _rows(
+                _summaries,
+                lambda s: {
+                    "count": s[0],
+                    "sum": s[1],
+                    "mean": s[1] / s[0],
+                    "max": s[2],
+                },
+            ),
+            "samples": _rows(_samples, lambda d: {"recent": list(d)}),
+        }
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _summaries.clear()
+        _samples.clear()
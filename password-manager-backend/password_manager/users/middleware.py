@@ -0,0 +1,205 @@
+import logging
+import os
+import random
+import tracemalloc
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import JsonResponse
+from rest_framework.exceptions import APIException
+
+from . import metrics, profiling
+from .revocation import RevocableJWTAuthentication
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def memory_settings():
+    config = getattr(settings, "MEMORY_PROFILING", {})
+    return {
+        "ENABLED": config.get("ENABLED", True),
+        "TRACE": config.get("TRACE", False),
+        "SNAPSHOT_RATE": config.get("SNAPSHOT_RATE", 0.0),
+        "SNAPSHOT_TOP": config.get("SNAPSHOT_TOP", 10),
+        "RSS_LIMIT_MB": config.get("RSS_LIMIT_MB"),
+        "RETRY_AFTER": config.get("RETRY_AFTER", 5),
+        "BUDGETS": config.get("BUDGETS", {}),
+    }
+
+
+def current_rss():
+    """Resident set size of this process in bytes, or None where /proc is missing."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class MemoryBudgetMiddleware:
+    """
+    Record RSS growth (and, with TRACE, the tracemalloc peak) of every request
+    per endpoint, check them against MEMORY_PROFILING["BUDGETS"] and sample
+    top allocation sites on SNAPSHOT_RATE of requests.
+
+    Budgets are keyed by URL name: {"peak_mb": 150, "action": "log"|"reject"}.
+    Over-budget requests are always logged and counted. "reject" also refuses
+    requests to the endpoint with 503 while the worker's RSS leaves less than
+    `peak_mb` of headroom below RSS_LIMIT_MB.
+
+    The tracemalloc peak is process wide, so with threaded workers concurrent
+    requests inflate each other's peaks; sync workers measure exactly.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = memory_settings()
+        if not config["ENABLED"]:
+            return self.get_response(request)
+
+        if config["TRACE"] and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracing = tracemalloc.is_tracing()
+        snapshot = tracing and random.random() < config["SNAPSHOT_RATE"]
+
+        request._memory_config = config
+        rss_before = current_rss()
+        if tracing:
+            traced_before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot() if snapshot else None
+
+        response = self.get_response(request)
+
+        match = getattr(request, "resolver_match", None)
+        endpoint = match.url_name if match and match.url_name else "unmatched"
+        if getattr(request, "_memory_rejected", False):
+            return response
+
+        rss_after = current_rss()
+        rss_delta = None
+        if rss_after is not None and rss_before is not None:
+            rss_delta = rss_after - rss_before
+            metrics.set_gauge("process.rss_bytes", rss_after)
+            metrics.observe("http.memory.rss_delta_bytes", rss_delta, endpoint=endpoint)
+        peak = None
+        if tracing:
+            peak = max(tracemalloc.get_traced_memory()[1] - traced_before, 0)
+            metrics.observe("http.memory.peak_bytes", peak, endpoint=endpoint)
+        if before is not None:
+            self.record_snapshot(before, endpoint, config["SNAPSHOT_TOP"])
+
+        budget = config["BUDGETS"].get(endpoint)
+        # tracemalloc sees Python and numpy allocations but not native ones
+        # (dlib), so judge budgets by whichever measure is larger
+        used = max((v for v in (peak, rss_delta) if v is not None), default=None)
+        if budget and used is not None:
+            if used > budget["peak_mb"] * MB:
+                metrics.inc("http.memory.budget_exceeded", endpoint=endpoint)
+                logger.warning(
+                    "%s used %.1f MB, over its %s MB budget (%s %s)",
+                    endpoint,
+                    used / MB,
+                    budget["peak_mb"],
+                    request.method,
+                    request.path,
+                )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        config = getattr(request, "_memory_config", None)
+        if not config or not config["RSS_LIMIT_MB"]:
+            return None
+        endpoint = request.resolver_match.url_name
+        budget = config["BUDGETS"].get(endpoint)
+        if not budget or budget.get("action") != "reject":
+            return None
+
+        rss = current_rss()
+        if rss is None or rss + budget["peak_mb"] * MB <= config["RSS_LIMIT_MB"] * MB:
+            return None
+        request._memory_rejected = True
+        metrics.inc("http.memory.rejected", endpoint=endpoint)
+        logger.warning(
+            "Rejected %s: RSS %.0f MB leaves no room for its %s MB budget",
+            endpoint,
+            rss / MB,
+            budget["peak_mb"],
+        )
+        response = JsonResponse(
+            {"error": "Server is low on memory. Please retry shortly."}, status=503
+        )
+        response["Retry-After"] = str(config["RETRY_AFTER"])
+        return response
+
+    def record_snapshot(self, before, endpoint, top):
+        # Allocation sites that grew during the request: memory still held
+        # when the response is returned (caches, leaks, the response itself).
+        after = tracemalloc.take_snapshot()
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        stats = after.filter_traces(filters).compare_to(
+            before.filter_traces(filters), "lineno"
+        )
+        metrics.add_sample(
+            "http.memory.top_allocations",
+            [
+                {
+                    "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    "size_diff": stat.size_diff,
+                    "count_diff": stat.count_diff,
+                }
+                for stat in stats[:top]
+            ],
+            endpoint=endpoint,
+        )
+
+
+class ProfilingMiddleware:
+    """
+    Profile single requests on demand (see users/profiling.py). A request is
+    profiled when it sends an X-Profile header and either the header value is
+    one of PROFILING["TOKENS"] or the request carries a staff access token.
+    Only views in PROFILING["MODULES"] are profiled; the response names the
+    stored profile in X-Profile-Id.
+
+    With PROFILING["ENABLED"] off, Django drops this middleware at startup,
+    so requests pay nothing for it. Keep it last in MIDDLEWARE: it calls the
+    view itself, which skips the process_view of middleware listed after it.
+    """
+
+    def __init__(self, get_response):
+        self.config = profiling.profiling_settings()
+        if not self.config["ENABLED"]:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        value = request.headers.get(profiling.HEADER)
+        if not value or view_func.__module__ not in self.config["MODULES"]:
+            return None
+        requested_by = self.requested_by(request, value)
+        if requested_by is None:
+            metrics.inc("profiling.denied")
+            return None
+        return profiling.run(view_func, request, view_args, view_kwargs, requested_by)
+
+    def requested_by(self, request, value):
+        if profiling.allowlisted(value, self.config["TOKENS"]):
+            return "token"
+        # DRF authenticates inside the view, so check the access token here;
+        # the extra user query is paid only by requests asking to be profiled
+        try:
+            result = RevocableJWTAuthentication().authenticate(request)
+        except APIException:
+            return None
+        if result is None or not result[0].is_staff:
+            return None
+        return f"user:{result[0].pk}"
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_customuser_otp_generated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='vault_key',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='password',
+            name='password',
+            field=models.TextField(),
+        ),
+    ]
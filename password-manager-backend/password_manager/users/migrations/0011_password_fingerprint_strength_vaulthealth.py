@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_customuser_vault_key_alter_password_password'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VaultHealth',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='vault_health', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('reused_groups', models.PositiveIntegerField(default=0)),
+                ('reused_entries', models.PositiveIntegerField(default=0)),
+                ('fingerprints', models.JSONField(default=dict)),
+                ('strengths', models.JSONField(default=dict)),
+                ('ages', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='password',
+            name='fingerprint',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='password',
+            name='strength',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='password',
+            index=models.Index(fields=['user', 'fingerprint'], name='users_passw_user_id_d75390_idx'),
+        ),
+    ]
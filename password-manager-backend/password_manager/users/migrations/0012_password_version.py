@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_password_fingerprint_strength_vaulthealth'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='password',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
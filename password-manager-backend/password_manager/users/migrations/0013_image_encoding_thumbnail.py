@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:37
+
+import users.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0012_password_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="image",
+            name="encoding",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="image",
+            name="thumbnail",
+            field=models.ImageField(
+                blank=True, null=True, upload_to=users.models.thumbnail_upload_to
+            ),
+        ),
+    ]
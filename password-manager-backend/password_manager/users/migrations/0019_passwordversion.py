@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0018_idempotencykey"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PasswordVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("version", models.PositiveIntegerField()),
+                ("password", models.TextField(blank=True, null=True)),
+                ("fingerprint", models.CharField(blank=True, max_length=64, null=True)),
+                ("strength", models.PositiveSmallIntegerField(blank=True, null=True)),
+                (
+                    "domain_name",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                ("link", models.URLField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField()),
+                ("archived_at", models.DateTimeField(db_index=True)),
+                (
+                    "entry",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="versions",
+                        to="users.password",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("entry", "version"), name="unique_password_version"
+                    )
+                ],
+            },
+        ),
+    ]
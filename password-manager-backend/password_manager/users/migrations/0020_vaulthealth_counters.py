@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0019_passwordversion"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="vaulthealth",
+            name="ages",
+        ),
+        migrations.RemoveField(
+            model_name="vaulthealth",
+            name="fingerprints",
+        ),
+        migrations.RemoveField(
+            model_name="vaulthealth",
+            name="strengths",
+        ),
+        migrations.AddIndex(
+            model_name="password",
+            index=models.Index(
+                fields=["user", "strength"], name="users_passw_user_id_f4036f_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="password",
+            index=models.Index(
+                fields=["user", "updated_at"], name="users_passw_user_id_a26cc3_idx"
+            ),
+        ),
+    ]
@@ -1,14 +1,17 @@
 from datetime import datetime
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
 import cv2
 import numpy as np
 import base64
 import hashlib
 import re
+import uuid
 from django.contrib.auth.hashers import make_password
 import pyotp  # For OTP generation
 
+from . import health, history, vault
+
 
 # Load Haar Cascade for face detection
 CASCADE_PATH = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
@@ -23,6 +26,10 @@ def image_upload_to(instance, filename):
     return f"images/{timestamp}_{lowercase_filename}"
 
 
+def thumbnail_upload_to(instance, filename):
+    return f"thumbnails/{filename.lower()}"
+
+
 class Image(models.Model):
     user = models.ForeignKey(
         "CustomUser",
@@ -34,6 +41,10 @@ class Image(models.Model):
         max_length=255, blank=True, null=True
     )  # Store the URL (optional)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    encoding = models.BinaryField(
+        blank=True, null=True
+    )  # 128-d face encoding (float64), see users/faces.py
+    thumbnail = models.ImageField(upload_to=thumbnail_upload_to, blank=True, null=True)
 
     class Meta:
         app_label = "users"
@@ -58,6 +69,12 @@ class CustomUser(AbstractUser):
     )
     otp_secret = models.CharField(max_length=255, blank=True, null=True)
     otp_generated = models.CharField(max_length=255, blank=True, null=True)
+    vault_key = models.CharField(
+        max_length=255, blank=True, null=True
+    )  # Per-user data key, wrapped with the vault master key
+
+    class Meta(AbstractUser.Meta):
+        indexes = [models.Index(fields=["email"])]  # Login and admin lookups
 
     # OTP related methods
     def generate_otp_secret(self):
@@ -79,24 +96,307 @@ class CustomUser(AbstractUser):
         return totp.verify(otp)  # Returns True if OTP is valid, False otherwise
 
 
+class PasswordQuerySet(models.QuerySet):
+    def bulk_create_encrypted(self, entries, batch_size=None):
+        """
+        bulk_create entries whose `password` holds plaintext, encrypting each
+        once its pk exists (the pk is bound into the ciphertext). Like
+        bulk_create it skips save(), so fingerprints and strengths are left
+        to the caller.
+        """
+        plaintexts = [entry.password for entry in entries]
+        with transaction.atomic(using=self.db, savepoint=False):
+            for entry in entries:
+                entry.password = ""  # Replaced before the transaction commits
+            self.bulk_create(entries, batch_size=batch_size)
+            by_user = {}
+            for entry, plaintext in zip(entries, plaintexts):
+                by_user.setdefault(entry.user_id, []).append((entry, plaintext))
+            for user_id, pairs in by_user.items():
+                tokens = vault.encrypt_many(
+                    user_id,
+                    [plaintext for _, plaintext in pairs],
+                    [entry.pk for entry, _ in pairs],
+                )
+                for (entry, _), token in zip(pairs, tokens):
+                    entry.password = token
+            self.bulk_update(entries, ["password"], batch_size=batch_size)
+        return entries
+
+
 class Password(models.Model):
     user = models.ForeignKey(
         "CustomUser", on_delete=models.CASCADE, related_name="passwords"
     )
     domain_name = models.CharField(max_length=255)
-    password = models.CharField(max_length=255)  # Store the hashed password
+    password = models.TextField()  # AES-GCM token, see users/vault.py
     link = models.URLField()
+    fingerprint = models.CharField(
+        max_length=64, blank=True, null=True
+    )  # Keyed hash of the plaintext, used to detect reuse
+    strength = models.PositiveSmallIntegerField(
+        blank=True, null=True
+    )  # Estimated entropy in bits
+    version = models.PositiveIntegerField(
+        default=1
+    )  # Bumped on every update, used for optimistic concurrency
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = PasswordQuerySet.as_manager()
+
     class Meta:
         app_label = "users"
+        indexes = [
+            models.Index(fields=["user", "fingerprint"]),  # Reuse groups
+            models.Index(fields=["user", "strength"]),  # Weak entries
+            models.Index(fields=["user", "updated_at"]),  # Stale entries
+        ]
 
     def __str__(self):
         return self.domain_name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored health state so save/delete can apply a delta.
+        loaded = instance.__dict__
+        instance._health_state = health.entry_state(
+            loaded.get("fingerprint"), loaded.get("strength"), loaded.get("updated_at")
+        )
+        # ...and the stored values, so an update can archive them
+        instance._stored = history.stored_state(loaded)
+        return instance
+
     def save(self, *args, **kwargs):
-        """Override save method to hash the password before saving."""
-        # if self.password:
-        #     self.password = make_password(self.password)  # Hash the password
+        """Override save method to encrypt the password before saving."""
+        plaintext = None
+        if self.password and not vault.is_encrypted(self.password):
+            plaintext = self.password
+            self.fingerprint = vault.fingerprint(self.user_id, plaintext)
+            self.strength = health.password_strength(plaintext)
+        if not self._state.adding:
+            self.version += 1
+        if plaintext is not None and self.pk is None:
+            # The ciphertext is bound to the pk, which the INSERT assigns
+            with transaction.atomic(savepoint=False):
+                self.password = ""
+                super().save(*args, **kwargs)
+                self.password = vault.encrypt(self.user_id, plaintext, self.pk)
+                Password.objects.filter(pk=self.pk).update(password=self.password)
+        else:
+            if plaintext is not None:
+                self.password = vault.encrypt(self.user_id, plaintext, self.pk)
+            super().save(*args, **kwargs)
+
+        previous = getattr(self, "_health_state", None)
+        self._health_state = health.entry_state(
+            self.fingerprint, self.strength, self.updated_at
+        )
+        health.apply(self.user_id, removed=[previous], added=[self._health_state])
+        history.record([self])
+
+    def delete(self, *args, **kwargs):
+        state = health.entry_state(self.fingerprint, self.strength, self.updated_at)
+        result = super().delete(*args, **kwargs)
+        health.apply(self.user_id, removed=[state])
+        return result
+
+    def get_password(self):
+        """Return the decrypted password."""
+        return vault.decrypt(self.user_id, self.password, self.pk)
+
+
+class PasswordVersion(models.Model):
+    """
+    A superseded state of a Password entry (see users/history.py). Only the
+    fields that differ from the next newer state are stored; null fields
+    resolve forward to a newer version or to the entry itself.
+    """
+
+    entry = models.ForeignKey(
+        "Password", on_delete=models.CASCADE, related_name="versions"
+    )
+    user = models.ForeignKey("CustomUser", on_delete=models.CASCADE, related_name="+")
+    version = models.PositiveIntegerField()  # Password.version of this state
+    password = models.TextField(null=True, blank=True)  # AES-GCM token
+    fingerprint = models.CharField(max_length=64, null=True, blank=True)
+    strength = models.PositiveSmallIntegerField(null=True, blank=True)
+    domain_name = models.CharField(max_length=255, null=True, blank=True)
+    link = models.URLField(null=True, blank=True)
+    updated_at = models.DateTimeField()  # When this state was written
+    archived_at = models.DateTimeField(db_index=True)  # When it was replaced
+
+    class Meta:
+        app_label = "users"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["entry", "version"], name="unique_password_version"
+            )
+        ]
+
+    def __str__(self):
+        return f"Version {self.version} of password entry {self.entry_id}"
+
+
+class VaultHealth(models.Model):
+    """Incrementally maintained health counters of a user's vault (see users/health.py)."""
+
+    user = models.OneToOneField(
+        "CustomUser",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="vault_health",
+    )
+    total = models.PositiveIntegerField(default=0)
+    reused_groups = models.PositiveIntegerField(default=0)
+    reused_entries = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = "users"
+
+    def __str__(self):
+        return f"Vault health of user {self.user_id}"
+
+
+class AuditEvent(models.Model):
+    """
+    Append-only record of vault reads, OTP sends, face verifications and
+    credential changes (written in batches by users/audit.py).
+
+    `period` ("YYYY-MM") is the partition key: range queries filter on it so
+    old months can be archived or, on PostgreSQL, moved to native partitions.
+    """
+
+    user = models.ForeignKey(
+        "CustomUser",
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,  # Audit rows outlive the accounts they describe
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    action = models.CharField(max_length=32)
+    created_at = models.DateTimeField()
+    period = models.CharField(max_length=7)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    metadata = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        app_label = "users"
+        indexes = [
+            models.Index(fields=["user", "period", "created_at"]),
+            models.Index(fields=["period", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.action} by user {self.user_id} at {self.created_at}"
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("Audit events are append-only.")
         super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Audit events are append-only.")
+
+
+def enrollment_upload_to(instance, filename):
+    return f"enrollments/{instance.id}_{filename.lower()}"
+
+
+class EnrollmentJob(models.Model):
+    """A face image accepted for asynchronous enrollment (see users/enrollment.py)."""
+
+    PENDING = "pending"
+    PROCESSING = "processing"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (PROCESSING, "Processing"),
+        (SUCCEEDED, "Succeeded"),
+        (FAILED, "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        "CustomUser", on_delete=models.CASCADE, related_name="enrollment_jobs"
+    )
+    upload = models.FileField(upload_to=enrollment_upload_to, blank=True)
+    filename = models.CharField(max_length=255)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    error = models.TextField(blank=True, default="")
+    image_name = models.CharField(
+        max_length=255, blank=True, default=""
+    )  # Path of the enrolled Image file once the job succeeded
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        app_label = "users"
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    def __str__(self):
+        return f"Enrollment job {self.id} ({self.status})"
+
+
+class RevokedToken(models.Model):
+    """
+    A revoked JWT id, session id or, for "user:<id>" keys, every token of a
+    user issued before `revoked_at` (see users/revocation.py). Rows are only
+    needed until the tokens they cover expire and are then pruned.
+    """
+
+    key = models.CharField(max_length=64, unique=True)
+    user = models.ForeignKey(
+        "CustomUser",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    revoked_at = models.DateTimeField(db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        app_label = "users"
+
+    def __str__(self):
+        return f"Revoked {self.key} until {self.expires_at}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    The first response to a request sent with an Idempotency-Key header,
+    replayed to retries with the same key (see users/idempotency.py).
+    """
+
+    IN_FLIGHT = "in_flight"
+    COMPLETE = "complete"
+    STATUS_CHOICES = [(IN_FLIGHT, "In flight"), (COMPLETE, "Complete")]
+
+    user = models.ForeignKey(
+        "CustomUser", on_delete=models.CASCADE, related_name="+"
+    )
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)  # Method, path and body hash
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=IN_FLIGHT)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+    response_headers = models.JSONField(default=dict, blank=True)
+    locked_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        app_label = "users"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"], name="unique_idempotency_key_per_user"
+            )
+        ]
+
+    def __str__(self):
+        return f"Idempotency key {self.key} of user {self.user_id} ({self.status})"
@@ -0,0 +1,139 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import faces, metrics
+
+# Short-lived cache of face verification decisions keyed by the probe bytes.
+# Clients that retry verify-face-id usually resend the same frames; an exact
+# repeat within TTL gets the earlier decision back without running dlib again.
+# Perceptual hashes of accepted frames are kept for REPLAY_WINDOW so that a
+# copy of an accepted frame (resent as is, or re-encoded/resized from a
+# recording) can be flagged as a possible replay.
+
+EXACT = "exact"
+NEAR_DUPLICATE = "near_duplicate"
+
+
+def probe_settings():
+    config = getattr(settings, "FACE_PROBE_CACHE", {})
+    return {
+        "ENABLED": config.get("ENABLED", True),
+        "CACHE": config.get("CACHE", "default"),
+        "TTL": config.get("TTL", 30),
+        "REPLAY_WINDOW": config.get("REPLAY_WINDOW", 600),
+        "REPLAY_DISTANCE": config.get("REPLAY_DISTANCE", 4),
+        "REPLAY_HISTORY": config.get("REPLAY_HISTORY", 20),
+        "REJECT_REPLAYS": config.get("REJECT_REPLAYS", False),
+    }
+
+
+def _cache():
+    return caches[probe_settings()["CACHE"]]
+
+
+def digest(uploads):
+    """SHA-256 over the bytes of every uploaded frame, in order."""
+    sha = hashlib.sha256()
+    for upload in uploads:
+        for chunk in upload.chunks():
+            sha.update(chunk)
+        sha.update(b"\0")
+        upload.seek(0)
+    return sha.hexdigest()
+
+
+# Hit ratio of this process, exported as a gauge next to the raw counters
+_lookups = {"hit": 0, "miss": 0}
+_lookups_lock = threading.Lock()
+
+
+def _record(result):
+    metrics.inc("face.probe_cache.lookups", result=result)
+    with _lookups_lock:
+        _lookups[result] += 1
+        ratio = _lookups["hit"] / (_lookups["hit"] + _lookups["miss"])
+    metrics.set_gauge("face.probe_cache.hit_ratio", round(ratio, 4))
+
+
+def _decision_key(user_id, image_id, probe_digest):
+    # The enrolled image is part of the key so re-enrolling invalidates it
+    return f"faceprobe:{user_id}:{image_id}:{probe_digest}"
+
+
+def lookup(user_id, image_id, probe_digest):
+    """The cached decision for an identical probe, or None."""
+    config = probe_settings()
+    if not config["ENABLED"]:
+        return None
+    decision = _cache().get(_decision_key(user_id, image_id, probe_digest))
+    _record("miss" if decision is None else "hit")
+    return decision
+
+
+def store(user_id, image_id, probe_digest, match):
+    config = probe_settings()
+    if not config["ENABLED"]:
+        return
+    decision = {
+        "matched": bool(match["matched"]),
+        "distance": None if match["distance"] is None else float(match["distance"]),
+        "tried": match["tried"],
+        "error": match["error"],
+    }
+    _cache().set(
+        _decision_key(user_id, image_id, probe_digest), decision, config["TTL"]
+    )
+
+
+def _history_key(user_id):
+    return f"faceprobe:{user_id}:accepted"
+
+
+def _history(user_id, config):
+    cutoff = time.time() - config["REPLAY_WINDOW"]
+    return [
+        (phash, seen)
+        for phash, seen in _cache().get(_history_key(user_id), [])
+        if seen >= cutoff
+    ]
+
+
+def closest_accepted(user_id, hashes):
+    """
+    Smallest Hamming distance between `hashes` and the frames accepted for
+    the user within REPLAY_WINDOW, if it is within REPLAY_DISTANCE; else None.
+    """
+    config = probe_settings()
+    if not config["ENABLED"] or not hashes:
+        return None
+    distances = [
+        faces.hash_distance(phash, accepted)
+        for accepted, _ in _history(user_id, config)
+        for phash in hashes
+    ]
+    closest = min(distances, default=None)
+    if closest is None or closest > config["REPLAY_DISTANCE"]:
+        return None
+    return closest
+
+
+def remember_accepted(user_id, hashes):
+    config = probe_settings()
+    if not config["ENABLED"] or not hashes:
+        return
+    now = time.time()
+    history = _history(user_id, config) + [(phash, now) for phash in hashes]
+    _cache().set(
+        _history_key(user_id),
+        history[-config["REPLAY_HISTORY"] :],
+        config["REPLAY_WINDOW"],
+    )
+
+
+def flag_replay(reason):
+    metrics.inc("face.replay_suspected", reason=reason)
+    return probe_settings()["REJECT_REPLAYS"]
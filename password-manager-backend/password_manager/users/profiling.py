@@ -0,0 +1,209 @@
+import hmac
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import metrics
+
+# On-demand wall-clock profiles of single requests (see ProfilingMiddleware).
+# While a profiled view runs, a sampler thread reads the request thread's
+# stack every INTERVAL seconds and counts identical stacks. The result is
+# stored as collapsed stacks ("root;caller;callee count" per line), the input
+# format of flamegraph.pl and speedscope, in DIRECTORY, which keeps the
+# MAX_PROFILES newest profiles and is shared by all workers of the host.
+#
+# Samples are taken whenever the sampler gets the GIL, so time spent in
+# queries or native code (dlib) shows up at the Python line that called it.
+# CPU-bound pure Python code is sampled at most every sys.getswitchinterval().
+
+HEADER = "X-Profile"
+ID_HEADER = "X-Profile-Id"
+_ID = re.compile(r"[0-9a-f]{32}")
+
+_store_lock = threading.Lock()
+
+
+def profiling_settings():
+    config = getattr(settings, "PROFILING", {})
+    return {
+        "ENABLED": config.get("ENABLED", False),
+        "TOKENS": config.get("TOKENS", ()),
+        "INTERVAL": config.get("INTERVAL", 0.001),
+        "MAX_PROFILES": config.get("MAX_PROFILES", 50),
+        "MODULES": config.get("MODULES", ("users.views",)),
+        "DIRECTORY": config.get("DIRECTORY")
+        or os.path.join(tempfile.gettempdir(), "password_manager_profiles"),
+    }
+
+
+def allowlisted(value, tokens):
+    """Whether the X-Profile header value is one of the configured tokens."""
+    return any(hmac.compare_digest(value.encode(), token.encode()) for token in tokens)
+
+
+def _depth(frame):
+    depth = 0
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+    return depth
+
+
+def _label(code):
+    filename = code.co_filename
+    base = str(settings.BASE_DIR)
+    if filename.startswith(base):
+        filename = filename[len(base) + 1 :]
+    elif "site-packages" in filename:
+        filename = filename.split("site-packages", 1)[1][1:]
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+class Sampler:
+    """Count the stacks of one thread below its first `skip` frames."""
+
+    def __init__(self, thread_id, skip, interval):
+        self.thread_id = thread_id
+        self.skip = skip
+        self.interval = interval
+        self.stacks = Counter()
+        self._labels = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="request-profiler", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            del frame
+            codes = codes[::-1][self.skip :]
+            if codes:
+                self.stacks[tuple(codes)] += 1
+
+    def collapsed(self):
+        labels = self._labels
+        lines = []
+        for codes, count in self.stacks.most_common():
+            names = []
+            for code in codes:
+                if code not in labels:
+                    labels[code] = _label(code)
+                names.append(labels[code])
+            lines.append(f"{';'.join(names)} {count}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+def run(view_func, request, args, kwargs, requested_by):
+    """Call the view under the sampler, store the profile, tag the response."""
+    config = profiling_settings()
+    # Frames up to this one belong to the server and middleware, not the view
+    sampler = Sampler(threading.get_ident(), _depth(sys._getframe()), config["INTERVAL"])
+    started = time.perf_counter()
+    sampler.start()
+    try:
+        response = view_func(request, *args, **kwargs)
+    finally:
+        sampler.stop()
+        duration = time.perf_counter() - started
+
+    endpoint = request.resolver_match.url_name
+    if hasattr(response, "render") and callable(response.render):
+        # Render inside the measurement: serialization is part of the view's cost
+        response = response.render()
+    profile_id = store(
+        {
+            "endpoint": endpoint,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "duration_ms": round(duration * 1000, 1),
+            "samples": sum(sampler.stacks.values()),
+            "interval_ms": config["INTERVAL"] * 1000,
+            "requested_by": requested_by,
+            "pid": os.getpid(),
+        },
+        sampler.collapsed(),
+        config,
+    )
+    metrics.inc("profiling.captured", endpoint=endpoint)
+    metrics.observe("profiling.duration_seconds", duration, endpoint=endpoint)
+    response[ID_HEADER] = profile_id
+    return response
+
+
+def _directory(config):
+    path = Path(config["DIRECTORY"])
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _mtime(path):
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:  # Pruned by another worker meanwhile
+        return 0
+
+
+def store(meta, collapsed, config=None):
+    """Write a profile and drop the oldest beyond MAX_PROFILES; returns its id."""
+    config = config or profiling_settings()
+    directory = _directory(config)
+    profile_id = uuid.uuid4().hex
+    meta = {"id": profile_id, "created_at": timezone.now().isoformat(), **meta}
+    (directory / f"{profile_id}.folded").write_text(collapsed)
+    # The metadata file is what listings see, so it appears last and whole
+    partial = directory / f"{profile_id}.json.tmp"
+    partial.write_text(json.dumps(meta))
+    os.replace(partial, directory / f"{profile_id}.json")
+
+    with _store_lock:
+        profiles = sorted(directory.glob("*.json"), key=_mtime)
+        for old in profiles[: max(len(profiles) - config["MAX_PROFILES"], 0)]:
+            old.unlink(missing_ok=True)
+            old.with_suffix(".folded").unlink(missing_ok=True)
+    return profile_id
+
+
+def recent():
+    """Metadata of the stored profiles, newest first."""
+    profiles = []
+    for path in _directory(profiling_settings()).glob("*.json"):
+        try:
+            profiles.append(json.loads(path.read_text()))
+        except (OSError, ValueError):  # Pruned by another worker meanwhile
+            continue
+    return sorted(profiles, key=lambda p: p["created_at"], reverse=True)
+
+
+def collapsed(profile_id):
+    """Collapsed stacks of a stored profile, or None."""
+    if not _ID.fullmatch(profile_id):
+        return None
+    path = _directory(profiling_settings()) / f"{profile_id}.folded"
+    try:
+        return path.read_text()
+    except OSError:
+        return None
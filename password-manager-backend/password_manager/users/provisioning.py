@@ -0,0 +1,206 @@
+import csv
+import io
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from rest_framework.validators import UniqueValidator
+
+from .models import CustomUser
+from .serializers import UserSignupSerializer
+
+# Bulk account provisioning shared by the `provision_users` command and the
+# admin endpoint. Rows are validated with the signup rules, uniqueness is
+# checked with a handful of IN queries instead of per row, passwords are
+# hashed in a process pool and accounts are inserted with bulk_create.
+
+FIELDS = ("username", "phone", "email", "password")
+UNIQUE_FIELDS = ("username", "phone", "email")
+
+
+class ProvisioningRowSerializer(UserSignupSerializer):
+    """
+    UserSignupSerializer without its per-row uniqueness queries; uniqueness is
+    checked for the whole file at once in `provision`.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        for field in fields.values():
+            field.validators = [
+                v for v in field.validators if not isinstance(v, UniqueValidator)
+            ]
+        # SignupView relies on an email being present
+        fields["email"].required = True
+        fields["email"].allow_blank = False
+        return fields
+
+
+def read_rows(stream, fmt):
+    """Yield dicts from a CSV (with header) or JSONL text stream."""
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+    elif fmt == "jsonl":
+        for number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Line {number}: invalid JSON ({e.msg}).") from e
+            if not isinstance(row, dict):
+                raise ValueError(f"Line {number}: expected a JSON object.")
+            yield row
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+
+def write_results(results, stream, fmt):
+    """Write per-row results as CSV or JSONL."""
+    if fmt == "csv":
+        writer = csv.DictWriter(
+            stream, fieldnames=["row", "username", "status", "id", "errors"]
+        )
+        writer.writeheader()
+        for result in results:
+            writer.writerow(
+                {**result, "errors": json.dumps(result.get("errors") or {})}
+            )
+    else:
+        for result in results:
+            stream.write(json.dumps(result) + "\n")
+
+
+def _hash(password):
+    return make_password(password)
+
+
+def _bulk_insert(users, batch_size):
+    """
+    Insert users in batches. A batch that hits a uniqueness race (a row created
+    concurrently after our checks) is retried row by row so only the
+    conflicting rows fail.
+    """
+    conflicts = set()
+    for start in range(0, len(users), batch_size):
+        batch = users[start : start + batch_size]
+        try:
+            with transaction.atomic():
+                CustomUser.objects.bulk_create(batch)
+        except IntegrityError:
+            for user in batch:
+                try:
+                    with transaction.atomic():
+                        user.save(force_insert=True)
+                except IntegrityError:
+                    user.pk = None
+                    conflicts.add(id(user))
+    return conflicts
+
+
+def hash_passwords(passwords, workers=None, executor_class=ProcessPoolExecutor):
+    """
+    Hash passwords in parallel. PBKDF2 releases the GIL, so request handlers
+    can pass ThreadPoolExecutor instead of forking worker processes.
+    """
+    if workers == 1 or len(passwords) < 2:
+        return [_hash(password) for password in passwords]
+    with executor_class(max_workers=workers) as pool:
+        return list(pool.map(_hash, passwords, chunksize=16))
+
+
+def provision(rows, workers=None, batch_size=500, executor_class=ProcessPoolExecutor):
+    """
+    Validate, hash and create accounts for `rows`; returns one result per row:
+    {"row", "username", "status": created|invalid|conflict, "id", "errors"}.
+    """
+    results, valid = [], []
+    seen = {field: {} for field in UNIQUE_FIELDS}
+
+    for number, row in enumerate(rows, start=1):
+        data = {field: (row.get(field) or "") for field in FIELDS}
+        result = {
+            "row": number,
+            "username": data["username"],
+            "status": "invalid",
+            "id": None,
+            "errors": None,
+        }
+        results.append(result)
+
+        serializer = ProvisioningRowSerializer(data=data)
+        if not serializer.is_valid():
+            result["errors"] = serializer.errors
+            continue
+
+        validated = serializer.validated_data
+        duplicates = {
+            field: [f"Duplicate of row {seen[field][validated[field]]} in this file."]
+            for field in UNIQUE_FIELDS
+            if validated[field] in seen[field]
+        }
+        if duplicates:
+            result["status"], result["errors"] = "conflict", duplicates
+            continue
+        for field in UNIQUE_FIELDS:
+            seen[field][validated[field]] = number
+        valid.append((result, validated))
+
+    # Existing accounts, looked up with one IN query per field and chunk
+    taken = {field: set() for field in UNIQUE_FIELDS}
+    for field in UNIQUE_FIELDS:
+        values = list(seen[field])
+        for start in range(0, len(values), 900):
+            chunk = values[start : start + 900]
+            taken[field].update(
+                CustomUser.objects.filter(**{f"{field}__in": chunk}).values_list(
+                    field, flat=True
+                )
+            )
+
+    pending = []
+    for result, validated in valid:
+        existing = {
+            field: ["An account with this value already exists."]
+            for field in UNIQUE_FIELDS
+            if validated[field] in taken[field]
+        }
+        if existing:
+            result["status"], result["errors"] = "conflict", existing
+        else:
+            pending.append((result, validated))
+
+    # Password hashing dominates the cost, so spread it over processes
+    hashes = hash_passwords(
+        [validated["password"] for _, validated in pending], workers, executor_class
+    )
+
+    users = [
+        CustomUser(
+            username=validated["username"],
+            phone=validated["phone"],
+            email=validated["email"],
+            password=password_hash,
+        )
+        for (_, validated), password_hash in zip(pending, hashes)
+    ]
+    conflicts = _bulk_insert(users, batch_size)
+
+    for (result, _), user in zip(pending, users):
+        if id(user) in conflicts:
+            result["status"] = "conflict"
+            result["errors"] = {
+                "non_field_errors": [
+                    "An account with these details was created concurrently."
+                ]
+            }
+        else:
+            result["status"], result["id"] = "created", user.pk
+    return results
+
+
+def provision_text(text, fmt, **kwargs):
+    """Convenience wrapper for uploaded file contents."""
+    return provision(read_rows(io.StringIO(text), fmt), **kwargs)
@@ -0,0 +1,51 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stock renderer
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Drop-in JSONRenderer backed by orjson.
+
+    Produces the same bytes as JSONRenderer for payloads made of strings,
+    integers, booleans, None, lists and dicts (which is what the vault
+    endpoints return). Pretty-printed or non-default JSON settings, and
+    environments without orjson, go through the stock renderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        renderer_context = renderer_context or {}
+        if (
+            orjson is None
+            or self.get_indent(accepted_media_type, renderer_context) is not None
+            or self.ensure_ascii
+            or not self.compact
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            option=orjson.OPT_NON_STR_KEYS,
+        )
+        # Match JSONRenderer, which always escapes U+2028 and U+2029.
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+                b"\xe2\x80\xa9", b"\\u2029"
+            )
+        return ret
+
+
+# Renderers for the read-heavy vault endpoints
+FAST_RENDERER_CLASSES = [FastJSONRenderer] + [
+    renderer
+    for renderer in api_settings.DEFAULT_RENDERER_CLASSES
+    if renderer is not JSONRenderer
+]
@@ -0,0 +1,295 @@
+import hashlib
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import NamedTuple
+
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import RevokedToken
+
+# JWT revocation without a per-request database lookup.
+#
+# Revoked keys live in the RevokedToken table until the tokens they cover
+# expire (`manage.py prune_revoked_tokens` deletes the rest). A key is a token
+# jti, a session id (the "sid" claim shared by a login's refresh and access
+# tokens across rotations) or "user:<id>", which revokes every token of the
+# user issued before `revoked_at`.
+#
+# Each worker keeps a sorted array of 64-bit key hashes plus the per-user
+# cutoffs in memory and checks tokens against it. Revocations made in the
+# worker apply immediately; other workers pick them up within SYNC_INTERVAL
+# through a small incremental query, and the arrays are rebuilt every
+# FULL_SYNC_INTERVAL so expired keys drop out.
+
+SESSION_CLAIM = "sid"
+USER_PREFIX = "user:"
+
+
+def revocation_settings():
+    config = getattr(settings, "TOKEN_REVOCATION", {})
+    return {
+        "SYNC_INTERVAL": config.get("SYNC_INTERVAL", 5),
+        "FULL_SYNC_INTERVAL": config.get("FULL_SYNC_INTERVAL", 3600),
+        # Incremental syncs re-read this many seconds before the last sync so
+        # rows committed late with an earlier timestamp are not missed
+        "SYNC_OVERLAP": config.get("SYNC_OVERLAP", 60),
+    }
+
+
+def key_hash(key):
+    return int.from_bytes(
+        hashlib.blake2b(key.encode(), digest_size=8).digest(), "little", signed=True
+    )
+
+
+class Revocations(NamedTuple):
+    hashes: np.ndarray  # Sorted key hashes as of the last full sync
+    recent: set  # Key hashes added since the last full sync
+    cutoffs: dict  # str(user id) -> earliest valid "iat" (POSIX seconds)
+
+
+def _add(state, key, revoked_at):
+    if key.startswith(USER_PREFIX):
+        user_id = key[len(USER_PREFIX) :]
+        # "iat" has whole-second resolution, so compare in whole seconds: a
+        # token issued later in the same second as the revocation stays
+        # valid (as does one issued earlier in that second).
+        cutoff = math.floor(revoked_at.timestamp())
+        state.cutoffs[user_id] = max(state.cutoffs.get(user_id, 0), cutoff)
+    else:
+        state.recent.add(key_hash(key))
+
+
+class RevocationCache:
+    """
+    Readers take no lock: they read `state` once, and a full sync builds a
+    new state aside and publishes it with a single assignment. Incremental
+    syncs and local revocations only add to the current state.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()  # Guards changes to `state`
+        self.sync_lock = threading.Lock()  # One sync at a time
+        self.reset()
+
+    def reset(self):
+        self.state = Revocations(np.empty(0, dtype=np.int64), set(), {})
+        self.pending = None  # Keys added while a full sync runs
+        self.pid = None
+        self.synced_at = None  # Wall clock time the last sync started
+        self.full_synced_at = None  # time.monotonic() of the last full sync
+        self.checked_at = None  # time.monotonic() of the last sync
+
+    def sync(self, full=False):
+        """Load revocations from the database; incremental unless `full`."""
+        with self.sync_lock:
+            self._sync(full)
+
+    def _sync(self, full):
+        if full:
+            with self.lock:
+                self.pending = []
+        now = timezone.now()
+        started = time.monotonic()
+        rows = RevokedToken.objects.filter(expires_at__gt=now)
+        if not full:
+            since = self.synced_at - timedelta(
+                seconds=revocation_settings()["SYNC_OVERLAP"]
+            )
+            rows = rows.filter(revoked_at__gte=since)
+        try:
+            rows = list(rows.values_list("key", "revoked_at"))
+        except BaseException:
+            with self.lock:
+                self.pending = None
+            raise
+
+        if full:
+            loaded = Revocations(np.empty(0, dtype=np.int64), set(), {})
+            for key, revoked_at in rows:
+                _add(loaded, key, revoked_at)
+            hashes = np.fromiter(loaded.recent, dtype=np.int64, count=len(loaded.recent))
+            fresh = loaded._replace(hashes=np.unique(hashes), recent=set())
+            with self.lock:
+                # Keys revoked here after the query started may not be in `rows`
+                for key, revoked_at in self.pending:
+                    _add(fresh, key, revoked_at)
+                self.pending = None
+                self.state = fresh
+                self.full_synced_at = started
+        else:
+            with self.lock:
+                for key, revoked_at in rows:
+                    _add(self.state, key, revoked_at)
+        self.pid = os.getpid()
+        self.synced_at = now
+        self.checked_at = started
+
+    def _due(self):
+        """The sync that is due ("full" or "incremental"), or None."""
+        config = revocation_settings()
+        now = time.monotonic()
+        if (
+            self.pid != os.getpid()
+            or self.full_synced_at is None
+            or now - self.full_synced_at >= config["FULL_SYNC_INTERVAL"]
+        ):
+            return "full"
+        if now - self.checked_at >= config["SYNC_INTERVAL"]:
+            return "incremental"
+        return None
+
+    def maybe_sync(self):
+        if self._due() is None:
+            return
+        # Without a state for this process (start-up, after a fork) wait for
+        # the sync; otherwise leave it to the thread already running one.
+        empty = self.pid != os.getpid() or self.full_synced_at is None
+        if not self.sync_lock.acquire(blocking=empty):
+            return
+        try:
+            due = self._due()  # Another thread may have just synced
+            if due is not None:
+                self._sync(full=due == "full")
+        finally:
+            self.sync_lock.release()
+
+    def contains(self, key, state=None):
+        state = state or self.state
+        digest = key_hash(key)
+        if digest in state.recent:
+            return True
+        index = np.searchsorted(state.hashes, digest)
+        return index < len(state.hashes) and state.hashes[index] == digest
+
+    def is_revoked(self, payload):
+        """True when a token payload is covered by a revocation."""
+        self.maybe_sync()
+        state = self.state
+        for claim in (api_settings.JTI_CLAIM, SESSION_CLAIM):
+            key = payload.get(claim)
+            if key and self.contains(key, state):
+                return True
+        # simplejwt stores the user id claim as a string
+        cutoff = state.cutoffs.get(str(payload.get(api_settings.USER_ID_CLAIM)))
+        return cutoff is not None and payload.get("iat", 0) < cutoff
+
+    def added(self, key, revoked_at):
+        with self.lock:
+            _add(self.state, key, revoked_at)
+            if self.pending is not None:
+                self.pending.append((key, revoked_at))
+
+
+cache = RevocationCache()
+
+
+def _expiry(payload):
+    return datetime.fromtimestamp(payload["exp"], tz=dt_timezone.utc)
+
+
+def session_expiry():
+    # Rotation keeps a session alive up to one refresh lifetime after its
+    # latest refresh, so a revoked session id is kept that long
+    return timezone.now() + api_settings.REFRESH_TOKEN_LIFETIME
+
+
+def revoke(key, user_id, expires_at):
+    """Revoke a jti or session id; returns False if it already was revoked."""
+    revoked_at = timezone.now()
+    try:
+        with transaction.atomic():
+            RevokedToken.objects.create(
+                key=key, user_id=user_id, revoked_at=revoked_at, expires_at=expires_at
+            )
+    except IntegrityError:
+        return False
+    cache.added(key, revoked_at)
+    return True
+
+
+def revoke_token(token):
+    """Revoke the session of a token, or just the token if it has none."""
+    payload = token.payload
+    user_id = payload.get(api_settings.USER_ID_CLAIM)
+    if payload.get(SESSION_CLAIM):
+        return revoke(payload[SESSION_CLAIM], user_id, session_expiry())
+    return revoke(payload[api_settings.JTI_CLAIM], user_id, _expiry(payload))
+
+
+def revoke_all(user):
+    """Revoke every token issued to `user` so far (logout from all sessions)."""
+    revoked_at = timezone.now()
+    # One upsert: repeated calls move the user's cutoff forward
+    RevokedToken.objects.bulk_create(
+        [
+            RevokedToken(
+                key=f"{USER_PREFIX}{user.pk}",
+                user=user,
+                revoked_at=revoked_at,
+                expires_at=session_expiry(),
+            )
+        ],
+        update_conflicts=True,
+        unique_fields=["key"],
+        update_fields=["revoked_at", "expires_at"],
+    )
+    cache.added(f"{USER_PREFIX}{user.pk}", revoked_at)
+
+
+def prune():
+    """Delete revocations whose tokens have all expired."""
+    deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+def tokens_for(user):
+    """A refresh token (and its access token) starting a new revocable session."""
+    refresh = RefreshToken.for_user(user)
+    refresh[SESSION_CLAIM] = refresh[api_settings.JTI_CLAIM]
+    return refresh
+
+
+class RevocableJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that rejects revoked access tokens."""
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if cache.is_revoked(token.payload):
+            raise InvalidToken({"detail": "Token has been revoked."})
+        return token
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh serializer for the stock TokenRefreshView (see
+    SIMPLE_JWT["TOKEN_REFRESH_SERIALIZER"]): rejects revoked refresh tokens
+    and, with ROTATE_REFRESH_TOKENS and BLACKLIST_AFTER_ROTATION, revokes the
+    presented token when handing out its replacement. The revocation insert
+    is the claim, so a token can be rotated only once even by concurrent
+    requests.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        if cache.is_revoked(refresh.payload):
+            raise InvalidToken({"detail": "Token has been revoked."})
+        if api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION:
+            if not revoke(
+                refresh[api_settings.JTI_CLAIM],
+                refresh.payload.get(api_settings.USER_ID_CLAIM),
+                _expiry(refresh.payload),
+            ):
+                raise InvalidToken({"detail": "Token has been revoked."})
+        return super().validate(attrs)
@@ -1,3 +1,4 @@
+from django.urls import reverse
 from rest_framework import serializers
 from .models import CustomUser, Password
 
@@ -55,14 +56,27 @@ class UserSerializer(serializers.ModelSerializer):
         ]  # Include only the fields needed for user details
 
 
+class VaultPasswordField(serializers.CharField):
+    """Accept plaintext on write; read back the decrypted value."""
+
+    def get_attribute(self, instance):
+        return instance.get_password()
+
+
 class PasswordSerializer(serializers.ModelSerializer):
+    password = VaultPasswordField(max_length=255)
+
     class Meta:
         model = Password
         fields = [
+            "id",
             "domain_name",
             "password",
             "link",
+            "version",
+            "updated_at",
         ]  # Fields for storing passwords and associated info
+        read_only_fields = ["id", "version", "updated_at"]
 
 
 class ImageUploadSerializer(serializers.ModelSerializer):
@@ -77,7 +91,12 @@ from .models import Image
 
 
 class ImageSerializer(serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
 
     class Meta:
         model = Image
-        fields = ["id", "image", "user"]
+        fields = ["id", "image", "user", "url"]
+
+    def get_url(self, obj):
+        """Authenticated download URL (see users.views.MediaView)."""
+        return reverse("protected_media", kwargs={"path": obj.image.name})
@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.core import signing
+from rest_framework.permissions import BasePermission
+
+# Short-lived step-up tokens: after a successful OTP or face verification the
+# client receives a signed token it can send in the X-Step-Up-Token header to
+# read the vault again without re-verifying. Tokens are bound to the user and
+# to the jti of the access token they were issued for, and carry a scope.
+
+HEADER = "X-Step-Up-Token"
+VAULT_READ = "vault:read"
+SALT = "users.stepup"
+
+
+def lifetime():
+    """Seconds a step-up token stays valid."""
+    return getattr(settings, "STEP_UP_TOKEN_LIFETIME", 300)
+
+
+def _access_jti(request):
+    token = getattr(request, "auth", None)
+    return token.get("jti") if token is not None else None
+
+
+def issue(request, scopes=(VAULT_READ,)):
+    """Return a step-up token for the authenticated request, or None without a JWT."""
+    jti = _access_jti(request)
+    if jti is None:
+        return None
+    return signing.dumps(
+        {"uid": request.user.pk, "jti": jti, "scp": list(scopes)},
+        salt=SALT,
+        compress=True,
+    )
+
+
+def attach(response, token):
+    """Expose a freshly issued token on a response."""
+    if token:
+        response[HEADER] = token
+        response["X-Step-Up-Expires-In"] = str(lifetime())
+    return response
+
+
+def has_scope(request, scope=VAULT_READ):
+    """True when the request carries a valid step-up token for `scope`."""
+    token = request.headers.get(HEADER)
+    if not token or not request.user or not request.user.is_authenticated:
+        return False
+    try:
+        claims = signing.loads(token, salt=SALT, max_age=lifetime())
+    except signing.BadSignature:
+        return False
+    return (
+        claims.get("uid") == request.user.pk
+        and claims.get("jti") == _access_jti(request)
+        and scope in claims.get("scp", [])
+    )
+
+
+class HasVaultStepUp(BasePermission):
+    """Allow vault reads only with a valid step-up token."""
+
+    message = "A valid step-up token is required. Verify with OTP or Face ID first."
+
+    def has_permission(self, request, view):
+        return has_scope(request, VAULT_READ)
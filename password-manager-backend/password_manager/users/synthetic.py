@@ -0,0 +1,101 @@
+import math
+import random
+import zlib
+
+from django.contrib.auth.hashers import make_password
+
+from . import health
+from .models import CustomUser, Password
+
+# Synthetic users and vaults for benchmarks and local load testing. Every
+# generated account shares DEFAULT_PASSWORD (hashed once) so data sets with
+# thousands of users can be created in seconds.
+
+DEFAULT_PASSWORD = "synthetic-password"
+DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+
+def vault_sizes(count, distribution="lognormal", mean=50, maximum=1000, rng=None):
+    """
+    Draw `count` vault sizes. "fixed" gives every user `mean` entries,
+    "uniform" draws from [0, 2 * mean] and "lognormal" gives the long tail
+    seen in real password managers (most vaults small, a few very large).
+    """
+    rng = rng or random.Random(0)
+    if distribution == "fixed":
+        sizes = [mean] * count
+    elif distribution == "uniform":
+        sizes = [rng.randint(0, 2 * mean) for _ in range(count)]
+    elif distribution == "lognormal":
+        sigma = 1.0
+        mu = math.log(max(mean, 1)) - sigma**2 / 2
+        sizes = [int(rng.lognormvariate(mu, sigma)) for _ in range(count)]
+    else:
+        raise ValueError(f"Unknown distribution: {distribution}")
+    return [min(size, maximum) for size in sizes]
+
+
+def generate(
+    users,
+    distribution="lognormal",
+    mean=50,
+    maximum=1000,
+    reuse=0.1,
+    seed=0,
+    prefix="synthetic",
+    batch_size=2000,
+):
+    """
+    Create `users` accounts with encrypted vaults and health summaries.
+
+    `reuse` is the share of entries that repeat one of the user's earlier
+    passwords. Returns the created users.
+    """
+    rng = random.Random(seed)
+    password_hash = make_password(DEFAULT_PASSWORD)
+    # Phone numbers must be unique and at most 15 digits: 5 from the prefix,
+    # 10 from the index.
+    phone_prefix = f"{zlib.crc32(prefix.encode()) % 10**5:05d}"
+
+    accounts = CustomUser.objects.bulk_create(
+        [
+            CustomUser(
+                username=f"{prefix}-{i}",
+                email=f"{prefix}-{i}@example.com",
+                phone=f"{phone_prefix}{i:010d}",
+                password=password_hash,
+            )
+            for i in range(users)
+        ],
+        batch_size=batch_size,
+    )
+
+    entries = []
+    for user, size in zip(
+        accounts, vault_sizes(users, distribution, mean, maximum, rng)
+    ):
+        plaintexts = []
+        for i in range(size):
+            if plaintexts and rng.random() < reuse:
+                plaintexts.append(rng.choice(plaintexts))
+            else:
+                plaintexts.append(f"{rng.getrandbits(64):016x}")
+        entries.extend(
+            Password(
+                user=user,
+                domain_name=f"site{i}.example.com",
+                password=plaintext,
+                link=f"https://site{i}.example.com/login",
+            )
+            for i, plaintext in enumerate(plaintexts)
+        )
+        if len(entries) >= batch_size:
+            Password.objects.bulk_create_encrypted(entries, batch_size=batch_size)
+            entries = []
+    Password.objects.bulk_create_encrypted(entries, batch_size=batch_size)
+
+    # bulk_create skips Password.save(), so fingerprints and summaries are
+    # computed afterwards.
+    for user in accounts:
+        health.rebuild(user.id, batch_size=batch_size)
+    return accounts
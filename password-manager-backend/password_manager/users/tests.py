@@ -1,3 +1,1875 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+from unittest import mock
+from pathlib import Path
 
-# Create your tests here.
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+import numpy as np
+from PIL import Image as PILImage
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import (
+    audit,
+    breach,
+    enrollment,
+    face_models,
+    faces,
+    fastpath,
+    health,
+    history,
+    metrics,
+    revocation,
+    synthetic,
+    throttling,
+    vault,
+)
+from .models import (
+    CustomUser,
+    EnrollmentJob,
+    IdempotencyKey,
+    Image,
+    Password,
+    PasswordVersion,
+    VaultHealth,
+)
+from .serializers import PasswordSerializer
+
+FACE_IMAGE = Path(settings.BASE_DIR) / "media" / "images" / "20250401161718_face.png"
+VAULT_SIZE = 300
+IMAGES_PER_USER = 3
+
+
+class _CountingCursor:
+    """DB-API cursor proxy that counts the rows handed back to Django."""
+
+    def __init__(self, cursor, record):
+        self._cursor = cursor
+        self._record = record
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._record["rows"] += 1
+            yield row
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._record["rows"] += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._record["rows"] += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._record["rows"] += len(rows)
+        return rows
+
+
+class QueryBudgetMixin:
+    """Assert the exact number of queries and the rows fetched by a block."""
+
+    @contextmanager
+    def assertQueryBudget(self, queries, max_rows):
+        executed = []
+
+        def wrapper(execute, sql, params, many, context):
+            record = {"sql": sql, "rows": 0}
+            executed.append(record)
+            result = execute(sql, params, many, context)
+            context["cursor"].cursor = _CountingCursor(context["cursor"].cursor, record)
+            return result
+
+        with connection.execute_wrapper(wrapper):
+            yield executed
+
+        rows = sum(record["rows"] for record in executed)
+        if len(executed) != queries or rows > max_rows:
+            listing = "\n".join(
+                f"  {i}. [{record['rows']} rows] {record['sql']}"
+                for i, record in enumerate(executed, start=1)
+            )
+            self.fail(
+                f"Query budget exceeded: {len(executed)} queries (budget {queries}), "
+                f"{rows} rows fetched (budget {max_rows}).\n{listing}"
+            )
+
+
+@override_settings(
+    EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    ADMISSION_CONTROL={},
+    BREACH_INDEX_PATH="",
+    AUDIT_LOG={"BUFFER_SIZE": 10000, "FLUSH_INTERVAL": 0},
+    TOKEN_REVOCATION={"SYNC_INTERVAL": 3600},
+)
+class EndpointQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Pins the SQL cost of every endpoint in users/urls.py against users with
+    large vaults and several enrolled images, so N+1 queries and extra
+    round-trips fail loudly with the offending SQL listed.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        vault._data_keys.clear()
+        face = FACE_IMAGE.read_bytes()
+        cls.users = []
+        for n in range(3):
+            user = CustomUser.objects.create_user(
+                username=f"user{n}",
+                email=f"user{n}@example.com",
+                phone=f"55500000{n:02d}",
+                password="correct-horse-battery",
+            )
+            Password.objects.bulk_create_encrypted(
+                [
+                    Password(
+                        user=user,
+                        domain_name=f"site{i}.example.com",
+                        password=f"secret-{n}-{i}",
+                        link=f"https://site{i}.example.com/",
+                    )
+                    for i in range(VAULT_SIZE)
+                ]
+            )
+            health.rebuild(user.id)
+            for i in range(IMAGES_PER_USER):
+                Image(user=user, image=ContentFile(face, name=f"face{i}.png")).save()
+            cls.users.append(user)
+        cls.user = cls.users[0]
+
+    def setUp(self):
+        vault._data_keys.clear()
+        audit.buffer.clear()
+        cache.clear()
+        revocation.cache.reset()
+        revocation.cache.sync(full=True)
+        self.client = APIClient()
+        self.refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {self.refresh.access_token}"
+        )
+
+    def tearDown(self):
+        audit.buffer.clear()
+
+    def face_upload(self):
+        return ContentFile(FACE_IMAGE.read_bytes(), name="face.png")
+
+    def test_signup(self):
+        client = APIClient()
+        payload = {
+            "username": "newbie",
+            "phone": "5551234567",
+            "email": "newbie@example.com",
+            "password": "correct-horse-battery",
+        }
+        with self.assertQueryBudget(queries=4, max_rows=1):
+            response = client.post("/api/users/signup/", payload, format="json")
+        self.assertEqual(response.status_code, 201)
+
+    def test_login(self):
+        client = APIClient()
+        payload = {"email": self.user.email, "password": "correct-horse-battery"}
+        with self.assertQueryBudget(queries=1, max_rows=1):
+            response = client.post("/api/users/login/", payload, format="json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_me(self):
+        with self.assertQueryBudget(queries=1, max_rows=1):
+            response = self.client.get("/api/users/me/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_bootstrap(self):
+        with self.assertQueryBudget(queries=2, max_rows=2):
+            response = self.client.get("/api/users/bootstrap/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["vault"]["count"], VAULT_SIZE)
+        self.assertTrue(response.data["face_id"]["enrolled"])
+        self.assertGreater(response.data["token"]["expires_in"], 0)
+
+        # Cached summary, then a revalidation
+        with self.assertQueryBudget(queries=1, max_rows=1):
+            response = self.client.get("/api/users/bootstrap/")
+        self.assertEqual(response.status_code, 200)
+        with self.assertQueryBudget(queries=1, max_rows=1):
+            response = self.client.get(
+                "/api/users/bootstrap/", HTTP_IF_NONE_MATCH=response["ETag"]
+            )
+        self.assertEqual(response.status_code, 304)
+
+        # A vault write bumps the version
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                "/api/users/add_password/",
+                {
+                    "domain_name": "new.example.com",
+                    "password": "s3cret!",
+                    "link": "https://new.example.com/",
+                },
+                format="json",
+            )
+        response = self.client.get("/api/users/bootstrap/")
+        self.assertEqual(response.data["vault"]["count"], VAULT_SIZE + 1)
+
+    def test_bootstrap_counts_entries_without_vault_health(self):
+        user = self.users[1]
+        VaultHealth.objects.filter(user=user).delete()
+        Password.objects.bulk_create_encrypted(
+            [Password(user=user, domain_name="bulk.example.com", password="x", link="")]
+        )
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}"
+        )
+        with self.assertQueryBudget(queries=2, max_rows=2):
+            response = client.get("/api/users/bootstrap/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["vault"]["count"], VAULT_SIZE + 1)
+
+    def test_token_refresh(self):
+        client = APIClient()
+        with self.assertQueryBudget(queries=4, max_rows=2):
+            response = client.post(
+                "/api/users/token/refresh/",
+                {"refresh": str(self.refresh)},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("refresh", response.data)
+
+        # The rotated-out token cannot be used again
+        response = client.post(
+            "/api/users/token/refresh/", {"refresh": str(self.refresh)}, format="json"
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_logout(self):
+        refresh = revocation.tokens_for(self.user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+        with self.assertQueryBudget(queries=4, max_rows=2):
+            response = client.post("/api/users/logout/")
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(client.get("/api/users/me/").status_code, 401)
+        response = client.post(
+            "/api/users/token/refresh/", {"refresh": str(refresh)}, format="json"
+        )
+        self.assertEqual(response.status_code, 401)
+        # Other sessions are unaffected
+        self.assertEqual(self.client.get("/api/users/me/").status_code, 200)
+
+    def test_logout_all(self):
+        # The cutoff has whole-second resolution, like "iat": log out a second
+        # after the tokens from setUp() were issued
+        later = timezone.now() + timedelta(seconds=1)
+        with self.assertQueryBudget(queries=2, max_rows=2), mock.patch.object(
+            revocation.timezone, "now", return_value=later
+        ):
+            response = self.client.post("/api/users/logout-all/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get("/api/users/me/").status_code, 401)
+
+        # Another worker learns about it on its next sync
+        revocation.cache.reset()
+        response = APIClient().post(
+            "/api/users/token/refresh/", {"refresh": str(self.refresh)}, format="json"
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_send_otp_email_first_time(self):
+        with self.assertQueryBudget(queries=3, max_rows=1):
+            response = self.client.get("/api/users/send-otp-email/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_send_otp_email_again(self):
+        self.client.get("/api/users/send-otp-email/")
+        with self.assertQueryBudget(queries=2, max_rows=1):
+            response = self.client.get("/api/users/send-otp-email/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_verify_otp_lists_vault(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(otp_generated="123456")
+        with self.assertQueryBudget(queries=3, max_rows=2 + VAULT_SIZE):
+            response = self.client.get("/api/users/verify-otp/", {"otp": "123456"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), VAULT_SIZE)
+
+    def test_verify_otp_rejects_bad_otp(self):
+        with self.assertQueryBudget(queries=1, max_rows=1):
+            response = self.client.get("/api/users/verify-otp/", {"otp": "000000"})
+        self.assertEqual(response.status_code, 400)
+
+    def step_up_token(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(otp_generated="123456")
+        response = self.client.get("/api/users/verify-otp/", {"otp": "123456"})
+        return response["X-Step-Up-Token"]
+
+    def test_verify_otp_with_step_up_token(self):
+        token = self.step_up_token()
+        with self.assertQueryBudget(queries=2, max_rows=1 + VAULT_SIZE):
+            response = self.client.get(
+                "/api/users/verify-otp/", HTTP_X_STEP_UP_TOKEN=token
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), VAULT_SIZE)
+
+    def test_list_passwords(self):
+        token = self.step_up_token()
+        with self.assertQueryBudget(queries=2, max_rows=1 + VAULT_SIZE):
+            response = self.client.get(
+                "/api/users/passwords/", HTTP_X_STEP_UP_TOKEN=token
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), VAULT_SIZE)
+
+    @override_settings(TIME_ZONE="Asia/Kolkata")
+    def test_list_passwords_matches_serializer(self):
+        Password.objects.bulk_create_encrypted(
+            [
+                Password(user=self.user, domain_name="", password="", link=""),
+                Password(
+                    user=self.user,
+                    domain_name="exämple.com\u2028line",
+                    password='p"ss\\wörd 🔑',
+                    link="https://exämple.com/?q=1&r=2",
+                ),
+            ]
+        )
+        token = self.step_up_token()
+        response = self.client.get("/api/users/passwords/", HTTP_X_STEP_UP_TOKEN=token)
+        self.assertEqual(response.status_code, 200)
+
+        expected = JSONRenderer().render(
+            PasswordSerializer(Password.objects.filter(user=self.user), many=True).data
+        )
+        self.assertEqual(response.content, expected)
+        self.assertIn(b"+05:30", response.content)
+
+        # Null datetimes render as null, as DateTimeField does
+        convert = fastpath.datetime_converter(timezone.get_current_timezone())
+        self.assertIsNone(convert(None))
+        self.assertIsNone(serializers.DateTimeField().to_representation(None))
+
+    def test_list_passwords_requires_step_up(self):
+        with self.assertQueryBudget(queries=1, max_rows=1):
+            response = self.client.get("/api/users/passwords/")
+        self.assertEqual(response.status_code, 403)
+
+    def test_add_password(self):
+        payload = {
+            "domain_name": "new.example.com",
+            "password": "hunter2",
+            "link": "https://new.example.com/",
+        }
+        # INSERT, then UPDATE with the ciphertext bound to the new pk; the
+        # health counters count the entries sharing the new fingerprint
+        with self.assertQueryBudget(queries=9, max_rows=5):
+            response = self.client.post(
+                "/api/users/add_password/", payload, format="json"
+            )
+        self.assertEqual(response.status_code, 201)
+
+    def test_add_password_idempotency_key(self):
+        payload = {
+            "domain_name": "new.example.com",
+            "password": "hunter2",
+            "link": "https://new.example.com/",
+        }
+        headers = {"HTTP_IDEMPOTENCY_KEY": "add-1"}
+        with self.assertQueryBudget(queries=13, max_rows=6):
+            first = self.client.post(
+                "/api/users/add_password/", payload, format="json", **headers
+            )
+        self.assertEqual(first.status_code, 201)
+
+        # No secret is persisted with the key: the stored body leaves the
+        # plaintext out and the request fingerprint is keyed
+        record = IdempotencyKey.objects.filter(user=self.user, key="add-1")
+        self.assertNotIn("hunter2", repr(list(record.values())))
+        self.assertIsNone(record.get().response_body["password"])
+        unkeyed = hashlib.sha256(
+            b"POST /api/users/add_password/\0"
+            + json.dumps(payload, sort_keys=True).encode()
+            + b"\0"
+        ).hexdigest()
+        self.assertNotEqual(record.get().fingerprint, unkeyed)
+
+        # A retry gets the stored response without writing again; the
+        # plaintext is decrypted from the entry
+        with self.assertQueryBudget(queries=7, max_rows=3):
+            retry = self.client.post(
+                "/api/users/add_password/", payload, format="json", **headers
+            )
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(
+            Password.objects.filter(
+                user=self.user, domain_name="new.example.com"
+            ).count(),
+            1,
+        )
+
+        response = self.client.post(
+            "/api/users/add_password/",
+            {**payload, "password": "other"},
+            format="json",
+            **headers,
+        )
+        self.assertEqual(response.status_code, 422)
+
+        # Once the entry changed, a replay no longer returns a password
+        entry = Password.objects.get(pk=first.data["id"])
+        entry.password = "rotated"
+        entry.save()
+        retry = self.client.post(
+            "/api/users/add_password/", payload, format="json", **headers
+        )
+        self.assertEqual(retry.status_code, 201)
+        self.assertIsNone(retry.data["password"])
+
+    def test_send_otp_email_idempotency_key(self):
+        for _ in range(2):
+            response = self.client.get(
+                "/api/users/send-otp-email/", HTTP_IDEMPOTENCY_KEY="otp-1"
+            )
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_batch_passwords(self):
+        entries = list(Password.objects.filter(user=self.user).order_by("pk")[:200])
+        operations = [
+            {"op": "update", "id": e.pk, "version": e.version, "password": "rotated"}
+            for e in entries[:150]
+        ]
+        operations += [
+            {"op": "delete", "id": e.pk, "version": e.version} for e in entries[150:]
+        ]
+        operations += [
+            {
+                "op": "create",
+                "domain_name": f"bulk{i}.example.com",
+                "password": f"bulk-{i}",
+                "link": "https://bulk.example.com/",
+            }
+            for i in range(50)
+        ]
+        # Updates also archive 150 versions (two INSERTs under SQLite's
+        # variable limit); deletes collect the entries to cascade their history;
+        # creates get their pk-bound ciphertexts in one UPDATE after the INSERT;
+        # health counts the 51 fingerprints that changed in one grouped query
+        with self.assertQueryBudget(queries=19, max_rows=504):
+            response = self.client.post(
+                "/api/users/passwords/batch/", {"operations": operations}, format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            PasswordVersion.objects.filter(entry__in=entries[:150]).count(), 150
+        )
+
+    def vault_state(self):
+        return (
+            sorted(Password.objects.filter(user=self.user).values_list("pk", "version", "password")),
+            PasswordVersion.objects.filter(user=self.user).count(),
+            health.report(self.user.id)["total"],
+        )
+
+    def mixed_batch(self, stale_version):
+        first, second, third = Password.objects.filter(user=self.user).order_by("pk")[:3]
+        return [
+            {"op": "create", "domain_name": "new.example.com", "password": "x", "link": "https://new.example.com/"},
+            {"op": "update", "id": first.pk, "version": first.version, "password": "rotated"},
+            {"op": "delete", "id": second.pk, "version": second.version},
+            {"op": "update", "id": third.pk, "version": stale_version, "domain_name": "late.example.com"},
+        ], third
+
+    def test_batch_passwords_atomic_conflict_rolls_back(self):
+        before = self.vault_state()
+        operations, third = self.mixed_batch(stale_version=99)
+        response = self.client.post(
+            "/api/users/passwords/batch/",
+            {"operations": operations, "atomic": True},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(response.data["applied"])
+        statuses = [result["status"] for result in response.data["results"]]
+        self.assertEqual(statuses, ["skipped", "skipped", "skipped", "conflict"])
+        conflict = response.data["results"][3]
+        self.assertEqual(conflict["id"], third.pk)
+        self.assertNotEqual(third.version, 99)
+        self.assertEqual(conflict["current"]["version"], third.version)
+        self.assertEqual(self.vault_state(), before)
+
+    def test_batch_passwords_atomic_invalid_item_rolls_back(self):
+        before = self.vault_state()
+        operations, _ = self.mixed_batch(stale_version=None)
+        operations[3] = {"op": "update", "id": operations[3]["id"], "version": 1, "link": "not a url"}
+        response = self.client.post(
+            "/api/users/passwords/batch/",
+            {"operations": operations, "atomic": True},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["results"][3]["status"], "invalid")
+        self.assertEqual(self.vault_state(), before)
+
+    def test_batch_passwords_partial_applies_valid_items(self):
+        operations, third = self.mixed_batch(stale_version=99)
+        response = self.client.post(
+            "/api/users/passwords/batch/", {"operations": operations}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data["applied"])
+        statuses = [result["status"] for result in response.data["results"]]
+        self.assertEqual(statuses, ["created", "updated", "deleted", "conflict"])
+        third.refresh_from_db()
+        self.assertEqual(third.domain_name, "site2.example.com")
+        self.assertEqual(health.report(self.user.id)["total"], VAULT_SIZE)
+
+    def test_password_history(self):
+        entry = Password.objects.filter(user=self.user).order_by("pk").first()
+        for change in [
+            {"password": "rotated-1"},
+            {"domain_name": "renamed.example.com"},
+            {"password": "rotated-2", "link": "https://renamed.example.com/"},
+        ]:
+            response = self.client.post(
+                "/api/users/passwords/batch/",
+                {
+                    "operations": [
+                        {"op": "update", "id": entry.pk, "version": entry.version, **change}
+                    ]
+                },
+                format="json",
+            )
+            self.assertEqual(response.status_code, 200)
+            entry.refresh_from_db()
+        # Renaming stored only the old domain, not another ciphertext
+        self.assertIsNone(entry.versions.get(version=2).password)
+
+        token = self.step_up_token()
+        with self.assertQueryBudget(queries=3, max_rows=5):
+            response = self.client.get(
+                f"/api/users/passwords/{entry.pk}/history/",
+                HTTP_X_STEP_UP_TOKEN=token,
+            )
+        self.assertEqual(response.status_code, 200)
+        versions = response.data["versions"]
+        self.assertEqual([v["version"] for v in versions], [3, 2, 1])
+        self.assertEqual(
+            [(v["password"], v["domain_name"]) for v in versions],
+            [
+                ("rotated-1", "renamed.example.com"),
+                ("rotated-1", "site0.example.com"),
+                ("secret-0-0", "site0.example.com"),
+            ],
+        )
+
+        with self.assertQueryBudget(queries=12, max_rows=8):
+            response = self.client.post(
+                f"/api/users/passwords/{entry.pk}/history/1/restore/",
+                {"version": 4},
+                format="json",
+                HTTP_X_STEP_UP_TOKEN=token,
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["version"], 5)
+        entry.refresh_from_db()
+        self.assertEqual(entry.domain_name, "site0.example.com")
+        self.assertEqual(entry.get_password(), "secret-0-0")
+        self.assertEqual(entry.versions.count(), 4)
+
+        response = self.client.post(
+            f"/api/users/passwords/{entry.pk}/history/1/restore/",
+            {"version": 4},
+            format="json",
+            HTTP_X_STEP_UP_TOKEN=token,
+        )
+        self.assertEqual(response.status_code, 409)
+
+    def test_breach_scan(self):
+        with self.assertQueryBudget(queries=1, max_rows=1):
+            response = self.client.get("/api/users/breach-scan/")
+        self.assertEqual(response.status_code, 503)
+
+    def test_vault_health(self):
+        # Counters, then the reused/weak/stale entries (none in this vault)
+        with self.assertQueryBudget(queries=3, max_rows=2):
+            response = self.client.get("/api/users/vault-health/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_provision_users(self):
+        admin = CustomUser.objects.create_user(
+            username="admin",
+            email="admin@example.com",
+            phone="5559999999",
+            password="correct-horse-battery",
+            is_staff=True,
+        )
+        client = APIClient()
+        client.force_authenticate(admin)
+        lines = ["username,phone,email,password"]
+        lines += [
+            f"bulk{i},555-700-{i:04d},Bulk{i}@Example.com,correct-horse-{i}"
+            for i in range(8)
+        ]
+        lines += [
+            "bulk0,5557770000,other@example.com,correct-horse",  # duplicate in file
+            f"taken,5557771111,{self.user.email},correct-horse",  # existing email
+            "short,123,short@example.com,short",  # invalid
+        ]
+        upload = ContentFile("\n".join(lines).encode(), name="users.csv")
+        with self.assertQueryBudget(queries=6, max_rows=9):
+            response = client.post(
+                "/api/users/admin/provision/", {"file": upload}, format="multipart"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data["summary"], {"created": 8, "conflict": 2, "invalid": 1}
+        )
+        self.assertTrue(
+            CustomUser.objects.get(email="bulk3@example.com").check_password(
+                "correct-horse-3"
+            )
+        )
+
+    def test_provision_users_rejects_non_object_lines(self):
+        admin = CustomUser.objects.create_user(
+            username="admin",
+            email="admin@example.com",
+            phone="5559999999",
+            is_staff=True,
+        )
+        client = APIClient()
+        client.force_authenticate(admin)
+        row = {
+            "username": "bulk",
+            "phone": "5557000000",
+            "email": "bulk@example.com",
+            "password": "correct-horse-battery",
+        }
+        for line in ['["bulk"]', '"bulk"', "42"]:
+            text = f"{json.dumps(row)}\n{line}\n"
+            upload = ContentFile(text.encode(), name="users.jsonl")
+            response = client.post(
+                "/api/users/admin/provision/", {"file": upload}, format="multipart"
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(
+                response.data["error"], "Line 2: expected a JSON object."
+            )
+
+            path = Path(tempfile.mkdtemp()) / "users.jsonl"
+            self.addCleanup(shutil.rmtree, path.parent, ignore_errors=True)
+            path.write_text(text)
+            with self.assertRaisesMessage(CommandError, "Line 2: expected a JSON object."):
+                call_command("provision_users", str(path), "--workers=1")
+        self.assertFalse(CustomUser.objects.filter(username="bulk").exists())
+
+    def test_audit_events_are_written_in_one_batch(self):
+        self.client.get("/api/users/send-otp-email/")
+        self.client.get("/api/users/verify-otp/", {"otp": "000000"})
+        self.client.post(
+            "/api/users/add_password/",
+            {
+                "domain_name": "a.example.com",
+                "password": "hunter2",
+                "link": "https://a.example.com/",
+            },
+            format="json",
+        )
+        self.assertEqual(len(audit.buffer), 3)
+        with self.assertQueryBudget(queries=1, max_rows=3):
+            self.assertEqual(audit.flush(), 3)
+
+    def test_audit_log(self):
+        for _ in range(20):
+            audit.emit(audit.VAULT_READ, user=self.user, via="otp", entries=VAULT_SIZE)
+        audit.emit(audit.VAULT_READ, user=self.users[1], via="otp", entries=1)
+        audit.flush()
+        with self.assertQueryBudget(queries=2, max_rows=21):
+            response = self.client.get("/api/users/audit-log/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 20)
+
+    def test_admin_metrics(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(is_staff=True)
+        self.client.get("/api/users/me/")
+        with self.assertQueryBudget(queries=1, max_rows=1):
+            response = self.client.get("/api/users/admin/metrics/")
+        self.assertEqual(response.status_code, 200)
+        names = {row["name"] for row in response.data["summaries"]}
+        self.assertIn("http.memory.rss_delta_bytes", names)
+
+    def test_profiling(self):
+        profiles = Path(self.media_root) / "profiles"
+        config = {"ENABLED": True, "TOKENS": ["let-me-profile"], "DIRECTORY": profiles}
+        with override_settings(PROFILING=config):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.refresh.access_token}")
+            # Not staff and no allowlisted value: served, but not profiled
+            response = client.get("/api/users/vault-health/", HTTP_X_PROFILE="1")
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("X-Profile-Id", response)
+
+            with self.assertQueryBudget(queries=3, max_rows=2):
+                response = client.get(
+                    "/api/users/vault-health/", HTTP_X_PROFILE="let-me-profile"
+                )
+            self.assertEqual(response.status_code, 200)
+            profile_id = response["X-Profile-Id"]
+
+            CustomUser.objects.filter(pk=self.user.pk).update(is_staff=True)
+            with self.assertQueryBudget(queries=1, max_rows=1):
+                response = client.get("/api/users/admin/profiles/")
+            self.assertEqual(response.status_code, 200)
+            [profile] = response.data["profiles"]
+            self.assertEqual(profile["id"], profile_id)
+            self.assertEqual(profile["endpoint"], "vault_health")
+            self.assertEqual(profile["requested_by"], "token")
+
+            response = client.get(f"/api/users/admin/profiles/{profile_id}/")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Type"], "text/plain; charset=utf-8")
+            response = client.get("/api/users/admin/profiles/..%2Fsecret/")
+            self.assertEqual(response.status_code, 404)
+
+    def test_memory_budget_rejects_without_headroom(self):
+        config = {
+            "RSS_LIMIT_MB": 1,
+            "BUDGETS": {"verify_face_id": {"peak_mb": 200, "action": "reject"}},
+        }
+        with override_settings(MEMORY_PROFILING=config):
+            with self.assertQueryBudget(queries=0, max_rows=0):
+                response = self.client.post(
+                    "/api/users/verify-face-id/",
+                    {"image": self.face_upload()},
+                    format="multipart",
+                )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "5")
+
+    def admin_client(self):
+        admin_user = CustomUser.objects.create_superuser(
+            username="root",
+            email="root@example.com",
+            phone="5559990000",
+            password="correct-horse-battery",
+        )
+        client = APIClient()
+        client.force_login(admin_user)
+        return client
+
+    def test_admin_changelists(self):
+        client = self.admin_client()
+        for url, search in (
+            ("/admin/users/customuser/", "user1@example.com"),
+            ("/admin/users/image/", "user1"),
+            ("/admin/users/password/", "user1"),
+        ):
+            with self.assertQueryBudget(queries=4, max_rows=53):
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            with self.assertQueryBudget(queries=4, max_rows=53):
+                response = client.get(url, {"q": search})
+            self.assertEqual(response.status_code, 200)
+            self.assertGreater(response.context["cl"].result_count, 0)
+
+    def test_admin_bulk_actions(self):
+        client = self.admin_client()
+        CustomUser.objects.update(otp_generated="123456")
+        selected = [str(user.pk) for user in self.users]
+        with self.assertQueryBudget(queries=5, max_rows=6):
+            response = client.post(
+                "/admin/users/customuser/",
+                {"action": "reset_otp_state", "_selected_action": selected},
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(
+            CustomUser.objects.filter(
+                pk__in=selected, otp_generated__isnull=False
+            ).exists()
+        )
+
+        # Other tests read the files of the first two users
+        purged = self.users[2]
+        with self.assertQueryBudget(queries=9, max_rows=13):
+            response = client.post(
+                "/admin/users/customuser/",
+                {"action": "purge_face_enrollments", "_selected_action": [purged.pk]},
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Image.objects.filter(user=purged).exists())
+        self.assertTrue(Image.objects.exists())
+
+    def test_image_list(self):
+        with self.assertQueryBudget(queries=2, max_rows=2):
+            response = self.client.get("/api/users/image/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_protected_media(self):
+        image = Image.objects.filter(user=self.user).first()
+        url = f"/api/users/media/{image.image.name}"
+        with self.assertQueryBudget(queries=2, max_rows=2):
+            response = self.client.get(url, HTTP_RANGE="bytes=0-99")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(len(b"".join(response.streaming_content)), 100)
+
+        with self.assertQueryBudget(queries=2, max_rows=2):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_protected_media_of_other_user(self):
+        image = Image.objects.filter(user=self.users[1]).first()
+        with self.assertQueryBudget(queries=2, max_rows=1):
+            response = self.client.get(f"/api/users/media/{image.image.name}")
+        self.assertEqual(response.status_code, 404)
+
+    def test_image_upload(self):
+        with self.assertQueryBudget(queries=5, max_rows=2 + IMAGES_PER_USER):
+            response = self.client.post(
+                "/api/users/image-upload/",
+                {"image": self.face_upload()},
+                format="multipart",
+            )
+        self.assertEqual(response.status_code, 201)
+
+    def test_image_upload_idempotency_key(self):
+        headers = {"HTTP_IDEMPOTENCY_KEY": "enroll-1"}
+        first = self.client.post(
+            "/api/users/image-upload/",
+            {"image": self.face_upload()},
+            format="multipart",
+            **headers,
+        )
+        self.assertEqual(first.status_code, 201)
+        with self.assertQueryBudget(queries=6, max_rows=2):
+            retry = self.client.post(
+                "/api/users/image-upload/",
+                {"image": self.face_upload()},
+                format="multipart",
+                **headers,
+            )
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(Image.objects.filter(user=self.user).count(), 1)
+
+    def test_verify_face_id_burst(self):
+        blank = io.BytesIO()
+        PILImage.new("RGB", (64, 64), "white").save(blank, format="PNG")
+        frames = [ContentFile(blank.getvalue(), name="blank.png")]
+        frames += [self.face_upload() for _ in range(3)]
+        with self.assertQueryBudget(queries=2, max_rows=2):
+            response = self.client.post(
+                "/api/users/verify-face-id/", {"image": frames}, format="multipart"
+            )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post(
+            "/api/users/verify-face-id/",
+            {"image": [ContentFile(blank.getvalue(), name="blank.png")]},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data["error"], "No face detected in the uploaded image."
+        )
+
+    def test_verify_face_id_probe_cache(self):
+        metrics.reset()
+        self.client.post(
+            "/api/users/verify-face-id/",
+            {"image": self.face_upload()},
+            format="multipart",
+        )
+        # A resent identical frame gets the cached decision and is flagged
+        with self.assertQueryBudget(queries=2, max_rows=2):
+            response = self.client.post(
+                "/api/users/verify-face-id/",
+                {"image": self.face_upload()},
+                format="multipart",
+            )
+        self.assertEqual(response.status_code, 200)
+
+        # A re-encoded copy of the accepted frame is a near duplicate
+        recompressed = io.BytesIO()
+        PILImage.open(FACE_IMAGE).convert("RGB").save(
+            recompressed, format="JPEG", quality=80
+        )
+        response = self.client.post(
+            "/api/users/verify-face-id/",
+            {"image": ContentFile(recompressed.getvalue(), name="face.jpg")},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, 200)
+
+        reasons = [
+            event.metadata["reason"]
+            for event in audit.buffer.events
+            if event.action == audit.FACE_REPLAY_SUSPECTED
+        ]
+        self.assertEqual(reasons, ["exact", "near_duplicate"])
+        snapshot = metrics.snapshot()
+        lookups = {
+            row["labels"]["result"]: row["value"]
+            for row in snapshot["counters"]
+            if row["name"] == "face.probe_cache.lookups"
+        }
+        self.assertEqual(lookups, {"hit": 1, "miss": 2})
+        self.assertIn(
+            "face.probe_cache.hit_ratio", [row["name"] for row in snapshot["gauges"]]
+        )
+
+        with self.settings(FACE_PROBE_CACHE={"REJECT_REPLAYS": True}):
+            response = self.client.post(
+                "/api/users/verify-face-id/",
+                {"image": self.face_upload()},
+                format="multipart",
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn("step_up_token", response.data)
+
+    def test_image_upload_async(self):
+        with self.assertQueryBudget(queries=2, max_rows=2):
+            response = self.client.post(
+                "/api/users/image-upload/?async=1",
+                {"image": self.face_upload()},
+                format="multipart",
+            )
+        self.assertEqual(response.status_code, 202)
+        job_id = response.data["job_id"]
+
+        self.assertTrue(enrollment.process_job(job_id))
+        with self.assertQueryBudget(queries=2, max_rows=2):
+            response = self.client.get(response["Location"], {"wait": 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["status"], EnrollmentJob.SUCCEEDED)
+        self.assertTrue(response.data["image_url"].startswith("images/"))
+
+    def test_image_upload_async_failure_keeps_validation_message(self):
+        blank = io.BytesIO()
+        PILImage.new("RGB", (64, 64), "white").save(blank, format="PNG")
+
+        def upload():
+            return ContentFile(blank.getvalue(), name="blank.png")
+
+        response = self.client.post(
+            "/api/users/image-upload/", {"image": upload()}, format="multipart"
+        )
+        self.assertEqual(response.status_code, 400)
+        message = response.data["error"]
+
+        response = self.client.post(
+            "/api/users/image-upload/?async=1", {"image": upload()}, format="multipart"
+        )
+        enrollment.process_job(response.data["job_id"])
+        job = self.client.get(response["Location"]).data
+        self.assertEqual(job["status"], EnrollmentJob.FAILED)
+        self.assertEqual(job["error"], message)
+
+    def test_verify_face_id(self):
+        with self.assertQueryBudget(queries=2, max_rows=2):
+            response = self.client.post(
+                "/api/users/verify-face-id/",
+                {"image": self.face_upload()},
+                format="multipart",
+            )
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    AUDIT_LOG={"BUFFER_SIZE": 10000, "FLUSH_INTERVAL": 0},
+)
+class AdmissionControlTests(TestCase):
+    """Token buckets and the face processing gate shed load with 429s."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            username="victim",
+            email="victim@example.com",
+            phone="5550001111",
+            password="correct-horse-battery",
+        )
+
+    def setUp(self):
+        cache.clear()
+        audit.buffer.clear()
+        self.now = 1_000_000.0
+        timer = mock.patch.object(
+            throttling.TokenBucketThrottle, "timer", lambda _: self.now
+        )
+        timer.start()
+        self.addCleanup(timer.stop)
+
+    def tearDown(self):
+        audit.buffer.clear()
+
+    def login(self, ip="10.0.0.1", password="wrong"):
+        return APIClient().post(
+            "/api/users/login/",
+            {"email": "victim@example.com", "password": password},
+            format="json",
+            REMOTE_ADDR=ip,
+        )
+
+    @override_settings(ADMISSION_CONTROL={"SCOPES": {"login": {"user": "2/min"}}})
+    def test_login_bucket_rejects_and_refills(self):
+        for _ in range(2):
+            self.assertEqual(self.login().status_code, 400)
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "30")
+
+        # Another client guessing the same account has its own bucket, so
+        # the owner cannot be locked out by someone else's attempts
+        self.assertEqual(
+            self.login(ip="10.0.0.2", password="correct-horse-battery").status_code,
+            200,
+        )
+
+        self.now += 30  # One token back at 2/min
+        self.assertEqual(self.login().status_code, 400)
+        self.assertEqual(self.login().status_code, 429)
+
+    @override_settings(ADMISSION_CONTROL={"SCOPES": {"login": {"ip": "1/min"}}})
+    def test_contended_bucket_is_throttled(self):
+        lock = "admission_login_ip_10.0.0.1_lock"
+        cache.add(lock, 1)
+        with mock.patch.object(throttling.TokenBucketThrottle, "lock_wait", 0):
+            response = self.login()
+        self.assertEqual(response.status_code, 429)
+        cache.delete(lock)
+        self.assertEqual(self.login().status_code, 400)
+
+    @override_settings(
+        ADMISSION_CONTROL={
+            "FACE_CONCURRENCY": 1,
+            "FACE_QUEUE_TIMEOUT": 0,
+            "FACE_RETRY_AFTER": 7,
+        }
+    )
+    def test_face_gate_sheds_when_busy(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        blank = io.BytesIO()
+        PILImage.new("RGB", (64, 64), "white").save(blank, format="PNG")
+
+        def verify():
+            return client.post(
+                "/api/users/verify-face-id/",
+                {"image": ContentFile(blank.getvalue(), name="blank.png")},
+                format="multipart",
+            )
+
+        with throttling.get_face_gate().slot():
+            response = verify()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "7")
+        self.assertNotEqual(verify().status_code, 429)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    VAULT_KEY_CACHE={"MAX_SIZE": 2, "TTL": 60},
+)
+class VaultEncryptionTests(TestCase):
+    """Envelope encryption of vault entries (users/vault.py)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            username="owner",
+            email="owner@example.com",
+            phone="5550002222",
+            password="correct-horse-battery",
+        )
+
+    def setUp(self):
+        vault._data_keys.clear()
+        self.addCleanup(vault._data_keys.clear)  # Rolled back users' ids are reused
+
+    def add(self, domain, password):
+        return Password.objects.create(
+            user=self.user,
+            domain_name=domain,
+            password=password,
+            link=f"https://{domain}/",
+        )
+
+    def stored(self, entry):
+        return Password.objects.values_list("password", flat=True).get(pk=entry.pk)
+
+    def test_round_trip_stores_only_ciphertext(self):
+        entry = self.add("mail.example.com", "hunter2")
+        token = self.stored(entry)
+        self.assertTrue(token.startswith(vault.TOKEN_PREFIX))
+        self.assertNotIn("hunter2", token)
+        self.assertEqual(Password.objects.get(pk=entry.pk).get_password(), "hunter2")
+        # Equal plaintexts never share a ciphertext
+        self.assertNotEqual(token, self.stored(self.add("bank.example.com", "hunter2")))
+
+    def test_swapped_ciphertexts_are_rejected(self):
+        mail_entry = self.add("mail.example.com", "mail-secret")
+        bank_entry = self.add("bank.example.com", "bank-secret")
+        Password.objects.filter(pk=mail_entry.pk).update(
+            password=self.stored(bank_entry)
+        )
+        with self.assertRaises(vault.VaultError):
+            Password.objects.get(pk=mail_entry.pk).get_password()
+
+        other = CustomUser.objects.create_user(
+            username="other",
+            email="other@example.com",
+            phone="5550003333",
+            password="correct-horse-battery",
+        )
+        token = vault.encrypt(self.user.id, "secret", bank_entry.pk)
+        with self.assertRaises(vault.VaultError):
+            vault.decrypt(other.id, token, bank_entry.pk)
+
+    def test_tampered_ciphertext_is_rejected(self):
+        entry = self.add("mail.example.com", "hunter2")
+        token = self.stored(entry)
+        raw = bytearray(vault._b64decode(token))
+        raw[-1] ^= 1  # One bit of the authentication tag
+        flipped = vault.TOKEN_PREFIX + vault._b64encode(bytes(raw))
+        with self.assertRaises(vault.VaultError):
+            vault.decrypt(self.user.id, flipped, entry.pk)
+
+    def test_legacy_ciphertexts_decrypt_and_are_upgraded(self):
+        entry = self.add("mail.example.com", "hunter2")
+        aead = vault.data_key(self.user.id)
+        legacy = vault._seal(aead, b"hunter2", vault._legacy_aad(self.user.id))
+        legacy = vault.LEGACY_PREFIX + legacy[len(vault.TOKEN_PREFIX) :]
+        Password.objects.filter(pk=entry.pk).update(password=legacy)
+        self.assertEqual(vault.decrypt(self.user.id, legacy, entry.pk), "hunter2")
+
+        call_command("encrypt_vault", stdout=io.StringIO())
+        self.assertTrue(vault.is_current(self.stored(entry)))
+        self.assertEqual(Password.objects.get(pk=entry.pk).get_password(), "hunter2")
+
+    def test_data_key_cache_expires(self):
+        clock = [0.0]
+        with mock.patch.object(vault.TTLCache, "timer", lambda _: clock[0]):
+            keys = vault.TTLCache(max_size=2, ttl=60)
+            with mock.patch.object(vault, "_data_keys", keys):
+                entry = self.add("mail.example.com", "hunter2")
+                # A cached key needs no query; an expired one is read again
+                with self.assertNumQueries(0):
+                    vault.decrypt(self.user.id, entry.password, entry.pk)
+                clock[0] += 61
+                with self.assertNumQueries(1):
+                    vault.decrypt(self.user.id, entry.password, entry.pk)
+                self.assertEqual(len(keys), 1)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    AUDIT_LOG={"BUFFER_SIZE": 10000, "FLUSH_INTERVAL": 0},
+    ADMISSION_CONTROL={},
+)
+class BreachIndexTests(TestCase):
+    """build_breach_index output and lookups through users/breach.py."""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.addCleanup(breach.reset_index)
+        self.index_path = Path(directory) / "breach.idx"
+        # Three hashes share the 0000 bucket, listed out of order
+        self.same_bucket = ["0000ff" + "11" * 17, "0000aa" + "22" * 17, "0000cc" + "33" * 17]
+        lines = [
+            hashlib.sha1(b"hunter2").hexdigest().upper() + ":42",
+            hashlib.sha1(b"password").hexdigest() + ":3861493",
+            "",
+            *[f"{digest}:{n}" for n, digest in enumerate(self.same_bucket, 1)],
+            "ffff" + "00" * 18,  # No count means seen once
+        ]
+        source = Path(directory) / "dump.txt"
+        source.write_text("\n".join(lines) + "\n")
+        out = io.StringIO()
+        call_command("build_breach_index", str(source), output=str(self.index_path), stdout=out)
+        self.assertIn("Indexed 6 hashes", out.getvalue())
+        breach.reset_index()
+        audit.buffer.clear()
+
+    def tearDown(self):
+        audit.buffer.clear()
+        vault._data_keys.clear()  # Rolled back users' ids are reused
+
+    def test_hits_and_misses(self):
+        with override_settings(BREACH_INDEX_PATH=str(self.index_path)):
+            self.assertEqual(len(breach.get_index()), 6)
+            self.assertEqual(breach.breach_count("hunter2"), 42)
+            self.assertEqual(breach.breach_count("password"), 3861493)
+            self.assertEqual(breach.breach_count("correct-horse-battery"), 0)
+            index = breach.get_index()
+            for n, digest in enumerate(self.same_bucket, 1):
+                self.assertEqual(index.lookup_sha1(bytes.fromhex(digest)), n)
+            self.assertEqual(index.lookup_sha1(bytes.fromhex("0000bb" + "22" * 17)), 0)
+            self.assertEqual(index.lookup_sha1(bytes.fromhex("ffff" + "00" * 18)), 1)
+
+    def test_breach_scan_and_add_password(self):
+        user = CustomUser.objects.create_user(
+            username="scanner",
+            email="scanner@example.com",
+            phone="5550004444",
+            password="correct-horse-battery",
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        with override_settings(BREACH_INDEX_PATH=str(self.index_path)):
+            response = client.post(
+                "/api/users/add_password/",
+                {"domain_name": "a.example.com", "password": "hunter2", "link": "https://a.example.com/"},
+                format="json",
+            )
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual((response.data["breached"], response.data["breach_count"]), (True, 42))
+            response = client.post(
+                "/api/users/add_password/",
+                {"domain_name": "b.example.com", "password": "not-in-dump", "link": "https://b.example.com/"},
+                format="json",
+            )
+            self.assertEqual((response.data["breached"], response.data["breach_count"]), (False, 0))
+
+            response = client.get("/api/users/breach-scan/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["checked"], 2)
+        self.assertEqual(
+            [(row["domain_name"], row["breach_count"]) for row in response.data["breached"]],
+            [("a.example.com", 42)],
+        )
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    VAULT_HEALTH={"WEAK_BITS": 50, "STALE_DAYS": 180},
+)
+class VaultHealthTests(TestCase):
+    """Health counters stay in step with writes; the report names the entries."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            username="healthy",
+            email="healthy@example.com",
+            phone="5550005555",
+            password="correct-horse-battery",
+        )
+
+    def setUp(self):
+        vault._data_keys.clear()
+        self.addCleanup(vault._data_keys.clear)
+
+    def add(self, domain, password):
+        return Password.objects.create(
+            user=self.user, domain_name=domain, password=password, link=f"https://{domain}/"
+        )
+
+    def counters(self):
+        report = health.report(self.user.id)
+        return report["total"], report["reused_groups"], report["reused_entries"]
+
+    def test_counters_follow_writes(self):
+        strong = "Tr0ub4dor&3-correct-horse"
+        a = self.add("a.example.com", strong)
+        b = self.add("b.example.com", strong)
+        c = self.add("c.example.com", strong)
+        self.add("d.example.com", "another-Strong-passphrase-42")
+        self.assertEqual(self.counters(), (4, 1, 3))
+
+        c.password = "a-different-Strong-passphrase-7"
+        c.save()
+        self.assertEqual(self.counters(), (4, 1, 2))
+        b.delete()
+        self.assertEqual(self.counters(), (3, 0, 0))
+        a.domain_name = "renamed.example.com"  # Same password: no reuse change
+        a.save()
+        self.assertEqual(self.counters(), (3, 0, 0))
+
+        # A rebuild from the table agrees with the incremental counters
+        self.add("e.example.com", strong)
+        expected = self.counters()
+        VaultHealth.objects.filter(user=self.user).update(
+            total=0, reused_groups=0, reused_entries=0
+        )
+        health.rebuild(self.user.id)
+        self.assertEqual(self.counters(), expected)
+
+    def test_report_lists_affected_entries(self):
+        strong = "Tr0ub4dor&3-correct-horse"
+        a = self.add("a.example.com", strong)
+        b = self.add("b.example.com", strong)
+        weak = self.add("weak.example.com", "abc")
+        old = self.add("old.example.com", "yet-another-Strong-passphrase-9")
+        Password.objects.filter(pk=old.pk).update(
+            updated_at=timezone.now() - timedelta(days=365)
+        )
+        self.add("fine.example.com", "perfectly-Fine-passphrase-11")
+
+        with self.assertNumQueries(2):
+            report = health.report(self.user.id)
+        self.assertEqual(report["reused"], [[a.pk, b.pk]])
+        self.assertEqual(report["weak_ids"], [weak.pk])
+        self.assertEqual(report["stale_ids"], [old.pk])
+        self.assertEqual((report["weak"], report["stale"]), (1, 1))
+        self.assertEqual(report["reused_entries"], 2)
+
+
+class ReadinessProbeTests(TestCase):
+    """The /readyz/ probe reports the face model warm-up and retries failures."""
+
+    def setUp(self):
+        self.reset()
+        self.addCleanup(self.reset)
+
+    def reset(self):
+        face_models._ready.clear()
+        face_models._started = False
+        face_models._stats.clear()
+
+    def probe(self):
+        response = self.client.get("/readyz/")
+        for thread in threading.enumerate():
+            if thread.name == "face-model-warmup":
+                thread.join(5)
+        return response
+
+    def test_failed_warm_up_is_retried(self):
+        with mock.patch(
+            "face_recognition.face_locations", side_effect=RuntimeError("no dlib")
+        ), self.assertLogs("users.face_models", "ERROR"):
+            response = self.probe()
+            self.assertEqual(response.status_code, 503)
+            response = self.probe()
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("no dlib", response.json()["error"])
+        self.assertFalse(face_models.is_ready())
+
+        with mock.patch("face_recognition.face_locations"), mock.patch(
+            "face_recognition.face_encodings"
+        ):
+            self.assertEqual(self.probe().status_code, 503)  # Warms up now
+            response = self.probe()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["ready"])
+        self.assertNotIn("error", response.json()["face_models"])
+
+
+class FaceBackfillCommandTests(TestCase):
+    """backfill_face_data fills encodings and thumbnails and resumes from its checkpoint."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.tmp)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.checkpoint = str(Path(self.tmp) / "checkpoint.json")
+
+        user = CustomUser.objects.create_user(
+            username="backfill", email="backfill@example.com", phone="5550009999"
+        )
+        face = FACE_IMAGE.read_bytes()
+        self.images = [
+            Image.objects.create(user=user, image=ContentFile(face, name=f"face{i}.png"))
+            for i in range(2)
+        ]
+        self.broken = Image.objects.create(
+            user=user, image=ContentFile(b"not an image", name="broken.png")
+        )
+
+    def backfill(self, *args):
+        out, err = io.StringIO(), io.StringIO()
+        call_command(
+            "backfill_face_data",
+            "--checkpoint",
+            self.checkpoint,
+            *args,
+            stdout=out,
+            stderr=err,
+        )
+        return out.getvalue(), err.getvalue()
+
+    def test_resumes_after_checkpoint(self):
+        first = self.images[0]
+        with open(self.checkpoint, "w") as f:
+            json.dump({"last_pk": first.pk, "processed": 1, "failed": 0}, f)
+
+        out, err = self.backfill("--workers", "1", "--chunk-size", "1")
+        self.assertIn(f"resuming after pk {first.pk}", out)
+        self.assertIn("3 images processed, 1 failed", out)
+        self.assertIn(f"Image {self.broken.pk}:", err)
+        first.refresh_from_db()
+        self.assertIsNone(first.encoding)  # Before the checkpoint
+        second = Image.objects.get(pk=self.images[1].pk)
+        self.assertEqual(len(bytes(second.encoding)), 128 * 8)
+        self.assertTrue(second.thumbnail)
+        with open(self.checkpoint) as f:
+            self.assertEqual(
+                json.load(f), {"last_pk": self.broken.pk, "processed": 3, "failed": 1}
+            )
+
+        out, _ = self.backfill()
+        self.assertIn("Nothing to backfill.", out)
+
+    def test_thumbnail_only_rows_are_written_without_extra_queries(self):
+        blank = io.BytesIO()
+        PILImage.new("RGB", (64, 64), "white").save(blank, format="PNG")
+        user = self.images[0].user
+        for i in range(3):
+            Image.objects.create(
+                user=user, image=ContentFile(blank.getvalue(), name=f"blank{i}.png")
+            )
+        Image.objects.filter(
+            pk__in=[self.broken.pk, *[image.pk for image in self.images]]
+        ).delete()
+
+        with CaptureQueriesContext(connection) as queries:
+            out, err = self.backfill("--workers", "1", "--restart")
+        self.assertIn("3 images processed, 3 failed", out)
+        self.assertEqual(err.count("No face detected."), 3)
+        self.assertEqual(Image.objects.exclude(thumbnail="").count(), 3)
+        # Count, one chunk, its bulk_update and the final empty chunk
+        self.assertEqual(len(queries), 4, [q["sql"] for q in queries.captured_queries])
+
+    def test_parallel_workers_match_serial_processing(self):
+        out, _ = self.backfill("--workers", "2", "--chunk-size", "2", "--restart")
+        self.assertIn("3 images processed, 1 failed", out)
+
+        expected, _, _ = faces.process_image_file(str(FACE_IMAGE))
+        for image in Image.objects.filter(pk__in=[i.pk for i in self.images]):
+            self.assertEqual(bytes(image.encoding), expected)
+            self.assertTrue(Path(image.thumbnail.path).exists())
+        self.broken.refresh_from_db()
+        self.assertIsNone(self.broken.encoding)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    AUDIT_LOG={"BUFFER_SIZE": 10000, "FLUSH_INTERVAL": 0},
+)
+class SyntheticDataCommandTests(TestCase):
+    """generate_synthetic_data and bench_endpoints on a handful of users."""
+
+    def setUp(self):
+        vault._data_keys.clear()
+        self.addCleanup(vault._data_keys.clear)
+        self.addCleanup(audit.buffer.clear)
+
+    def test_generate_synthetic_data(self):
+        out = io.StringIO()
+        call_command(
+            "generate_synthetic_data",
+            "--users=4",
+            "--distribution=fixed",
+            "--vault-mean=5",
+            "--reuse=0.5",
+            "--prefix=fixture",
+            stdout=out,
+        )
+        self.assertIn("Created 4 users with 20 vault entries", out.getvalue())
+
+        user = CustomUser.objects.get(username="fixture-0")
+        self.assertTrue(user.check_password(synthetic.DEFAULT_PASSWORD))
+        entries = list(Password.objects.filter(user=user))
+        self.assertTrue(all(vault.is_current(entry.password) for entry in entries))
+        repeats = [
+            n
+            for n in Counter(entry.get_password() for entry in entries).values()
+            if n > 1
+        ]
+        counters = VaultHealth.objects.get(user=user)
+        self.assertEqual(
+            (counters.total, counters.reused_groups, counters.reused_entries),
+            (5, len(repeats), sum(repeats)),
+        )
+
+        with self.assertRaises(CommandError):
+            call_command("generate_synthetic_data", "--users=1", "--prefix=fixture")
+
+    def test_bench_endpoints_report_and_compare(self):
+        output = str(Path(tempfile.mkdtemp()) / "bench.json")
+        self.addCleanup(shutil.rmtree, Path(output).parent, ignore_errors=True)
+        options = [
+            "--scales=3",
+            "--distribution=fixed",
+            "--vault-mean=4",
+            "--requests=2",
+            "--warmup=1",
+            "--endpoints",
+            "me",
+            "add_password",
+        ]
+        # The background audit writer stays off: its events would refer to
+        # the rolled back users
+        with override_settings(
+            AUDIT_LOG={"BUFFER_SIZE": 10000, "FLUSH_INTERVAL": 5.0}
+        ), mock.patch.object(audit.buffer, "ensure_writer") as ensure_writer:
+            call_command(
+                "bench_endpoints", *options, output=output, stderr=io.StringIO()
+            )
+        ensure_writer.assert_not_called()
+        self.assertEqual(len(audit.buffer), 0)
+
+        with open(output) as f:
+            report = json.load(f)
+        self.assertEqual(
+            [(r["scale"], r["endpoint"]) for r in report["results"]],
+            [(3, "me"), (3, "add_password")],
+        )
+        self.assertEqual(report["results"][0]["queries"]["max"], 1)
+        # The generated data is rolled back
+        self.assertFalse(CustomUser.objects.filter(username__startswith="bench-").exists())
+
+        # A baseline with fewer queries counts as a regression
+        report["results"][1]["queries"]["max"] -= 1
+        with open(output, "w") as f:
+            json.dump(report, f)
+        err = io.StringIO()
+        with self.assertRaisesMessage(CommandError, "1 regression(s) found."):
+            call_command(
+                "bench_endpoints",
+                *options,
+                compare=output,
+                fail_on_regression=True,
+                min_delta_ms=1e9,
+                stdout=io.StringIO(),
+                stderr=err,
+            )
+        self.assertIn("REGRESSION", err.getvalue())
+
+
+def _fake_face_encoding(path):
+    """Stand-in for faces.encode_file: each fixture file names its encoding."""
+    spec = Path(path).read_text()
+    if spec == "none":
+        return None, "No face detected in the uploaded image."
+    identity, offset = spec.split(":")
+    encoding = np.zeros(128)
+    encoding[int(identity)] = 0.7
+    encoding[-1] = float(offset)
+    return encoding, None
+
+
+@override_settings(FACE_MATCH_TOLERANCE=0.4)
+class CalibrateFaceToleranceCommandTests(TestCase):
+    """calibrate_face_tolerance on a labelled fixture with known distances."""
+
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        # Genuine distances are at most 0.1, impostor distances about 0.99.
+        for identity, name in enumerate(["alice", "bob"]):
+            (self.root / name).mkdir()
+            for i, offset in enumerate(["0.0", "0.05", "0.1"]):
+                (self.root / name / f"{i}.png").write_text(f"{identity}:{offset}")
+        (self.root / "bob" / "blank.png").write_text("none")
+        (self.root / "bob" / "notes.txt").write_text("not an image")
+        patcher = mock.patch.object(faces, "encode_file", _fake_face_encoding)
+        patcher.start()  # Inherited by the forked worker processes
+        self.addCleanup(patcher.stop)
+
+    def calibrate(self, *args):
+        out, err = io.StringIO(), io.StringIO()
+        call_command(
+            "calibrate_face_tolerance",
+            str(self.root),
+            "--workers=2",
+            *args,
+            stdout=out,
+            stderr=err,
+        )
+        return out.getvalue(), err.getvalue()
+
+    def test_report_and_encoding_cache(self):
+        output = self.root / "report.json"
+        out, err = self.calibrate(f"--output={output}")
+        self.assertIn("Encoding 7 images with 2 workers", out)
+        self.assertIn("blank.png: No face detected", err)
+        self.assertIn("6 images of 2 identities (1 without a usable face)", out)
+        self.assertIn("EER 0.0000%", out)
+
+        report = json.loads(output.read_text())
+        self.assertEqual((report["genuine_pairs"], report["impostor_pairs"]), (6, 9))
+        self.assertEqual(report["failed"], [str(self.root / "bob" / "blank.png")])
+        recommended = report["recommended"]
+        self.assertEqual((recommended["far"], recommended["frr"]), (0.0, 0.0))
+        self.assertTrue(0.1 <= recommended["tolerance"] < 0.99)
+        self.assertEqual(report["current"], {"tolerance": 0.4, "far": 0.0, "frr": 0.0})
+        self.assertTrue((self.root / ".face_encodings.npz").exists())
+
+        # Unchanged files come from the cache; a changed file is encoded again
+        out, _ = self.calibrate()
+        self.assertNotIn("Encoding", out)
+        (self.root / "alice" / "2.png").write_text("0:0.09")
+        out, _ = self.calibrate()
+        self.assertIn("Encoding 1 images", out)
+
+    def test_needs_two_identities(self):
+        shutil.rmtree(self.root / "bob")
+        with self.assertRaisesMessage(CommandError, "At least two identities"):
+            self.calibrate()
+
+    def test_needs_usable_faces_of_two_identities(self):
+        for path in self.root.glob("*/*.png"):
+            path.write_text("none")
+        with self.assertRaisesMessage(
+            CommandError, "(7 of 7 images could not be encoded)"
+        ):
+            self.calibrate()
+
+        # One identity with usable faces is not enough either
+        (self.root / "alice" / "0.png").write_text("0:0.0")
+        (self.root / "alice" / "1.png").write_text("0:0.05")
+        with self.assertRaisesMessage(
+            CommandError, "At least two identities with a usable face"
+        ):
+            self.calibrate()
+
+
+class FaceBurstMatchTests(TestCase):
+    """faces.match_burst stops at the first match without leaving work behind."""
+
+    def test_returns_after_running_encodes_finish(self):
+        frames = [np.full((8, 8, 3), value, dtype=np.uint8) for value in (3, 2, 1)]
+        slow_done = threading.Event()
+        started = []
+
+        def encode(frame):
+            started.append(int(frame[0, 0, 0]))
+            if frame[0, 0, 0] == 3:  # Best ranked, but slow and no match
+                time.sleep(0.2)
+                slow_done.set()
+                return np.ones(128), None
+            return np.zeros(128), None
+
+        with mock.patch.object(
+            faces, "frame_quality", lambda frame: float(frame.mean())
+        ), mock.patch.object(faces, "encode_frame", encode):
+            result = faces.match_burst(frames, np.zeros(128), 0.4, workers=2)
+
+        self.assertTrue(result["matched"])
+        self.assertEqual((result["frame"], result["distance"]), (1, 0.0))
+        # The slow encode finished before match_burst returned...
+        self.assertTrue(slow_done.is_set())
+        # ...and the remaining frame was never started
+        self.assertEqual(sorted(started), [2, 3])
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    AUDIT_LOG={"BUFFER_SIZE": 10000, "FLUSH_INTERVAL": 0},
+    TOKEN_REVOCATION={"SYNC_INTERVAL": 3600},
+)
+class LogoutAllTests(TestCase):
+    """
+    logout-all revokes earlier tokens but not ones issued right after it, and
+    the revocation cache keeps every revocation visible while it resyncs.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            username="sessions", email="sessions@example.com", phone="5550008888"
+        )
+
+    def setUp(self):
+        revocation.cache.reset()
+        revocation.cache.sync(full=True)
+        self.addCleanup(revocation.cache.reset)
+        self.addCleanup(audit.buffer.clear)
+
+    def test_cutoff_has_second_resolution(self):
+        revoked_at = timezone.now().replace(microsecond=700000)
+        with mock.patch.object(revocation.timezone, "now", return_value=revoked_at):
+            revocation.revoke_all(self.user)
+
+        second = int(revoked_at.timestamp())
+        payload = {"user_id": str(self.user.pk)}
+        self.assertTrue(revocation.cache.is_revoked({**payload, "iat": second - 1}))
+        self.assertFalse(revocation.cache.is_revoked({**payload, "iat": second}))
+        self.assertFalse(revocation.cache.is_revoked({**payload, "iat": second + 1}))
+
+    def test_revocations_stay_visible_during_full_sync(self):
+        expires_at = timezone.now() + timedelta(hours=1)
+        revocation.revoke("jti-before", self.user.pk, expires_at)
+        revocation.revoke_all(self.user)
+        old_token = {
+            "user_id": str(self.user.pk),
+            "iat": int(time.time()) - 10,
+        }
+        cache_ = revocation.cache
+        seen = []
+        checking = False
+
+        def query(*args, **kwargs):
+            # Revoked in this worker while the sync reads the table
+            nonlocal checking
+            checking = True
+            cache_.added("jti-during", timezone.now())
+            checking = False
+            return rows(*args, **kwargs)
+
+        def key_hash(key):
+            # Another request checked while the sync rebuilds its state
+            nonlocal checking
+            if not checking:
+                checking = True
+                seen.append(
+                    (
+                        cache_.is_revoked({"jti": "jti-before"}),
+                        cache_.is_revoked({"jti": "jti-during"}),
+                        cache_.is_revoked(old_token),
+                    )
+                )
+                checking = False
+            return hashed(key)
+
+        rows, hashed = revocation.RevokedToken.objects.filter, revocation.key_hash
+        with mock.patch.object(
+            revocation.RevokedToken.objects, "filter", query
+        ), mock.patch.object(revocation, "key_hash", key_hash):
+            cache_.sync(full=True)
+
+        self.assertTrue(seen)
+        self.assertEqual(set(seen), {(True, True, True)})
+        # The key revoked during the sync survives it
+        self.assertTrue(cache_.is_revoked({"jti": "jti-during"}))
+        self.assertTrue(cache_.is_revoked({"jti": "jti-before"}))
+
+    def test_token_issued_right_after_logout_all(self):
+        old = APIClient()
+        old.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {revocation.tokens_for(self.user).access_token}"
+        )
+        self.assertEqual(old.post("/api/users/logout-all/").status_code, 200)
+
+        new = APIClient()
+        new.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {revocation.tokens_for(self.user).access_token}"
+        )
+        self.assertEqual(new.get("/api/users/me/").status_code, 200)
+
+        # Another worker loading the cutoff from the database agrees
+        revocation.cache.reset()
+        self.assertEqual(new.get("/api/users/me/").status_code, 200)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class PasswordHistoryTests(TestCase):
+    """Old versions resolve through the delta chain and pruning keeps the newest."""
+
+    def setUp(self):
+        vault._data_keys.clear()
+        self.addCleanup(vault._data_keys.clear)
+        self.user = CustomUser.objects.create_user(
+            username="history", email="history@example.com", phone="5550007777"
+        )
+        self.entry = Password.objects.create(
+            user=self.user,
+            domain_name="old.example.com",
+            password="first-secret",
+            link="https://old.example.com/",
+        )
+        for change in [
+            {"password": "second-secret"},
+            {"domain_name": "new.example.com"},
+            {"link": "https://new.example.com/"},
+            {"password": "third-secret"},
+            {"domain_name": "newer.example.com"},
+        ]:
+            for field, value in change.items():
+                setattr(self.entry, field, value)
+            self.entry.save()
+
+    def states(self):
+        versions = list(self.entry.versions.order_by("-version"))
+        states = history.resolve(self.entry, versions)
+        return [
+            (
+                state["version"],
+                vault.decrypt(self.user.id, state["password"], self.entry.pk),
+                state["domain_name"],
+                state["link"],
+            )
+            for state in states
+        ]
+
+    def test_old_version_resolves_through_deltas(self):
+        # Version 1 stored only its password; domain and link come from the
+        # newer deltas that recorded them
+        self.assertIsNone(self.entry.versions.get(version=1).domain_name)
+        self.assertEqual(
+            self.states()[-1],
+            (1, "first-secret", "old.example.com", "https://old.example.com/"),
+        )
+
+    @override_settings(PASSWORD_HISTORY={"MAX_VERSIONS": 2, "MAX_AGE_DAYS": 30})
+    def test_prune_keeps_newest_recent_versions(self):
+        expected = self.states()[:2]
+        # The newest kept version is also past MAX_AGE_DAYS
+        PasswordVersion.objects.filter(entry=self.entry, version=4).update(
+            archived_at=timezone.now() - timedelta(days=31)
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            deleted = history.prune(batch_size=1)
+        self.assertEqual(deleted, 4)
+        self.assertEqual(
+            sum("ROW_NUMBER" in query["sql"] for query in queries.captured_queries), 1
+        )
+        self.assertEqual(self.states(), expected[:1])
+        self.assertEqual(
+            list(self.entry.versions.values_list("version", flat=True)), [5]
+        )
+
+        out = io.StringIO()
+        call_command("prune_password_history", stdout=out)
+        self.assertIn("Pruned 0 password versions.", out.getvalue())
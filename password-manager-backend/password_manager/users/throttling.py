@@ -0,0 +1,190 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+
+def admission_settings():
+    """Return the ADMISSION_CONTROL settings dict (empty if not configured)."""
+    return getattr(settings, "ADMISSION_CONTROL", {})
+
+
+def parse_rate(rate):
+    """Parse a rate such as "10/min" into (capacity, refill tokens per second)."""
+    if not rate:
+        return None
+    num, period = rate.split("/")
+    seconds = {"s": 1, "m": 60, "h": 3600, "d": 86400}[period[0]]
+    capacity = int(num)
+    return capacity, capacity / seconds
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket throttle keyed by `view.throttle_scope`.
+
+    Buckets are stored in the cache configured by ADMISSION_CONTROL["CACHE"],
+    so every worker sharing that cache shares the same budget. Capacity is the
+    burst size and tokens refill continuously at capacity / period.
+
+    The read-modify-write of a bucket runs under a lock taken with cache.add
+    (atomic on every Django cache backend), so concurrent requests cannot
+    spend the same token. A request that cannot get the lock within
+    LOCK_WAIT seconds is throttled rather than let through.
+    """
+
+    kind = None  # "user" or "ip" - selects the rate inside the scope config
+    timer = time.time
+    cache_format = "admission_%(scope)s_%(kind)s_%(ident)s"
+    lock_timeout = 2  # Seconds before the lock of a crashed worker expires
+    lock_wait = 0.5  # Seconds to wait for a contended bucket
+    lock_poll = 0.005
+
+    def __init__(self):
+        self.retry_after = None
+
+    def get_ident_key(self, request):
+        raise NotImplementedError(".get_ident_key() must be overridden")
+
+    def get_rate(self, view):
+        scope = getattr(view, "throttle_scope", None)
+        scopes = admission_settings().get("SCOPES", {})
+        return scope, parse_rate(scopes.get(scope, {}).get(self.kind))
+
+    def allow_request(self, request, view):
+        scope, rate = self.get_rate(view)
+        if rate is None:
+            return True
+
+        ident = self.get_ident_key(request)
+        if ident is None:
+            return True
+
+        capacity, refill = rate
+        cache = caches[admission_settings().get("CACHE", "default")]
+        key = self.cache_format % {"scope": scope, "kind": self.kind, "ident": ident}
+        lock = f"{key}_lock"
+        deadline = time.monotonic() + self.lock_wait
+        while not cache.add(lock, 1, self.lock_timeout):
+            if time.monotonic() >= deadline:
+                self.retry_after = 1
+                return False
+            time.sleep(self.lock_poll)
+
+        try:
+            now = self.timer()
+            tokens, stamp = cache.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - stamp) * refill)
+
+            if tokens < 1:
+                self.retry_after = (1 - tokens) / refill
+                return False
+
+            # Keep the bucket only as long as it takes to refill completely.
+            cache.set(key, (tokens - 1, now), math.ceil(capacity / refill))
+            return True
+        finally:
+            cache.delete(lock)
+
+    def wait(self):
+        if self.retry_after is None:
+            return None
+        return math.ceil(self.retry_after)
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """
+    Per-account bucket. Authenticated requests are keyed by user id; anonymous
+    requests (login) are keyed by client address plus the submitted email, so
+    guessing one account's password is slowed down without letting anyone
+    else empty that account's bucket and lock its owner out.
+    """
+
+    kind = "user"
+
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return f"id:{request.user.pk}"
+        email = request.data.get("email") if hasattr(request.data, "get") else None
+        if email:
+            return f"email:{self.get_ident(request)}:{str(email).strip().lower()}"
+        return None
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """Per-client-address bucket (honours NUM_PROXIES like DRF's throttles)."""
+
+    kind = "ip"
+
+    def get_ident_key(self, request):
+        return self.get_ident(request)
+
+
+ADMISSION_THROTTLES = [UserTokenBucketThrottle, IPTokenBucketThrottle]
+
+
+class FaceProcessingGate:
+    """
+    Process-wide cap on concurrent face pipeline runs.
+
+    Requests wait at most `queue_timeout` seconds for a slot; after that they
+    are shed with a 429 rather than queueing up behind dlib.
+    """
+
+    def __init__(self, concurrency, queue_timeout, retry_after):
+        self.concurrency = concurrency
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._semaphore = threading.BoundedSemaphore(concurrency)
+
+    @contextmanager
+    def slot(self):
+        if not self._semaphore.acquire(timeout=self.queue_timeout):
+            raise Throttled(
+                wait=self.retry_after,
+                detail="Server is busy processing other face requests. Please retry shortly.",
+            )
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+
+_gate = None
+_gate_lock = threading.Lock()
+
+
+def get_face_gate():
+    """Return the shared gate, rebuilding it if the settings changed."""
+    global _gate
+    config = admission_settings()
+    params = (
+        config.get("FACE_CONCURRENCY", 2),
+        config.get("FACE_QUEUE_TIMEOUT", 2.0),
+        config.get("FACE_RETRY_AFTER", 5),
+    )
+    with _gate_lock:
+        if _gate is None or (
+            _gate.concurrency,
+            _gate.queue_timeout,
+            _gate.retry_after,
+        ) != params:
+            _gate = FaceProcessingGate(*params)
+        return _gate
+
+
+def face_processing_slot(handler):
+    """Run a view handler only while holding a face processing slot."""
+
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        with get_face_gate().slot():
+            return handler(*args, **kwargs)
+
+    return wrapper
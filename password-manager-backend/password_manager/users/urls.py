@@ -4,13 +4,29 @@ from django.urls import path
 from .views import (
     SignupView,
     LoginView,
+    logout,
+    logout_all,
     UserDetailView,
+    BootstrapView,
     # passwords_view,
     verify_otp,
+    list_passwords,
     send_otp_email,
     add_password,
+    batch_passwords,
+    password_history,
+    restore_password_version,
+    breach_scan,
+    vault_health,
+    audit_log,
+    provision_users,
+    admin_metrics,
+    admin_profiles,
+    admin_profile,
     ImageUploadView,
+    EnrollmentJobView,
     ImageListView,
+    MediaView,
     VerifyFaceId,
 )
 from rest_framework_simplejwt.views import TokenRefreshView
@@ -18,7 +34,10 @@ from rest_framework_simplejwt.views import TokenRefreshView
 urlpatterns = [
     path("signup/", SignupView.as_view(), name="signup"),
     path("login/", LoginView.as_view(), name="login"),
+    path("logout/", logout, name="logout"),
+    path("logout-all/", logout_all, name="logout_all"),
     path("me/", UserDetailView.as_view(), name="user-detail"),
+    path("bootstrap/", BootstrapView.as_view(), name="bootstrap"),
     path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     # TODO
     path(
@@ -30,7 +49,32 @@ urlpatterns = [
     # TODO
     # path("verify-otp/", verify_otp, name="verify_otp"),
     path("add_password/", add_password, name="add_password"),
+    path("passwords/", list_passwords, name="list_passwords"),
+    path("passwords/batch/", batch_passwords, name="batch_passwords"),
+    path(
+        "passwords/<int:entry_id>/history/",
+        password_history,
+        name="password_history",
+    ),
+    path(
+        "passwords/<int:entry_id>/history/<int:version>/restore/",
+        restore_password_version,
+        name="restore_password_version",
+    ),
+    path("breach-scan/", breach_scan, name="breach_scan"),
+    path("vault-health/", vault_health, name="vault_health"),
+    path("audit-log/", audit_log, name="audit_log"),
+    path("admin/provision/", provision_users, name="provision_users"),
+    path("admin/metrics/", admin_metrics, name="admin_metrics"),
+    path("admin/profiles/", admin_profiles, name="admin_profiles"),
+    path("admin/profiles/<str:profile_id>/", admin_profile, name="admin_profile"),
     path("image-upload/", ImageUploadView.as_view(), name="image_upload"),
+    path(
+        "enrollment-jobs/<uuid:job_id>/",
+        EnrollmentJobView.as_view(),
+        name="enrollment_job",
+    ),
     path("image/", ImageListView.as_view(), name="view_image"),
+    path("media/<path:path>", MediaView.as_view(), name="protected_media"),
     path("verify-face-id/", VerifyFaceId.as_view(), name="verify_face_id"),
 ]
@@ -0,0 +1,247 @@
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from django.conf import settings
+
+# Envelope encryption for vault entries:
+#   master key (settings) --wraps--> per-user data key --encrypts--> Password rows
+# Every stored value is "v2:" + base64(nonce || AES-GCM ciphertext). The
+# associated data binds a ciphertext to its user and entry pk, so moving it
+# to another row makes decryption fail. Domain and link are stored in the
+# clear and are not covered. "v1:" values were bound to the user only; they
+# still decrypt, and `manage.py encrypt_vault` rewrites them as "v2:".
+
+TOKEN_PREFIX = "v2:"
+LEGACY_PREFIX = "v1:"
+NONCE_SIZE = 12
+
+
+class VaultError(Exception):
+    """Raised when a vault value or data key cannot be decrypted."""
+
+
+class TTLCache:
+    """Thread-safe bounded LRU whose entries also expire after `ttl` seconds."""
+
+    timer = time.monotonic
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires <= self.timer():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, self.timer() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _b64decode(token):
+    return base64.urlsafe_b64decode(token[len(TOKEN_PREFIX) :].encode("ascii"))
+
+
+def _seal(aead, plaintext, aad):
+    nonce = os.urandom(NONCE_SIZE)
+    return TOKEN_PREFIX + _b64encode(nonce + aead.encrypt(nonce, plaintext, aad))
+
+
+def _open(aead, token, aad):
+    raw = _b64decode(token)
+    return aead.decrypt(raw[:NONCE_SIZE], raw[NONCE_SIZE:], aad)
+
+
+def is_encrypted(value):
+    return isinstance(value, str) and value.startswith((TOKEN_PREFIX, LEGACY_PREFIX))
+
+
+def is_current(value):
+    """Whether a stored value is encrypted in the current (entry-bound) format."""
+    return isinstance(value, str) and value.startswith(TOKEN_PREFIX)
+
+
+_master = None
+_master_lock = threading.Lock()
+
+
+def _master_secret():
+    configured = getattr(settings, "VAULT_MASTER_KEY", "")
+    if configured:
+        key = base64.urlsafe_b64decode(configured)
+        if len(key) != 32:
+            raise VaultError("VAULT_MASTER_KEY must be 32 url-safe base64 bytes.")
+        return key
+    # Development fallback only - production must set VAULT_MASTER_KEY.
+    return _derive(settings.SECRET_KEY.encode(), b"password-manager vault master key")
+
+
+def _derive(secret, info):
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=info).derive(secret)
+
+
+def master_key():
+    """Return the AES-GCM master key, derived from SECRET_KEY when unset."""
+    global _master
+    with _master_lock:
+        if _master is None:
+            _master = AESGCM(_master_secret())
+        return _master
+
+
+_fingerprint_key = None
+
+
+def fingerprint(user_id, plaintext):
+    """
+    Keyed hash of a plaintext, used to find reused passwords without decrypting.
+
+    The user id is mixed in so equal passwords of different users do not share
+    a fingerprint.
+    """
+    global _fingerprint_key
+    if _fingerprint_key is None:
+        _fingerprint_key = _derive(_master_secret(), b"password-manager vault fingerprint")
+    message = f"{user_id}:".encode() + plaintext.encode()
+    return hmac.new(_fingerprint_key, message, hashlib.sha256).hexdigest()
+
+
+def _key_cache_settings():
+    config = getattr(settings, "VAULT_KEY_CACHE", {})
+    return config.get("MAX_SIZE", 1024), config.get("TTL", 300)
+
+
+_data_keys = TTLCache(*_key_cache_settings())
+
+
+def _wrap_aad(user_id):
+    return f"user:{user_id}".encode()
+
+
+def _entry_aad(user_id, entry_id):
+    return f"password:{user_id}:{entry_id}".encode()
+
+
+def _legacy_aad(user_id):
+    return f"password:{user_id}".encode()
+
+
+def data_key(user_id):
+    """
+    Return the unwrapped AES-GCM data key of a user.
+
+    Keys come from the LRU when possible; otherwise the wrapped key is read
+    (and created on first use) and unwrapped with the master key.
+    """
+    aead = _data_keys.get(user_id)
+    if aead is not None:
+        return aead
+
+    from .models import CustomUser
+
+    wrapped = (
+        CustomUser.objects.filter(pk=user_id).values_list("vault_key", flat=True).first()
+    )
+    if not wrapped:
+        candidate = _seal(master_key(), AESGCM.generate_key(bit_length=256), _wrap_aad(user_id))
+        # Only the first writer wins so concurrent requests agree on one key.
+        CustomUser.objects.filter(pk=user_id, vault_key__isnull=True).update(
+            vault_key=candidate
+        )
+        wrapped = CustomUser.objects.filter(pk=user_id).values_list(
+            "vault_key", flat=True
+        ).get()
+
+    try:
+        aead = AESGCM(_open(master_key(), wrapped, _wrap_aad(user_id)))
+    except (InvalidTag, ValueError) as e:
+        raise VaultError(f"Could not unwrap data key for user {user_id}.") from e
+
+    _data_keys.set(user_id, aead)
+    return aead
+
+
+def encrypt(user_id, plaintext, entry_id):
+    """Encrypt a single vault value of entry `entry_id` for `user_id`."""
+    return encrypt_many(user_id, [plaintext], [entry_id])[0]
+
+
+def encrypt_many(user_id, plaintexts, entry_ids):
+    """Encrypt several values (of the entries `entry_ids`) with one data key lookup."""
+    aead = data_key(user_id)
+    return [
+        _seal(aead, value.encode(), _entry_aad(user_id, entry_id))
+        for value, entry_id in zip(plaintexts, entry_ids, strict=True)
+    ]
+
+
+def decrypt(user_id, value, entry_id):
+    """Decrypt a single vault value of entry `entry_id` for `user_id`."""
+    return decrypt_many(user_id, [value], [entry_id])[0]
+
+
+def decrypt_many(user_id, values, entry_ids):
+    """
+    Decrypt several values belonging to one user in a single pass.
+
+    Legacy plaintext rows (written before encryption was enabled) are returned
+    unchanged so listings keep working until `encrypt_vault` has run.
+    """
+    if not any(is_encrypted(value) for value in values):
+        return list(values)
+
+    aead = data_key(user_id)
+    result = []
+    for value, entry_id in zip(values, entry_ids, strict=True):
+        if not is_encrypted(value):
+            result.append(value)
+            continue
+        if is_current(value):
+            aad = _entry_aad(user_id, entry_id)
+        else:
+            aad = _legacy_aad(user_id)
+        try:
+            result.append(_open(aead, value, aad).decode())
+        except (InvalidTag, ValueError) as e:
+            raise VaultError(
+                f"Could not decrypt vault entry {entry_id} of user {user_id}."
+            ) from e
+    return result
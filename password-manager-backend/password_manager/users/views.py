@@ -1,24 +1,34 @@
+import logging
 import os
+import time
 import pyotp
+from concurrent.futures import ThreadPoolExecutor
 import face_recognition
 from pathlib import Path
 from datetime import datetime
 
 from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from django.core.mail import send_mail
 from django.utils.http import urlsafe_base64_encode
 from django.template.loader import render_to_string
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import check_password
 from rest_framework import status, permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import DateTimeField
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 
 from .serializers import (
     UserSignupSerializer,
@@ -27,9 +37,31 @@ from .serializers import (
     ImageUploadSerializer,
     ImageSerializer,
 )
+from . import (
+    audit,
+    bootstrap,
+    breach,
+    enrollment,
+    faces,
+    fastpath,
+    health,
+    history,
+    media,
+    metrics,
+    probes,
+    profiling,
+    provisioning,
+    revocation,
+    stepup,
+    vault,
+)
 from .models import Password, CustomUser, Image
+from .renderers import FAST_RENDERER_CLASSES
+from .idempotency import idempotent
+from .throttling import ADMISSION_THROTTLES, face_processing_slot
 
 User = get_user_model()  # Get custom user model
+logger = logging.getLogger(__name__)
 
 
 # ✅ Signup API with Face Image Processing & Secure Storage
@@ -54,8 +86,9 @@ class SignupView(APIView):
                 )
 
             user = serializer.save()
+            audit.emit(audit.SIGNUP, request, user=user)
 
-            refresh = RefreshToken.for_user(user)
+            refresh = revocation.tokens_for(user)
 
             return Response(
                 {
@@ -80,6 +113,8 @@ class SignupView(APIView):
 # ✅ Login API (Authenticates User Securely)
 class LoginView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = ADMISSION_THROTTLES
+    throttle_scope = "login"
 
     def post(self, request):
         email = request.data.get("email", "").strip().lower()  # ✅ Convert to lowercase
@@ -96,17 +131,20 @@ class LoginView(APIView):
                 email__iexact=email
             )  # Case-insensitive email lookup
         except User.DoesNotExist:
+            audit.emit(audit.LOGIN_FAILED, request, email=email)
             return Response(
                 {"error": "Invalid credentials!"}, status=status.HTTP_400_BAD_REQUEST
             )
 
         if not check_password(password, user.password):  # Verify the hashed password
+            audit.emit(audit.LOGIN_FAILED, request, user=user, email=email)
             return Response(
                 {"error": "Invalid credentials!"}, status=status.HTTP_400_BAD_REQUEST
             )
 
         # Generate JWT Token
-        refresh = RefreshToken.for_user(user)
+        refresh = revocation.tokens_for(user)
+        audit.emit(audit.LOGIN, request, user=user)
 
         return Response(
             {
@@ -124,6 +162,42 @@ class LoginView(APIView):
         )
 
 
+# ✅ Logout API (Revokes the session of a refresh token)
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def logout(request):
+    """
+    Revoke the session the request's access token belongs to, or the session
+    of the `refresh` token in the body. Refresh and access tokens of the
+    session stop working immediately in this worker and within
+    TOKEN_REVOCATION["SYNC_INTERVAL"] in the others.
+    """
+    token = request.auth
+    raw_refresh = request.data.get("refresh")
+    if raw_refresh:
+        try:
+            token = RefreshToken(raw_refresh)
+        except TokenError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if str(token.get(api_settings.USER_ID_CLAIM)) != str(request.user.pk):
+            return Response(
+                {"error": "Token does not belong to this user."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+    revocation.revoke_token(token)
+    audit.emit(audit.LOGOUT, request)
+    return Response({"message": "Logged out."})
+
+
+# ✅ Logout Everywhere API (Revokes every token issued to the user so far)
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def logout_all(request):
+    revocation.revoke_all(request.user)
+    audit.emit(audit.LOGOUT_ALL, request)
+    return Response({"message": "Logged out of all sessions."})
+
+
 # ✅ User Profile API (Fetches Logged-in User Details)
 class UserDetailView(APIView):
     permission_classes = [IsAuthenticated]
@@ -134,6 +208,55 @@ class UserDetailView(APIView):
         return Response(serializer.data)
 
 
+# ✅ Dashboard Bootstrap API (Profile, face ID, vault summary and token expiry)
+class BootstrapView(APIView):
+    """
+    Everything the dashboard needs on load in one round-trip. The vault and
+    face ID summary is cached per user version; the ETag covers that version
+    and the access token, so an unchanged dashboard revalidates with a 304
+    without touching the vault tables.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        user = request.user
+        current_version = bootstrap.version(user.pk)
+        payload = request.auth.payload if request.auth is not None else {}
+        etag = f'"{current_version}-{payload.get(api_settings.JTI_CLAIM, "")}"'
+        if etag in request.headers.get("If-None-Match", ""):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            response["ETag"] = etag
+            return response
+
+        data = bootstrap.cached_summary(user, current_version)
+        expires_at = payload.get("exp")
+        response = Response(
+            {
+                "user": {
+                    "id": user.id,
+                    "username": user.username,
+                    "email": user.email,
+                    "phone": user.phone,
+                },
+                "face_id": data["face_id"],
+                "vault": data["vault"],
+                "token": {
+                    "expires_at": expires_at,
+                    "expires_in": (
+                        max(int(expires_at - time.time()), 0) if expires_at else None
+                    ),
+                    "refresh_lifetime": int(
+                        api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()
+                    ),
+                },
+            }
+        )
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+
 # ✅ Root API (Provide basic API info)
 @api_view(["GET"])
 @permission_classes([AllowAny])  # No authentication required for this view
@@ -152,11 +275,27 @@ def api_root(request):
     )
 
 
+def _redact_added_password(body):
+    """Stored copy of an add_password response: the plaintext is left out."""
+    return {**body, "password": None}
+
+
+def _restore_added_password(user_id, body):
+    """Decrypt the entry again for a replay, unless it changed since."""
+    entry = Password.objects.filter(
+        user_id=user_id, pk=body["id"], version=body["version"]
+    ).first()
+    if entry is None:
+        return body
+    return {**body, "password": entry.get_password()}
+
+
 # ✅ Add Password API (Allow authenticated users to add a password)
 @api_view(["POST"])
 @permission_classes(
     [IsAuthenticated]
 )  # Ensure only authenticated users can add passwords
+@idempotent(redact=_redact_added_password, restore=_restore_added_password)
 def add_password(request):
     """Allow authenticated users to add a password."""
     # Check if 'domain_name' and 'password' are provided in the request
@@ -174,7 +313,19 @@ def add_password(request):
         try:
             # Save the password for the authenticated user
             serializer.save(user=request.user)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            # Report whether the password appears in the offline breach corpus
+            # (None when no breach index is configured)
+            count = breach.breach_count(serializer.validated_data["password"])
+            audit.emit(
+                audit.CREDENTIAL_CREATED,
+                request,
+                entry_id=serializer.instance.pk,
+                domain_name=serializer.instance.domain_name,
+            )
+            return Response(
+                {**serializer.data, "breached": bool(count), "breach_count": count},
+                status=status.HTTP_201_CREATED,
+            )
         except Exception as e:
             # Handle errors during saving the password
             return Response(
@@ -186,6 +337,360 @@ def add_password(request):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+# ✅ Batch Password API (Create, update and delete many entries in one transaction)
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def batch_passwords(request):
+    """
+    Apply a list of create/update/delete operations to the user's passwords.
+
+    Updates and deletes must carry a `version` or `updated_at` precondition and
+    are reported as conflicts when the stored entry has changed since. With
+    `"atomic": true` any failed item rolls back the whole batch; otherwise the
+    valid items are applied. Every item gets its own result.
+    """
+    operations = request.data.get("operations")
+    max_size = getattr(settings, "PASSWORD_BATCH_MAX_SIZE", 500)
+
+    if not isinstance(operations, list) or not operations:
+        return Response(
+            {"error": "operations must be a non-empty list."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if len(operations) > max_size:
+        return Response(
+            {"error": f"A batch may contain at most {max_size} operations."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    user = request.user
+    timestamp = DateTimeField()
+    results = [None] * len(operations)
+    creates, changes = [], []  # changes: (index, op, id, version, updated_at, data)
+    targeted = set()
+
+    # Validate every item before touching the database
+    for index, operation in enumerate(operations):
+        op = operation.get("op") if isinstance(operation, dict) else None
+        errors = {}
+
+        if op not in ("create", "update", "delete"):
+            errors["op"] = ["Must be create, update or delete."]
+        elif op != "create":
+            entry_id = operation.get("id")
+            if not isinstance(entry_id, int):
+                errors["id"] = ["An integer id is required."]
+            elif entry_id in targeted:
+                errors["id"] = ["Entry is targeted more than once in this batch."]
+            if "version" not in operation and "updated_at" not in operation:
+                errors["precondition"] = ["version or updated_at is required."]
+            try:
+                expected_at = (
+                    timestamp.to_internal_value(operation["updated_at"])
+                    if "updated_at" in operation
+                    else None
+                )
+            except ValidationError as e:
+                errors["updated_at"] = e.detail
+
+        data = None
+        if not errors and op != "delete":
+            serializer = PasswordSerializer(data=operation, partial=(op == "update"))
+            if serializer.is_valid():
+                data = serializer.validated_data
+            else:
+                errors = serializer.errors
+
+        if errors:
+            results[index] = {"index": index, "status": "invalid", "errors": errors}
+        elif op == "create":
+            creates.append((index, data))
+        else:
+            targeted.add(entry_id)
+            changes.append(
+                (index, op, entry_id, operation.get("version"), expected_at, data)
+            )
+
+    with transaction.atomic():
+        # One query for every entry the batch refers to
+        targets = (
+            Password.objects.select_for_update()
+            .filter(user=user)
+            .in_bulk([change[2] for change in changes])
+        )
+
+        now = timezone.now()
+        updated, deleted, new_plaintexts = [], [], {}
+        written = []  # (index, status, entry) of created and updated rows
+        for index, op, entry_id, version, expected_at, data in changes:
+            entry = targets.get(entry_id)
+            if entry is None:
+                results[index] = {"index": index, "status": "not_found", "id": entry_id}
+                continue
+            if (version is not None and version != entry.version) or (
+                expected_at is not None and expected_at != entry.updated_at
+            ):
+                results[index] = {
+                    "index": index,
+                    "status": "conflict",
+                    "id": entry_id,
+                    "current": {
+                        "version": entry.version,
+                        "updated_at": timestamp.to_representation(entry.updated_at),
+                    },
+                }
+                continue
+
+            if op == "delete":
+                deleted.append(entry)
+                results[index] = {"index": index, "status": "deleted", "id": entry_id}
+                continue
+
+            entry._previous_state = entry._health_state
+            for field in ("domain_name", "link"):
+                if field in data:
+                    setattr(entry, field, data[field])
+            if "password" in data:
+                new_plaintexts[entry_id] = data["password"]
+            entry.version += 1
+            entry.updated_at = now
+            updated.append(entry)
+            written.append((index, "updated", entry))
+
+        failed = [result for result in results if result is not None]
+        failed = [result for result in failed if result["status"] != "deleted"]
+        if failed and request.data.get("atomic"):
+            transaction.set_rollback(True)
+            conflict = any(result["status"] == "conflict" for result in failed)
+            return Response(
+                {
+                    "applied": False,
+                    "results": [
+                        # Deletes were rolled back with everything else
+                        result
+                        if result and result["status"] != "deleted"
+                        else {"index": index, "status": "skipped"}
+                        for index, result in enumerate(results)
+                    ],
+                },
+                status=(
+                    status.HTTP_409_CONFLICT
+                    if conflict
+                    else status.HTTP_400_BAD_REQUEST
+                ),
+            )
+
+        # Encrypt every new plaintext with a single data key lookup
+        created = [Password(user=user, **data) for _, data in creates]
+        rotated = [e for e in updated if e.pk in new_plaintexts]
+        tokens = iter(
+            vault.encrypt_many(
+                user.id,
+                [new_plaintexts[e.pk] for e in rotated],
+                [e.pk for e in rotated],
+            )
+        )
+        for entry in created:
+            entry.fingerprint = vault.fingerprint(user.id, entry.password)
+            entry.strength = health.password_strength(entry.password)
+        for entry in rotated:
+            plaintext = new_plaintexts[entry.pk]
+            entry.fingerprint = vault.fingerprint(user.id, plaintext)
+            entry.strength = health.password_strength(plaintext)
+            entry.password = next(tokens)
+
+        if created:
+            Password.objects.bulk_create_encrypted(created)
+        if updated:
+            Password.objects.bulk_update(
+                updated,
+                [
+                    "domain_name",
+                    "password",
+                    "link",
+                    "fingerprint",
+                    "strength",
+                    "version",
+                    "updated_at",
+                ],
+            )
+            # bulk_update skips Password.save, so archive the replaced states here
+            history.record(updated)
+        if deleted:
+            Password.objects.filter(pk__in=[entry.pk for entry in deleted]).delete()
+
+        # Bulk writes skip Password.save/delete, so adjust the health report here
+        health.apply(
+            user.id,
+            removed=[e._previous_state for e in updated]
+            + [e._health_state for e in deleted],
+            added=[
+                health.entry_state(e.fingerprint, e.strength, e.updated_at)
+                for e in created + updated
+            ],
+        )
+
+    audit.emit(
+        audit.CREDENTIALS_CHANGED,
+        request,
+        created=[entry.pk for entry in created],
+        updated=[entry.pk for entry in updated],
+        deleted=[entry.pk for entry in deleted],
+    )
+
+    written += [(index, "created", entry) for (index, _), entry in zip(creates, created)]
+    for index, result_status, entry in written:
+        results[index] = {
+            "index": index,
+            "status": result_status,
+            "id": entry.pk,
+            "version": entry.version,
+            "updated_at": timestamp.to_representation(entry.updated_at),
+        }
+
+    return Response({"applied": True, "results": results})
+
+
+# ✅ Breach Scan API (Check every saved password against the offline breach index)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@renderer_classes(FAST_RENDERER_CLASSES)
+def breach_scan(request):
+    """Report which of the user's saved passwords appear in the breach corpus."""
+    index = breach.get_index()
+    if index is None:
+        return Response(
+            {"error": "Breach checking is not configured."},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+
+    user = request.user
+    rows = list(
+        Password.objects.filter(user=user).values_list("id", "domain_name", "password")
+    )
+    plaintexts = vault.decrypt_many(
+        user.id, [row[2] for row in rows], [row[0] for row in rows]
+    )
+
+    breached = []
+    for (entry_id, domain_name, _), password in zip(rows, plaintexts):
+        count = index.lookup(password)
+        if count:
+            breached.append(
+                {"id": entry_id, "domain_name": domain_name, "breach_count": count}
+            )
+
+    return Response({"checked": len(rows), "breached": breached})
+
+
+# ✅ Vault Health API (Reused, weak and stale password counts)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def vault_health(request):
+    """Return the incrementally maintained health report of the user's vault."""
+    return Response(health.report(request.user.id))
+
+
+# ✅ Audit Log API (The user's own security events in a time range)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@renderer_classes(FAST_RENDERER_CLASSES)
+def audit_log(request):
+    """
+    List the user's audit events between `since` and `until` (ISO 8601,
+    default: the last 30 days), newest first. Events are written in batches,
+    so the most recent few seconds may not be listed yet.
+    """
+    timestamp = DateTimeField()
+    try:
+        bounds = {
+            key: timestamp.to_internal_value(request.query_params[key])
+            for key in ("since", "until")
+            if key in request.query_params
+        }
+    except ValidationError as e:
+        return Response({"error": e.detail}, status=status.HTTP_400_BAD_REQUEST)
+
+    limit = getattr(settings, "AUDIT_LOG", {}).get("PAGE_SIZE", 500)
+    events = audit.events_for(
+        request.user.id, bounds.get("since"), bounds.get("until")
+    ).values_list("action", "created_at", "ip_address", "metadata")[:limit]
+    return Response(
+        [
+            {
+                "action": action,
+                "created_at": timestamp.to_representation(created_at),
+                "ip_address": ip_address,
+                "metadata": metadata,
+            }
+            for action, created_at, ip_address, metadata in events
+        ]
+    )
+
+
+# ✅ Bulk Provisioning API (Admins upload a CSV/JSONL file of accounts)
+@api_view(["POST"])
+@permission_classes([IsAdminUser])
+def provision_users(request):
+    """Create accounts from an uploaded file; returns a result for every row."""
+    upload = request.FILES.get("file")
+    if not upload:
+        return Response(
+            {"error": "A CSV or JSONL file is required."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    fmt = request.data.get("format") or (
+        "jsonl" if upload.name.endswith((".jsonl", ".ndjson")) else "csv"
+    )
+    try:
+        text = upload.read().decode("utf-8-sig")
+        # Threads rather than processes: PBKDF2 releases the GIL and request
+        # workers should not fork.
+        results = provisioning.provision_text(
+            text,
+            fmt,
+            workers=settings.PROVISIONING_HASH_WORKERS,
+            executor_class=ThreadPoolExecutor,
+        )
+    except (UnicodeDecodeError, ValueError) as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    counts = {key: 0 for key in ("created", "conflict", "invalid")}
+    for result in results:
+        counts[result["status"]] += 1
+    return Response({"summary": counts, "results": results})
+
+
+# ✅ Metrics API (Per-process counters, memory stats and samples for admins)
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+@renderer_classes(FAST_RENDERER_CLASSES)
+def admin_metrics(request):
+    """Return this worker process's metrics registry."""
+    return Response({"pid": os.getpid(), **metrics.snapshot()})
+
+
+# ✅ Profiles API (Request profiles captured with the X-Profile header, for admins)
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+@renderer_classes(FAST_RENDERER_CLASSES)
+def admin_profiles(request):
+    """List the stored request profiles, newest first."""
+    return Response({"profiles": profiling.recent()})
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def admin_profile(request, profile_id):
+    """Return one profile as collapsed stacks (for flamegraph.pl or speedscope)."""
+    stacks = profiling.collapsed(profile_id)
+    if stacks is None:
+        return Response({"error": "Profile not found."}, status=status.HTTP_404_NOT_FOUND)
+    response = HttpResponse(stacks, content_type="text/plain; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="{profile_id}.folded"'
+    return response
+
+
 # ✅ Fetch Password API (Allow authenticated users to fetch passwords)
 # @api_view(["GET"])
 # @permission_classes([IsAuthenticated])
@@ -200,9 +705,18 @@ def add_password(request):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@renderer_classes(FAST_RENDERER_CLASSES)
 def verify_otp(request):
     """Allow authenticated users to view or add passwords."""
     if request.method == "GET":
+        user = request.user
+
+        # A valid step-up token from an earlier verification replaces the OTP
+        if stepup.has_scope(request):
+            listing = fastpath.vault_listing(user.id, Password.objects.filter(user=user))
+            audit.emit(audit.VAULT_READ, request, via="step_up", entries=len(listing))
+            return Response(listing)
+
         otp = request.query_params.get("otp")  # Get OTP from query params
 
         if not otp:
@@ -210,21 +724,118 @@ def verify_otp(request):
                 {"error": "OTP is required"}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        # # Generate OTP
-        user = request.user
-        print("OPT", otp, user.otp_generated)
-        totp = pyotp.TOTP(user.otp_secret)  # Use the user's OTP secret
-
         # Now verify OTP entered by the user
         if str(user.otp_generated) != str(otp):
+            audit.emit(audit.OTP_FAILED, request)
             return Response(
                 {"error": "Invalid OTP"}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Fetch passwords if OTP is valid
-        passwords = Password.objects.filter(user=request.user)
-        serializer = PasswordSerializer(passwords, many=True)
-        return Response(serializer.data)
+        # Fetch passwords if OTP is valid, decrypting them in one pass, and
+        # hand out a step-up token so further reads skip verification
+        listing = fastpath.vault_listing(user.id, Password.objects.filter(user=user))
+        audit.emit(audit.VAULT_READ, request, via="otp", entries=len(listing))
+        return stepup.attach(Response(listing), stepup.issue(request))
+
+
+# ✅ Vault API (List passwords with a step-up token from OTP or Face ID)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated, stepup.HasVaultStepUp])
+@renderer_classes(FAST_RENDERER_CLASSES)
+def list_passwords(request):
+    """List the user's passwords; requires a step-up token."""
+    user = request.user
+    listing = fastpath.vault_listing(user.id, Password.objects.filter(user=user))
+    audit.emit(audit.VAULT_READ, request, via="step_up", entries=len(listing))
+    return Response(listing)
+
+
+# ✅ Password History API (List and restore earlier versions of an entry)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated, stepup.HasVaultStepUp])
+@renderer_classes(FAST_RENDERER_CLASSES)
+def password_history(request, entry_id):
+    """List earlier versions of one entry, newest first; requires a step-up token."""
+    user = request.user
+    entry = Password.objects.filter(user=user, pk=entry_id).first()
+    if entry is None:
+        return Response({"error": "Entry not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    versions = entry.versions.order_by("-version")
+    limit = history.history_settings()["MAX_VERSIONS"]
+    versions = list(versions[:limit] if limit else versions)
+    states = history.resolve(entry, versions)
+    plaintexts = vault.decrypt_many(
+        user.id, [state["password"] for state in states], [entry.pk] * len(states)
+    )
+    timestamp = DateTimeField()
+    audit.emit(audit.VAULT_READ, request, via="history", entries=len(states))
+    return Response(
+        {
+            "id": entry.pk,
+            "version": entry.version,
+            "versions": [
+                {
+                    "version": state["version"],
+                    "domain_name": state["domain_name"],
+                    "password": plaintext,
+                    "link": state["link"],
+                    "strength": state["strength"],
+                    "updated_at": timestamp.to_representation(state["updated_at"]),
+                    "archived_at": timestamp.to_representation(state["archived_at"]),
+                }
+                for state, plaintext in zip(states, plaintexts)
+            ],
+        }
+    )
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated, stepup.HasVaultStepUp])
+def restore_password_version(request, entry_id, version):
+    """
+    Make an earlier version the entry's current state. The state it replaces
+    is archived like any other update. An optional `version` in the body must
+    match the entry's current version.
+    """
+    expected = request.data.get("version")
+    with transaction.atomic():
+        entry = (
+            Password.objects.select_for_update()
+            .filter(user=request.user, pk=entry_id)
+            .first()
+        )
+        if entry is None:
+            return Response(
+                {"error": "Entry not found."}, status=status.HTTP_404_NOT_FOUND
+            )
+        if expected is not None and expected != entry.version:
+            return Response(
+                {"error": "Entry was changed.", "current": {"version": entry.version}},
+                status=status.HTTP_409_CONFLICT,
+            )
+        # Only versions from the requested one onwards are needed to resolve it
+        versions = list(entry.versions.filter(version__gte=version).order_by("-version"))
+        if not versions or versions[-1].version != version:
+            return Response(
+                {"error": "Version not found."}, status=status.HTTP_404_NOT_FOUND
+            )
+        state = history.resolve(entry, versions)[-1]
+        for field in history.SECRET_FIELDS + history.PLAIN_FIELDS:
+            setattr(entry, field, state[field])
+        entry.save()
+
+    audit.emit(
+        audit.CREDENTIAL_RESTORED, request, entry_id=entry.pk, restored_version=version
+    )
+    return Response(
+        {
+            "id": entry.pk,
+            "version": entry.version,
+            "updated_at": DateTimeField().to_representation(entry.updated_at),
+            "restored_version": version,
+        }
+    )
 
 
 # totp = pyotp.TOTP(user.otp_secret, interval=30)
@@ -232,6 +843,7 @@ def verify_otp(request):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@idempotent
 def send_otp_email(request):
     try:
         user = request.user  # Get the logged-in user
@@ -257,6 +869,7 @@ def send_otp_email(request):
             [user.email],  # Recipient's email
             fail_silently=False,
         )
+        audit.emit(audit.OTP_SENT, request)
 
         return Response(
             {
@@ -295,199 +908,289 @@ def send_otp_email(request):
 
 class ImageUploadView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = ADMISSION_THROTTLES
+    throttle_scope = "image_upload"
 
+    @idempotent
     def post(self, request, *args, **kwargs):
         # Ensure the request includes the image file
-        user = request.user
-        print(f"Processing image upload for user: {user.username}")
-
         if "image" not in request.FILES:
             return Response(
                 {"error": "No image provided."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+        # ?async=1 stores the upload and processes it in the background
+        if request.query_params.get("async") in ("1", "true"):
+            return self.enqueue(request)
+        return self.process(request)
+
+    def enqueue(self, request):
+        job = enrollment.create_job(request.user, request.FILES["image"])
+        status_url = reverse("enrollment_job", kwargs={"job_id": job.pk})
+        response = Response(
+            {
+                "message": "Face image accepted for processing.",
+                "job_id": str(job.pk),
+                "status": job.status,
+                "status_url": status_url,
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
+        response["Location"] = status_url
+        return response
+
+    @face_processing_slot
+    def process(self, request):
+        user = request.user
         file = request.FILES["image"]
+        print(f"Processing image upload for user: {user.username}")
         print(f"Received image file: {file.name}, size: {file.size} bytes")
 
-        # Validate that the uploaded file contains a clear face
         try:
-            # Load the image and detect faces
-            image = face_recognition.load_image_file(file)
-            face_locations = face_recognition.face_locations(image)
-            
-            print(f"Face locations detected: {face_locations}")
-            
-            # Check if any face was detected
-            if not face_locations:
-                return Response(
-                    {"error": "No face detected in the uploaded image. Please provide a clear image of your face."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            
-            # Check if multiple faces were detected
-            if len(face_locations) > 1:
-                return Response(
-                    {"error": f"Multiple faces ({len(face_locations)}) detected in the image. Please provide an image with only your face."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            
-            # Try to generate a face encoding to ensure the face is clear enough
-            face_encodings = face_recognition.face_encodings(image, face_locations)
-            if not face_encodings:
-                return Response(
-                    {"error": "Could not generate face encoding. Please provide a clearer image of your face."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-                
-            print("Face validation successful")
-            
-            # Reset file pointer for saving
-            file.seek(0)
-            
-            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-            filename = f"{timestamp}_{file.name}"
+            image_instance = enrollment.enroll(user, file)
+        except enrollment.EnrollmentError as e:
+            print(f"Face enrollment failed: {e.message}")
+            return Response({"error": e.message}, status=e.status_code)
 
-            # Create an image instance and save the image file
-            try:
-                # Delete previous face image if it exists
-                try:
-                    previous_image = Image.objects.get(user=user)
-                    previous_image.delete()
-                    print(f"Deleted previous face image for user: {user.username}")
-                except Image.DoesNotExist:
-                    pass
+        print(f"New face image saved successfully at: {image_instance.image}")
+        return Response(
+            {
+                "message": "Face image uploaded successfully!",
+                "image_url": str(image_instance.image),
+            },
+            status=status.HTTP_201_CREATED,
+        )
 
-                image_instance = Image(image=file, user=user)
-                image_instance.save()  # This will automatically save the image to the server and populate image_url
-                print(f"New face image saved successfully at: {image_instance.image}")
 
-                # Return the image URL in the response
-                return Response(
-                    {
-                        "message": "Face image uploaded successfully!",
-                        "image_url": str(image_instance.image),
-                    },
-                    status=status.HTTP_201_CREATED,
-                )
-            except Exception as e:
-                print(f"Error saving image: {str(e)}")
-                return Response(
-                    {"error": f"Error saving image: {str(e)}"},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                )
-        except Exception as e:
-            print(f"Error processing image: {str(e)}")
+class EnrollmentJobView(APIView):
+    """Status of an asynchronous enrollment; `?wait=N` long-polls up to N seconds."""
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id, *args, **kwargs):
+        try:
+            wait = max(float(request.query_params.get("wait", 0)), 0)
+        except ValueError:
             return Response(
-                {"error": f"Error processing image: {str(e)}"},
+                {"error": "wait must be a number of seconds."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+        job = enrollment.wait_for(job_id, request.user.id, wait)
+        if job is None:
+            return Response(
+                {"error": "Enrollment job not found."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        data = {
+            "job_id": str(job.pk),
+            "status": job.status,
+            "error": job.error or None,
+            "created_at": job.created_at,
+            "finished_at": job.finished_at,
+        }
+        if job.image_name:
+            data["image_url"] = job.image_name
+        return Response(data)
+
 
 class ImageListView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
         user = request.user
-        image = Image.objects.get(user=user)
+        image = Image.objects.filter(user=user).order_by("-uploaded_at").first()
         if not image:
-            return Response({"status": False, status: 404})
+            return Response({"status": False}, status=status.HTTP_404_NOT_FOUND)
         serializer = ImageSerializer(image)
         return Response(serializer.data)
 
 
+class MediaView(APIView):
+    """Serve a face image to its owner with validators, ranges and sendfile."""
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, path, *args, **kwargs):
+        if not Image.objects.filter(user=request.user, image=path).exists():
+            return Response(
+                {"error": "Media file not found."}, status=status.HTTP_404_NOT_FOUND
+            )
+        return media.serve(request, path)
+
+
 class VerifyFaceId(APIView):
+    """
+    Verify the user's face against their enrolled face ID. Clients may send a
+    short burst of frames as repeated `image` parts; the sharpest frames are
+    tried first and verification stops at the first match.
+    """
+
     permission_classes = [IsAuthenticated]
+    throttle_classes = ADMISSION_THROTTLES
+    throttle_scope = "verify_face_id"
 
+    @face_processing_slot
     def post(self, request, *args, **kwargs):
         try:
             user = request.user
 
-            if "image" not in request.FILES:
+            uploads = request.FILES.getlist("image")
+            if not uploads:
                 return Response(
                     {"error": "No image provided."},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            uploaded_image = request.FILES["image"]
+            burst = getattr(settings, "FACE_BURST", {})
+            max_frames = burst.get("MAX_FRAMES", 5)
+            if len(uploads) > max_frames:
+                return Response(
+                    {"error": f"At most {max_frames} frames may be sent at once."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
 
             # Get faceId from DB
-            try:
-                image = Image.objects.get(user=user)
-            except Image.DoesNotExist:
+            image = Image.objects.filter(user=user).order_by("-uploaded_at").first()
+            if image is None:
                 return Response(
                     {"error": "No face ID found for this user. Please set up Face ID first."},
                     status=status.HTTP_404_NOT_FOUND,
                 )
 
-            # Process uploaded image
-            try:
-                image1 = face_recognition.load_image_file(uploaded_image)
-                face_locations1 = face_recognition.face_locations(image1)
-                
-                print(f"Uploaded image face locations: {face_locations1}")
-                
-                if not face_locations1:
+            # Identical frames resent within FACE_PROBE_CACHE["TTL"] (client
+            # retries) get the earlier decision without running dlib again
+            probe_digest = probes.digest(uploads)
+            match = probes.lookup(user.pk, image.pk, probe_digest)
+            cached = match is not None
+            hashes = []
+            if match is None:
+                # Decode uploaded frames
+                try:
+                    frames = [
+                        face_recognition.load_image_file(upload) for upload in uploads
+                    ]
+                except Exception as e:
+                    print(f"Error processing uploaded image: {str(e)}")
                     return Response(
-                        {"error": "No face detected in the uploaded image."},
+                        {"error": f"Error processing uploaded image: {str(e)}"},
                         status=status.HTTP_400_BAD_REQUEST,
                     )
+                hashes = [faces.perceptual_hash(frame) for frame in frames]
+
+                # Use the stored encoding of the saved faceId image; images enrolled
+                # before encodings were stored are processed from the file
+                # (run `manage.py backfill_face_data` to fill them in)
+                if image.encoding:
+                    face_encoding2 = faces.encoding_from_bytes(image.encoding)
+                else:
+                    try:
+                        user_saved_image_path = self.get_image_path(str(image.image))
+                        print(f"Attempting to load saved image from: {user_saved_image_path}")
                 
-                if len(face_locations1) > 1:
-                    print(f"WARNING: Multiple faces ({len(face_locations1)}) detected in uploaded image")
-                    return Response(
-                        {"error": f"Multiple faces ({len(face_locations1)}) detected in the uploaded image. Please ensure only your face is visible."},
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
+                        image2 = face_recognition.load_image_file(user_saved_image_path)
+                        face_locations2 = face_recognition.face_locations(image2)
                 
-                face_encoding1 = face_recognition.face_encodings(image1, face_locations1)[0]
-                print(f"Uploaded face encoding generated successfully")
-            except Exception as e:
-                print(f"Error processing uploaded image: {str(e)}")
-                return Response(
-                    {"error": f"Error processing uploaded image: {str(e)}"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            # Process saved faceId image
-            try:
-                user_saved_image_path = self.get_image_path(str(image.image))
-                print(f"Attempting to load saved image from: {user_saved_image_path}")
-                
-                image2 = face_recognition.load_image_file(user_saved_image_path)
-                face_locations2 = face_recognition.face_locations(image2)
-                
-                print(f"Saved image face locations: {face_locations2}")
+                        print(f"Saved image face locations: {face_locations2}")
                 
-                if not face_locations2:
-                    return Response(
-                        {"error": "No face detected in the saved face ID image."},
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
+                        if not face_locations2:
+                            return Response(
+                                {"error": "No face detected in the saved face ID image."},
+                                status=status.HTTP_400_BAD_REQUEST,
+                            )
                 
-                if len(face_locations2) > 1:
-                    print(f"WARNING: Multiple faces ({len(face_locations2)}) detected in saved image")
+                        if len(face_locations2) > 1:
+                            print(f"WARNING: Multiple faces ({len(face_locations2)}) detected in saved image")
                 
-                face_encoding2 = face_recognition.face_encodings(image2, face_locations2)[0]
-                print(f"Saved face encoding generated successfully")
-            except Exception as e:
+                        face_encoding2 = face_recognition.face_encodings(image2, face_locations2)[0]
+                        print(f"Saved face encoding generated successfully")
+                    except Exception as e:
+                        return Response(
+                            {"error": f"Error processing saved face ID image: {str(e)}"},
+                            status=status.HTTP_400_BAD_REQUEST,
+                        )
+
+                # Compare faces
+                # Lower tolerance value makes the comparison more strict (default is 0.6);
+                # calibrate it with `manage.py calibrate_face_tolerance`
+                tolerance = settings.FACE_MATCH_TOLERANCE
+                match = faces.match_burst(
+                    frames,
+                    face_encoding2,
+                    tolerance,
+                    max_candidates=burst.get("MAX_CANDIDATES", 3),
+                    workers=burst.get("WORKERS", 2),
+                )
+                logger.debug(
+                    "Face match: %s, tolerance %s, %d frames", match, tolerance, len(frames)
+                )
+
+                probes.store(user.pk, image.pk, probe_digest, match)
+
+            if match["error"]:
                 return Response(
-                    {"error": f"Error processing saved face ID image: {str(e)}"},
-                    status=status.HTTP_400_BAD_REQUEST,
+                    {"error": match["error"]}, status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Compare faces
-            # Lower tolerance value makes the comparison more strict (default is 0.6)
-            tolerance = 0.4  # Making this stricter
-            results = face_recognition.compare_faces([face_encoding1], face_encoding2, tolerance=tolerance)
-            
-            # Also calculate the distance - lower means more similar
-            face_distance = face_recognition.face_distance([face_encoding1], face_encoding2)[0]
-            print(f"Face distance: {face_distance}, Tolerance: {tolerance}")
+            # An accepted probe that repeats an earlier accepted frame exactly
+            # or nearly (re-encoded, resized) may be a replayed capture
+            replay = None
+            if match["matched"]:
+                if cached:
+                    replay = {"reason": probes.EXACT, "bits": 0}
+                else:
+                    bits = probes.closest_accepted(user.pk, hashes)
+                    if bits is not None:
+                        replay = {"reason": probes.NEAR_DUPLICATE, "bits": bits}
+                    probes.remember_accepted(user.pk, hashes)
+            if replay is not None:
+                audit.emit(audit.FACE_REPLAY_SUSPECTED, request, **replay)
+                if probes.flag_replay(replay["reason"]):
+                    audit.emit(
+                        audit.FACE_FAILED,
+                        request,
+                        distance=round(match["distance"], 4),
+                        frames=len(uploads),
+                        tried=match["tried"],
+                        cached=cached,
+                        replay=replay["reason"],
+                    )
+                    return Response(
+                        {"status": False, "error": "Face ID verification failed. Please capture a new image."},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
 
-            if results[0]:
-                return Response({"status": True, "message": "Face ID verified successfully!"})
+            face_distance = match["distance"]
+            if match["matched"]:
+                audit.emit(
+                    audit.FACE_VERIFIED,
+                    request,
+                    distance=round(face_distance, 4),
+                    frames=len(uploads),
+                    tried=match["tried"],
+                    cached=cached,
+                )
+                token = stepup.issue(request)
+                response = Response(
+                    {
+                        "status": True,
+                        "message": "Face ID verified successfully!",
+                        "step_up_token": token,
+                        "step_up_expires_in": stepup.lifetime(),
+                    }
+                )
+                return stepup.attach(response, token)
             else:
+                audit.emit(
+                    audit.FACE_FAILED,
+                    request,
+                    distance=round(face_distance, 4),
+                    frames=len(uploads),
+                    tried=match["tried"],
+                    cached=cached,
+                )
                 return Response(
                     {"status": False, "error": f"Face ID verification failed. The faces do not match (similarity distance: {face_distance:.4f})."},
                     status=status.HTTP_400_BAD_REQUEST,
@@ -501,9 +1204,7 @@ class VerifyFaceId(APIView):
 
     def get_image_path(self, image_path):
         try:
-            BASE_DIR = Path(__file__).resolve().parent.parent
-            media_root = os.path.join(BASE_DIR, "media")
-            full_image_path = os.path.join(media_root, image_path)
+            full_image_path = os.path.join(settings.MEDIA_ROOT, image_path)
             
             if not os.path.exists(full_image_path):
                 raise FileNotFoundError(f"Face ID image not found at path: {full_image_path}")
@@ -25,22 +25,20 @@ export default function DashboardPage() {
   const token = localStorage.getItem("access_token");
 
   useEffect(() => {
-    const checkIfFaceIdExists = async () => {
-      try {
-        const response = await fetch("http://127.0.0.1:8000/api/users/image/", {
-          method: "GET",
-          headers: {
-            Authorization: `Bearer ${token}`,
-            "Content-Type": "application/json",
-          },
-        });
-        // If the face image exists, the backend should return 200
-        if (response.status === 200) {
-          setFaceIdExists(true);
-        }
-      } catch (error) {
-        console.error("⚠️ Error fetching face ID status:", error);
-      }
+    // Profile, face ID status and vault summary in one request
+    const fetchBootstrap = (accessToken: string) =>
+      fetch("http://127.0.0.1:8000/api/users/bootstrap/", {
+        method: "GET",
+        headers: {
+          Authorization: `Bearer ${accessToken}`,
+          "Content-Type": "application/json",
+        },
+      });
+
+    const applyBootstrap = async (response: Response) => {
+      const data = await response.json();
+      setUsername(data.user.username);
+      setFaceIdExists(data.face_id.enrolled);
     };
 
     const fetchUserDetails = async () => {
@@ -53,17 +51,10 @@ export default function DashboardPage() {
       }
 
       try {
-        const response = await fetch("http://127.0.0.1:8000/api/users/me/", {
-          method: "GET",
-          headers: {
-            Authorization: `Bearer ${token}`,
-            "Content-Type": "application/json",
-          },
-        });
+        const response = await fetchBootstrap(token);
 
         if (response.ok) {
-          const data = await response.json();
-          setUsername(data.username);
+          await applyBootstrap(response);
         } else if (response.status === 401 && refreshToken) {
           // Attempt to refresh token
           const refreshResponse = await fetch(
@@ -82,21 +73,11 @@ export default function DashboardPage() {
             localStorage.setItem("access_token", access);
             localStorage.setItem("refresh_token", refresh);
 
-            // Retry fetching user data with the new access token
-            const retryResponse = await fetch(
-              "http://127.0.0.1:8000/api/users/me/",
-              {
-                method: "GET",
-                headers: {
-                  Authorization: `Bearer ${access}`,
-                  "Content-Type": "application/json",
-                },
-              }
-            );
+            // Retry with the new access token
+            const retryResponse = await fetchBootstrap(access);
 
             if (retryResponse.ok) {
-              const data = await retryResponse.json();
-              setUsername(data.username);
+              await applyBootstrap(retryResponse);
             } else {
               setUsername("Guest");
             }
@@ -130,7 +111,6 @@ export default function DashboardPage() {
 
     loadModels();
     fetchUserDetails();
-    checkIfFaceIdExists();
   }, []);
 
   // Start the camera and begin face detection
@@ -317,7 +297,24 @@ export default function DashboardPage() {
   };
 
   // Handle Sign Out
-  const handleLogout = () => {
+  const handleLogout = async () => {
+    const token = localStorage.getItem("access_token");
+    const refreshToken = localStorage.getItem("refresh_token");
+    if (token) {
+      // Revoke the session server-side; sign out locally even if this fails
+      try {
+        await fetch("http://127.0.0.1:8000/api/users/logout/", {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+            Authorization: `Bearer ${token}`,
+          },
+          body: JSON.stringify(refreshToken ? { refresh: refreshToken } : {}),
+        });
+      } catch (error) {
+        console.error("⚠️ Error revoking session:", error);
+      }
+    }
     localStorage.removeItem("access_token");
     localStorage.removeItem("refresh_token");
     setIsAuthenticated(false);
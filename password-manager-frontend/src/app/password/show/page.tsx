@@ -6,6 +6,10 @@ import { useState, useRef, useEffect } from "react";
 import toast from "react-hot-toast";
 import * as faceapi from "face-api.js";
 
+// Burst capture for Face ID verification
+const BURST_EXTRA_FRAMES = 2;
+const BURST_INTERVAL_MS = 120;
+
 interface PasswordEntry {
   domain_name: string;
   link: string;
@@ -34,6 +38,8 @@ export default function ShowPasswordPage() {
   // Camera references
   const videoRef = useRef<HTMLVideoElement | null>(null);
   const canvasRef = useRef<HTMLCanvasElement | null>(null);
+  // Extra frames sent with the captured one; the server tries the sharpest first
+  const burstFramesRef = useRef<Blob[]>([]);
 
   // Load face detection models
   useEffect(() => {
@@ -181,6 +187,25 @@ export default function ShowPasswordPage() {
     const faceCtx = faceCanvas.getContext("2d");
 
     if (faceCtx) {
+      // Grab a short burst of the same crop so one blurry frame doesn't
+      // cost another round-trip
+      const grabFrame = () =>
+        new Promise<Blob | null>((resolve) => {
+          faceCtx.drawImage(
+            video,
+            newX, newY, newWidth, newHeight, // Crop area from the video
+            0, 0, newWidth, newHeight // Draw onto temporary canvas
+          );
+          faceCanvas.toBlob(resolve, "image/png", 0.95);
+        });
+      const burst: Blob[] = [];
+      for (let i = 0; i < BURST_EXTRA_FRAMES; i++) {
+        const frame = await grabFrame();
+        if (frame) burst.push(frame);
+        await new Promise((resolve) => setTimeout(resolve, BURST_INTERVAL_MS));
+      }
+      burstFramesRef.current = burst;
+
       // Draw the video frame to the canvas with the calculated dimensions
       faceCtx.drawImage(
         video,
@@ -319,6 +344,9 @@ export default function ShowPasswordPage() {
       
       const imageBlob = await responseBlob.blob();
       formData.append("image", imageBlob, "face.png");
+      burstFramesRef.current.forEach((frame, i) =>
+        formData.append("image", frame, `face-${i + 1}.png`)
+      );
 
       const response = await fetch(
         "http://127.0.0.1:8000/api/users/verify-face-id/",
@@ -377,6 +405,7 @@ export default function ShowPasswordPage() {
     setFaceIdVerified(false);
     setFaceCaptured(false);
     setImageData(null);
+    burstFramesRef.current = [];
     setFaceDetected(false);
     setIsFaceVerified(false);
     setIsVerifyingFace(false);